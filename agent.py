@@ -2,106 +2,437 @@
 SQL Agent for querying the World Bank database
 """
 from langchain.chat_models import ChatOpenAI
-from langchain.agents import create_sql_agent, AgentType
+from langchain.agents import AgentExecutor
+from langchain.agents.openai_functions_agent.base import OpenAIFunctionsAgent
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
-from langchain.sql_database import SQLDatabase
 from langchain.callbacks import get_openai_callback
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.prompts.chat import (
+    ChatPromptTemplate,
+    HumanMessagePromptTemplate,
+    MessagesPlaceholder,
+    SystemMessagePromptTemplate,
+)
+import json
+import logging
 import openai
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from config import Config
+from database import CachedSQLDatabase
+from llm_scheduler import estimate_tokens, scheduler
+from metrics import metrics, token_cost
+from schema_catalog import load_schema_catalog
+from sql_validator import SQLValidator
 from prompts import (
-    AGENT_INSTRUCTION_PROMPT, 
-    get_sql_agent_prefix, 
+    FEW_SHOTS_PROMPT,
     SQL_AGENT_SUFFIX,
+    get_sql_agent_prefix,
     get_summary_prompt
 )
 
 
+logger = logging.getLogger(__name__)
+
+
+class ToolSpanHandler(BaseCallbackHandler):
+    """Times each tool call of the agent as a metrics span"""
+    
+    def __init__(self):
+        self._spans = {}
+    
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        tool = (serialized or {}).get('name', 'unknown')
+        metrics.inc('tool_calls_total', tool=tool)
+        span = metrics.span(f"tool_{tool}")
+        span.__enter__()
+        self._spans[run_id] = span
+    
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.__exit__(None, None, None)
+    
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.__exit__(type(error), error, None)
+
+
+class UsageHandler(BaseCallbackHandler):
+    """Counts the model calls and failed tool calls of a query, and the prompt tokens served from cache"""
+    
+    def __init__(self):
+        self.llm_calls = 0
+        self.tool_errors = 0
+        self.cached_tokens = 0
+    
+    def on_llm_end(self, response, **kwargs):
+        self.llm_calls += 1
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        details = usage.get('prompt_tokens_details') or {}
+        self.cached_tokens += details.get('cached_tokens') or 0
+    
+    def on_tool_end(self, output, **kwargs):
+        if str(output).startswith("Error:"):
+            self.tool_errors += 1
+
+
+class ResultRowsHandler(BaseCallbackHandler):
+    """Keeps the rows each SQL statement of the agent returned, so they are not fetched again"""
+    
+    def __init__(self, db: CachedSQLDatabase):
+        """
+        Initialize the handler
+        
+        Args:
+            db: Database the agent queries
+        """
+        self.db = db
+        self.rows = {}
+        self._pending_query = None
+    
+    def on_agent_action(self, action, **kwargs):
+        if action.tool != 'sql_db_query':
+            return
+        tool_input = action.tool_input
+        self._pending_query = tool_input.get('query') if isinstance(tool_input, dict) else tool_input
+    
+    def on_tool_end(self, output, **kwargs):
+        query, self._pending_query = self._pending_query, None
+        # The tool ran the statement in this thread just before
+        rows = self.db.last_rows() if query is not None else None
+        if rows is not None:
+            self.rows[query] = rows
+
+
+class QueryEventHandler(BaseCallbackHandler):
+    """Forwards each SQL statement the agent runs, and its row count, to an event callback"""
+    
+    # Let a failing sink (e.g. a closed client connection) stop the agent
+    raise_error = True
+    
+    def __init__(self, db: CachedSQLDatabase, on_event: Callable[[str, Dict], None]):
+        """
+        Initialize the handler
+        
+        Args:
+            db: Database the agent queries, which reports the rows each statement returned
+            on_event: Callback receiving (event name, event data)
+        """
+        self.db = db
+        self.on_event = on_event
+        self._pending_query = None
+    
+    def on_agent_action(self, action, **kwargs):
+        if action.tool != 'sql_db_query':
+            return
+        tool_input = action.tool_input
+        self._pending_query = tool_input.get('query') if isinstance(tool_input, dict) else tool_input
+        self.on_event('sql', {'query': self._pending_query})
+    
+    def on_tool_end(self, output, **kwargs):
+        query, self._pending_query = self._pending_query, None
+        if query is None:
+            return
+        if str(output).startswith("Error:"):
+            self.on_event('sql_error', {'query': query, 'error': str(output)})
+            return
+        # The tool ran the statement in this thread just before
+        self.on_event('rows', {'query': query, 'row_count': self.db.last_row_count()})
+
+
+class ScheduledChatModel(BaseChatModel):
+    """
+    Sends every call of a chat model through the shared LLM scheduler
+    
+    The agent calls the model once per step, so each step waits for the
+    model's rate limits and is retried on its own after a rate-limit error
+    instead of the whole agent run starting over.
+    """
+    
+    llm: BaseChatModel
+    model_name: str
+    
+    @property
+    def _llm_type(self) -> str:
+        return self.llm._llm_type
+    
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        functions = json.dumps(kwargs.get('functions') or [], default=str)
+        return scheduler.call(
+            self.model_name,
+            lambda: self.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs),
+            tokens=estimate_tokens(prompt + functions),
+        )
+
+
 class WorldBankAgent:
     """Agent for querying World Bank database using natural language"""
     
-    def __init__(self, db_url: str = None, api_key: str = None):
+    def __init__(self, db_url: str = None, api_key: str = None,
+                 llm: BaseChatModel = None, summary_client=None):
         """
         Initialize the World Bank agent
         
         Args:
             db_url: Database connection URL
             api_key: OpenAI API key
+            llm: Chat model driving the SQL agent, defaults to ChatOpenAI
+            summary_client: Client with an OpenAI-style chat.completions.create()
+                used for the summary, defaults to an OpenAI client
+        
+        Retries are left to the LLM scheduler, so the default clients do
+        not retry on their own.
         """
         self.db_url = db_url or Config.SQLALCHEMY_DATABASE_URL
         self.api_key = api_key or Config.OPENAI_API_KEY
         
-        # Set OpenAI API key
-        openai.api_key = self.api_key
+        self.summary_client = summary_client or openai.OpenAI(api_key=self.api_key, max_retries=0)
         
         # Initialize database and LLM
-        self.db = SQLDatabase.from_uri(self.db_url)
-        self.llm = ChatOpenAI(
+        self.db = CachedSQLDatabase.from_uri(self.db_url)
+        self.llm = llm or ChatOpenAI(
             model_name=Config.CHAT_MODEL,
             temperature=Config.TEMPERATURE,
-            api_key=self.api_key
+            api_key=self.api_key,
+            max_retries=0
         )
-        self.toolkit = SQLDatabaseToolkit(db=self.db, llm=self.llm)
-        self.agent_executor = None
-        
-    def create_agent(self, few_shots: str):
+        self.scheduled_llm = ScheduledChatModel(
+            llm=self.llm, model_name=getattr(self.llm, 'model_name', None) or Config.CHAT_MODEL
+        )
+        self.schema_catalog = load_schema_catalog(self.db)
+        if Config.SQL_VALIDATION_ENABLED:
+            self.db.validator = SQLValidator(self.db, self.schema_catalog)
+        self.toolkit = SQLDatabaseToolkit(db=self.db, llm=self.scheduled_llm)
+        self.agent_executor = self.create_agent()
+    
+    def create_agent(self) -> AgentExecutor:
         """
-        Create SQL agent with few-shot examples
+        Create the SQL agent executor
         
-        Args:
-            few_shots: Formatted few-shot examples
+        Few-shot examples and indicator hints are prompt variables supplied
+        on every call, so one executor is built per agent and can be shared
+        by concurrent queries. The instructions and the column catalog form
+        a system message that is identical for every query and comes first,
+        so the provider's prompt cache can serve it; the per-query parts
+        follow it.
+        
+        Returns:
+            The created agent executor
         """
-        sql_prefix = get_sql_agent_prefix(few_shots)
+        tools = self.toolkit.get_tools()
+        if self.db.validator is not None:
+            # Queries are checked locally before they run; the model-based
+            # checker would only add a round trip per query
+            tools = [tool for tool in tools if tool.name != 'sql_db_query_checker']
+        prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=get_sql_agent_prefix(self.schema_catalog)),
+            SystemMessagePromptTemplate.from_template(FEW_SHOTS_PROMPT),
+            HumanMessagePromptTemplate.from_template("{input}{indicator_hints}"),
+            AIMessage(content=SQL_AGENT_SUFFIX),
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ])
+        agent = OpenAIFunctionsAgent(llm=self.scheduled_llm, tools=tools, prompt=prompt)
         
-        self.agent_executor = create_sql_agent(
-            llm=self.llm,
-            toolkit=self.toolkit,
+        return AgentExecutor.from_agent_and_tools(
+            agent=agent,
+            tools=tools,
             verbose=True,
-            agent_type=AgentType.OPENAI_FUNCTIONS,
-            prefix=sql_prefix,
-            suffix=SQL_AGENT_SUFFIX
+            max_iterations=15,
+            early_stopping_method="force",
+            return_intermediate_steps=True
         )
     
-    def query_with_tokens(self, query: str) -> str:
+    @staticmethod
+    def _successful_sql_queries(intermediate_steps: List[Tuple]) -> List[str]:
         """
-        Execute query and track token usage
+        Collect the SQL statements the agent ran without an error
+        
+        Args:
+            intermediate_steps: (action, observation) pairs from the executor
+        
+        Returns:
+            List of SQL statements in execution order
+        """
+        queries = []
+        for action, observation in intermediate_steps:
+            if getattr(action, 'tool', None) != 'sql_db_query':
+                continue
+            tool_input = action.tool_input
+            query = tool_input.get('query') if isinstance(tool_input, dict) else tool_input
+            if query and not str(observation).startswith("Error:"):
+                queries.append(query)
+        return queries
+    
+    def run_query(self, query: str, few_shots: str = "", indicator_hints: str = "",
+                  on_event: Callable[[str, Dict], None] = None) -> Dict:
+        """
+        Execute query and return the response together with its token usage
+        
+        Every model call waits for the chat model's rate limits in the LLM
+        scheduler, which also retries it after a rate-limit error.
         
         Args:
             query: User query string
-            
+            few_shots: Formatted few-shot examples
+            indicator_hints: Candidate indicator hint appended to the query
+            on_event: Callback receiving 'sql', 'rows' and 'sql_error' events
+                as the agent runs its SQL statements
+        
         Returns:
-            Agent response or error message
+            Dictionary with the agent 'response', the SQL statements that ran
+            successfully under 'sql_queries', the rows they fetched under
+            'rows' (statement to rows, for those not served from the result
+            cache), token usage under 'tokens', the
+            number of model calls under 'iterations', the failed tool calls
+            under 'tool_errors' and the error message under 'error' if the
+            query failed
         """
-        if not self.agent_executor:
-            raise ValueError("Agent not created. Call create_agent() first.")
+        inputs = {
+            'input': "User query: " + query,
+            'few_shots': few_shots,
+            'indicator_hints': indicator_hints,
+        }
         
-        full_query = AGENT_INSTRUCTION_PROMPT + "\nUser query: " + query
+        usage_handler = UsageHandler()
+        rows_handler = ResultRowsHandler(self.db)
+        callbacks = [usage_handler, rows_handler]
+        if metrics.enabled:
+            callbacks.append(ToolSpanHandler())
+        if on_event is not None:
+            callbacks.append(QueryEventHandler(self.db, on_event))
+        config = {'callbacks': callbacks}
         
         with get_openai_callback() as cb:
             try:
-                result = self.agent_executor.run(full_query)
-                print(f"Token usage: {cb}")
-                return result
+                output = self.agent_executor.invoke(inputs, config=config)
+                result = output['output']
+                sql_queries = self._successful_sql_queries(output.get('intermediate_steps', []))
+                error = None
             except Exception as e:
-                print(f"Error during query execution: {e}")
-                return "I don't have sufficient resource to process your query!"
+                logger.error(f"Error during query execution: {e}")
+                result = "I don't have sufficient resource to process your query!"
+                sql_queries = []
+                error = str(e)
+            
+            return {
+                'response': result,
+                'sql_queries': sql_queries,
+                'rows': rows_handler.rows,
+                'error': error,
+                'iterations': usage_handler.llm_calls,
+                'tool_errors': usage_handler.tool_errors,
+                'tokens': {
+                    'model': Config.CHAT_MODEL,
+                    'prompt_tokens': cb.prompt_tokens,
+                    'cached_tokens': usage_handler.cached_tokens,
+                    'completion_tokens': cb.completion_tokens,
+                    'total_tokens': cb.total_tokens,
+                    # The pinned LangChain release has no prices for newer models
+                    'total_cost': cb.total_cost or token_cost(
+                        Config.CHAT_MODEL, cb.prompt_tokens, cb.completion_tokens,
+                        usage_handler.cached_tokens
+                    ),
+                },
+            }
     
-    def generate_summary(self, user_query: str, response: str) -> str:
+    def query_with_tokens(self, query: str, few_shots: str = "", indicator_hints: str = "") -> str:
         """
-        Generate a summary of the query response
+        Execute query and track token usage
+        
+        Args:
+            query: User query string
+            few_shots: Formatted few-shot examples
+            indicator_hints: Candidate indicator hint appended to the query
+        
+        Returns:
+            Agent response or error message
+        """
+        return self.run_query(query, few_shots, indicator_hints)['response']
+    
+    def summarize(self, user_query: str, response: str,
+                  on_token: Callable[[str], None] = None) -> Dict:
+        """
+        Generate a summary of the query response together with its token usage
         
         Args:
             user_query: Original user query
             response: Agent response
-            
+            on_token: Callback receiving each piece of the summary as the
+                model produces it; the summary is not streamed if None
+        
         Returns:
-            Summary text
+            Dictionary with the 'summary' text and token usage under 'tokens';
+            a summary shared with an identical request in flight reports no tokens
         """
         summary_prompt = get_summary_prompt(user_query, response)
+        prompt_tokens_estimate = estimate_tokens(summary_prompt)
         
-        summary_response = openai.chat.completions.create(
-            model=Config.SUMMARY_MODEL,
-            messages=[{"role": "user", "content": summary_prompt}]
-        )
+        if on_token is None:
+            summary_response, shared = scheduler.call_merged(
+                Config.SUMMARY_MODEL,
+                lambda: self.summary_client.chat.completions.create(
+                    model=Config.SUMMARY_MODEL,
+                    messages=[{"role": "user", "content": summary_prompt}]
+                ),
+                tokens=prompt_tokens_estimate,
+                key=('summary', summary_prompt)
+            )
+            summary = summary_response.choices[0].message.content
+            usage = None if shared else summary_response.usage
+        else:
+            stream = scheduler.call(
+                Config.SUMMARY_MODEL,
+                lambda: self.summary_client.chat.completions.create(
+                    model=Config.SUMMARY_MODEL,
+                    messages=[{"role": "user", "content": summary_prompt}],
+                    stream=True,
+                    stream_options={"include_usage": True}
+                ),
+                tokens=prompt_tokens_estimate
+            )
+            parts = []
+            usage = None
+            for chunk in stream:
+                # The final chunk carries only the usage and no choices
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    on_token(chunk.choices[0].delta.content)
+            summary = "".join(parts)
+        
+        prompt_tokens = usage.prompt_tokens if usage else 0
+        completion_tokens = usage.completion_tokens if usage else 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = (getattr(details, 'cached_tokens', None) or 0) if details else 0
+        return {
+            'summary': summary,
+            'tokens': {
+                'model': Config.SUMMARY_MODEL,
+                'prompt_tokens': prompt_tokens,
+                'cached_tokens': cached_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': usage.total_tokens if usage else 0,
+                'total_cost': token_cost(Config.SUMMARY_MODEL, prompt_tokens, completion_tokens, cached_tokens),
+            },
+        }
+    
+    def generate_summary(self, user_query: str, response: str) -> str:
+        """
+        Generate a summary of the query response
         
-        return summary_response.choices[0].message.content
\ No newline at end of file
+        Args:
+            user_query: Original user query
+            response: Agent response
+        
+        Returns:
+            Summary text
+        """
+        return self.summarize(user_query, response)['summary']
@@ -0,0 +1,190 @@
+"""
+Persistent cache of final answers for repeated and near-duplicate questions
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question so spacing, case and trailing punctuation do not matter
+    
+    Args:
+        question: Natural language question
+    
+    Returns:
+        Normalized question text
+    """
+    question = re.sub(r"\s+", " ", question.lower()).strip()
+    return question.strip(" ?!.")
+
+
+class AnswerCache:
+    """SQLite-backed answer cache with TTL, size-based eviction and similarity lookup"""
+    
+    def __init__(self, path: str, version_fn: Callable[[], str],
+                 vectorize: Callable[[List[str]], object] = None,
+                 entities: Callable[[str], object] = None,
+                 similarity_threshold: float = 1.0, ttl: float = None,
+                 max_entries: int = None):
+        """
+        Initialize the answer cache
+        
+        Args:
+            path: Path to the SQLite file holding cached answers
+            version_fn: Callable returning the current data version; entries
+                stored under another version are never returned
+            vectorize: Callable turning texts into L2-normalised row vectors,
+                used to match near-duplicate questions
+            entities: Callable returning the JSON-serializable places and
+                years a question names; they are stored with the answer and
+                a near-duplicate must name the same ones, since the
+                vectorizer may not know them
+            similarity_threshold: Minimum cosine similarity for a near-duplicate
+                hit; 1.0 disables near-duplicate matching
+            ttl: Seconds an answer stays valid, None for no expiry
+            max_entries: Maximum number of cached answers
+        """
+        self.path = path
+        self.version_fn = version_fn
+        self.vectorize = vectorize
+        self.entities = entities
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                indicator_ids TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                version TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                entities TEXT
+            )
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(answers)")]
+        if 'entities' not in columns:
+            # Entries from before entities were stored only match exactly
+            self._conn.execute("ALTER TABLE answers ADD COLUMN entities TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS answers_lookup ON answers (version, indicator_ids)"
+        )
+        self._conn.commit()
+    
+    @staticmethod
+    def _key(question: str, indicator_ids: str) -> str:
+        """Cache key for a normalized question and its resolved indicators"""
+        return hashlib.sha256(f"{question}\n{indicator_ids}".encode('utf-8')).hexdigest()
+    
+    def _entities(self, question: str) -> Optional[str]:
+        """Serialized entities of a question as asked, or None without an entities callable"""
+        if self.entities is None:
+            return None
+        return json.dumps(self.entities(question), sort_keys=True, default=str)
+    
+    def _purge(self, version: str, now: float):
+        """Delete stale, expired and surplus entries (caller holds the lock)"""
+        self._conn.execute("DELETE FROM answers WHERE version != ?", (version,))
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+        if self.max_entries is not None:
+            self._conn.execute("""
+                DELETE FROM answers WHERE key IN (
+                    SELECT key FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+    
+    def get(self, question: str, indicator_ids: str) -> Optional[Dict]:
+        """
+        Look up a cached answer
+        
+        Args:
+            question: Natural language question
+            indicator_ids: Indicators resolved for the question
+        
+        Returns:
+            Dictionary with the cached 'answer', the 'match' type ('exact' or
+            'similar') and its 'similarity', or None on a miss
+        """
+        normalized = normalize_question(question)
+        version = self.version_fn()
+        now = time.time()
+        min_created = now - self.ttl if self.ttl is not None else float('-inf')
+        similar = self.vectorize is not None and self.similarity_threshold < 1.0
+        entities = self._entities(question) if similar else None
+        
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, answer FROM answers WHERE key = ? AND version = ? AND created_at >= ?",
+                (self._key(normalized, indicator_ids), version, min_created)
+            ).fetchone()
+            match, similarity = 'exact', 1.0
+            
+            if row is None and similar:
+                query = ("SELECT key, answer, question FROM answers "
+                         "WHERE version = ? AND indicator_ids = ? AND created_at >= ?")
+                parameters = (version, indicator_ids, min_created)
+                if entities is not None:
+                    query += " AND entities = ?"
+                    parameters += (entities,)
+                candidates = self._conn.execute(query, parameters).fetchall()
+                if candidates:
+                    vectors = self.vectorize([normalized] + [c[2] for c in candidates])
+                    scores = (vectors[1:] @ vectors[0].T).toarray().ravel()
+                    best = int(scores.argmax())
+                    if scores[best] >= self.similarity_threshold:
+                        row = candidates[best][:2]
+                        match, similarity = 'similar', float(scores[best])
+            
+            if row is None:
+                return None
+            
+            self._conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, row[0]))
+            self._conn.commit()
+        
+        return {'answer': row[1], 'match': match, 'similarity': similarity}
+    
+    def put(self, question: str, indicator_ids: str, answer: str):
+        """
+        Store an answer
+        
+        Args:
+            question: Natural language question
+            indicator_ids: Indicators resolved for the question
+            answer: Final answer to cache
+        """
+        normalized = normalize_question(question)
+        version = self.version_fn()
+        now = time.time()
+        entities = self._entities(question)
+        
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(key, question, indicator_ids, answer, version, created_at, last_access, entities) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(normalized, indicator_ids), normalized, indicator_ids,
+                 answer, version, now, now, entities)
+            )
+            self._purge(version, now)
+            self._conn.commit()
+    
+    def clear(self):
+        """Remove every cached answer"""
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+    
+    def close(self):
+        """Close the SQLite connection"""
+        with self._lock:
+            self._conn.close()
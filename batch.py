@@ -0,0 +1,214 @@
+"""
+Batch query runner with bounded concurrency and resumable JSONL output
+
+Input is either a JSONL file of {"id": ..., "query": ...} objects or a plain
+text file with one query per line (the line number becomes the id). Each
+result is appended to the output file as soon as it finishes, so re-running
+the same command after a crash skips the queries that already completed.
+
+With --workers N the queries are answered by N pre-forked worker processes
+that share the loaded indexes, each running --concurrency queries at once.
+
+Run from the repository root:
+    python batch.py queries.jsonl results.jsonl --concurrency 8
+    python batch.py queries.jsonl results.jsonl --workers 4 --concurrency 4
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List
+
+from config import Config
+from llm_scheduler import BATCH, llm_priority
+from metrics import metrics, setup_logging
+from pipeline import QueryPipeline
+from worker_pool import WorkerPool
+
+
+logger = logging.getLogger(__name__)
+
+
+def load_queries(path: str) -> List[Dict]:
+    """
+    Load queries from a JSONL or plain text file
+    
+    Lines that are not valid JSON objects with a "query" are logged and
+    skipped, so one bad line does not stop the batch.
+    
+    Args:
+        path: Path to the queries file
+    
+    Returns:
+        List of {"id", "query"} dictionaries
+    """
+    queries = []
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                try:
+                    item = json.loads(line)
+                except ValueError as e:
+                    logger.warning(f"{path}:{line_number}: skipped, not valid JSON ({e})")
+                    continue
+                if not isinstance(item, dict) or not isinstance(item.get('query'), str) or not item['query'].strip():
+                    logger.warning(f"{path}:{line_number}: skipped, no \"query\" text")
+                    continue
+                queries.append({'id': str(item.get('id', line_number)), 'query': item['query']})
+            else:
+                queries.append({'id': str(line_number), 'query': line})
+    return queries
+
+
+def load_completed_ids(path: str) -> set:
+    """
+    Collect ids that already have a successful result in the output file
+    
+    Args:
+        path: Path to the JSONL output file
+    
+    Returns:
+        Set of completed query ids
+    """
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash; the query is simply run again
+                continue
+            if not result.get('error'):
+                completed.add(str(result['id']))
+    return completed
+
+
+def run_record(pipeline: QueryPipeline, item: Dict) -> Dict:
+    """
+    Run a single query and build its output record
+    
+    Its model calls are scheduled behind those of interactive queries.
+    
+    Args:
+        pipeline: Pipeline answering the query
+        item: {"id", "query"} dictionary
+    
+    Returns:
+        Output record with the pipeline details and the elapsed time
+    """
+    start = time.perf_counter()
+    try:
+        with llm_priority(BATCH):
+            details = pipeline.run_with_details(item['query'])
+    except Exception as e:
+        details = {'summary': None, 'error': str(e)}
+    
+    return {
+        'id': item['id'],
+        'query': item['query'],
+        **details,
+        'elapsed_seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+class BatchRunner:
+    """Runs many queries through one shared pipeline or a pool of worker processes"""
+    
+    def __init__(self, pipeline: QueryPipeline = None, concurrency: int = None,
+                 worker_pool: WorkerPool = None):
+        """
+        Initialize the batch runner
+        
+        Args:
+            pipeline: Warm pipeline shared by all threads, unused with a worker pool
+            concurrency: Number of queries processed at once
+            worker_pool: Started WorkerPool answering the queries instead of the pipeline
+        """
+        self.pipeline = pipeline
+        self.concurrency = concurrency or Config.BATCH_CONCURRENCY
+        self.worker_pool = worker_pool
+    
+    def _records(self, pending: List[Dict]) -> Iterator[Dict]:
+        """Output records of the pending queries in completion order"""
+        if self.worker_pool is not None:
+            yield from self.worker_pool.map(pending)
+            return
+        
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            futures = [pool.submit(run_record, self.pipeline, item) for item in pending]
+            for future in as_completed(futures):
+                yield future.result()
+    
+    def run(self, queries: List[Dict], output_path: str) -> Dict:
+        """
+        Run queries concurrently, appending each result to the output file as it finishes
+        
+        Args:
+            queries: List of {"id", "query"} dictionaries
+            output_path: Path to the JSONL output file
+        
+        Returns:
+            Counts of completed, failed and skipped queries
+        """
+        completed_ids = load_completed_ids(output_path)
+        pending = [item for item in queries if item['id'] not in completed_ids]
+        stats = {'completed': 0, 'failed': 0, 'skipped': len(queries) - len(pending)}
+        if self.worker_pool is not None:
+            logger.info(f"Running {len(pending)} queries ({stats['skipped']} already done) "
+                        f"in {self.worker_pool.workers} workers with {self.worker_pool.threads} threads each")
+        else:
+            logger.info(f"Running {len(pending)} queries ({stats['skipped']} already done) "
+                        f"with concurrency {self.concurrency}")
+        
+        start = time.perf_counter()
+        with open(output_path, 'a') as out:
+            for record in self._records(pending):
+                out.write(json.dumps(record, default=str) + "\n")
+                out.flush()
+                stats['failed' if record.get('error') else 'completed'] += 1
+                logger.info(f"[{stats['completed'] + stats['failed']}/{len(pending)}] "
+                            f"{record['id']} in {record['elapsed_seconds']}s")
+        
+        if self.worker_pool is not None:
+            self._log_workers(time.perf_counter() - start)
+        metrics.write_prometheus()
+        return stats
+    
+    def _log_workers(self, elapsed: float):
+        """Log the throughput and memory of every worker process"""
+        for pid, worker in self.worker_pool.report(elapsed).items():
+            memory = ""
+            if 'pss' in worker:
+                memory = (f", RSS {worker['rss'] / 2**20:.0f} MiB, PSS {worker['pss'] / 2**20:.0f} MiB, "
+                          f"USS {worker['uss'] / 2**20:.0f} MiB")
+            logger.info(f"Worker {pid}: {worker['queries']} queries, "
+                        f"{worker['queries_per_s']:.2f} queries/s{memory}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a file of queries through the pipeline")
+    parser.add_argument('input', help="JSONL or plain text file of queries")
+    parser.add_argument('output', help="JSONL file results are appended to")
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help="Number of queries processed at once (per worker with --workers)")
+    parser.add_argument('--workers', type=int, default=Config.WORKER_PROCESSES,
+                        help="Number of worker processes sharing the loaded indexes")
+    args = parser.parse_args()
+    
+    setup_logging()
+    if args.workers > 1:
+        Config.validate()
+        with WorkerPool(args.workers, args.concurrency, handler=run_record) as worker_pool:
+            runner = BatchRunner(worker_pool=worker_pool)
+            print(runner.run(load_queries(args.input), args.output))
+    else:
+        runner = BatchRunner(QueryPipeline.from_config(), args.concurrency)
+        print(runner.run(load_queries(args.input), args.output))
@@ -0,0 +1,3 @@
+"""
+Benchmarks for the World Bank SQL Agent pipeline
+"""
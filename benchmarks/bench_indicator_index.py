@@ -0,0 +1,128 @@
+"""
+Benchmark incremental indicator index updates against a full rebuild
+
+A persisted index is built for a synthetic Indicator table, then a share of
+the rows is changed, deleted and added. The updated table is indexed once
+incrementally from the persisted index and once from scratch; the report
+shows both times and how closely the incremental index matches the full
+rebuild: identical top-N results, mean top-N overlap and the largest
+difference of any similarity score.
+
+Run from the repository root:
+    python -m benchmarks.bench_indicator_index --sizes 5000 20000
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.synthetic_data import make_indicators
+from config import Config
+from indicator_catalog import IndicatorCatalog
+from indicator_search import IndicatorSearch
+
+
+def catalog_rows(indicators: List[Dict], rowids: List[int]) -> List[tuple]:
+    """Rows in the order IndicatorCatalog expects them"""
+    return [
+        (rowid, i['id'], i['name'], i['description'], i['source'], i['topic'])
+        for rowid, i in zip(rowids, indicators)
+    ]
+
+
+def change_rows(rows: List[tuple], fraction: float, seed: int = 0) -> List[tuple]:
+    """
+    Change, delete and add about a third of the given fraction of rows each
+    
+    Args:
+        rows: Catalog rows
+        fraction: Share of the table to touch
+        seed: Random seed
+    
+    Returns:
+        New catalog rows in rowid order
+    """
+    rng = random.Random(seed)
+    n_each = max(1, round(len(rows) * fraction / 3))
+    replacements = make_indicators(2 * n_each, seed=seed + 1)
+    touched = rng.sample(range(len(rows)), 2 * n_each)
+    changed, deleted = set(touched[:n_each]), set(touched[n_each:])
+    
+    new_rows = []
+    for position, row in enumerate(rows):
+        if position in deleted:
+            continue
+        if position in changed:
+            row = row[:3] + (replacements.pop()['description'],) + row[4:]
+        new_rows.append(row)
+    next_rowid = rows[-1][0] + 1
+    new_rows += catalog_rows(replacements, range(next_rowid, next_rowid + len(replacements)))
+    return new_rows
+
+
+def compare(incremental: IndicatorSearch, full: IndicatorSearch, queries: List[str], top_n: int) -> Dict:
+    """Compare the search results and similarity scores of two indexes over the same table"""
+    identical, overlap, max_diff = 0, 0.0, 0.0
+    for query in queries:
+        a, b = incremental.search(query, top_n), full.search(query, top_n)
+        identical += a == b
+        ids_a, ids_b = set(a.split("; ")), set(b.split("; "))
+        overlap += len(ids_a & ids_b) / max(1, len(ids_a | ids_b))
+        diff = np.abs(incremental._compute_similarities([query]) - full._compute_similarities([query]))
+        max_diff = max(max_diff, float(diff.max()))
+    return {
+        'identical': identical,
+        'overlap': overlap / len(queries),
+        'max_score_diff': max_diff,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 20000])
+    parser.add_argument('--fractions', type=float, nargs='+', default=[0.001, 0.01, 0.05, 0.1, 0.2])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--top-n', type=int, default=5)
+    args = parser.parse_args()
+    
+    # Measure the incremental path even where it would normally trigger a rebuild
+    Config.INDICATOR_INDEX_REBUILD_DRIFT = 1.0
+    
+    print(f"{'indicators':>10} {'changed':>8} {'update ms':>10} {'rebuild ms':>11} "
+          f"{'identical':>10} {'overlap':>8} {'max diff':>9}")
+    for n in args.sizes:
+        indicators = make_indicators(n)
+        rows = catalog_rows(indicators, range(1, n + 1))
+        rng = random.Random(n)
+        queries = [f"{rng.choice(indicators)['name']}. {rng.choice(indicators)['topic']} trends"
+                   for _ in range(args.queries)]
+        
+        with tempfile.TemporaryDirectory() as work_dir:
+            base_dir = f"{work_dir}/base"
+            IndicatorSearch(IndicatorCatalog(rows), index_dir=base_dir)
+            
+            for fraction in args.fractions:
+                new_rows = change_rows(rows, fraction)
+                update_dir = f"{work_dir}/update-{fraction}"
+                shutil.copytree(base_dir, update_dir)
+                
+                start = time.perf_counter()
+                incremental = IndicatorSearch(IndicatorCatalog(new_rows), index_dir=update_dir)
+                update_ms = (time.perf_counter() - start) * 1000
+                
+                start = time.perf_counter()
+                full = IndicatorSearch(IndicatorCatalog(new_rows), index_dir=f"{work_dir}/full-{fraction}")
+                rebuild_ms = (time.perf_counter() - start) * 1000
+                
+                result = compare(incremental, full, queries, args.top_n)
+                print(f"{n:>10} {fraction:>8.1%} {update_ms:>10.1f} {rebuild_ms:>11.1f} "
+                      f"{result['identical']:>5}/{len(queries):<4} {result['overlap']:>8.3f} "
+                      f"{result['max_score_diff']:>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark IndicatorSearch.search against the original per-sentence DataFrame ranking
+
+Run from the repository root:
+    python -m benchmarks.bench_indicator_search
+"""
+import argparse
+import random
+import tempfile
+import time
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+
+from indicator_catalog import CATALOG_COLUMNS, IndicatorCatalog
+from indicator_search import IndicatorSearch
+from utils import split_sentences
+
+
+WORDS = (
+    "access electricity rural urban population energy consumption renewable "
+    "gdp growth income poverty education primary secondary school pupils "
+    "health mortality infant maternal water sanitation forest land area "
+    "emissions co2 agriculture fertilizer hectares trade exports imports "
+    "debt inflation employment unemployment female male labor finance "
+    "consumer protection account ownership mobile internet broadband"
+).split()
+
+QUERIES = [
+    "What is access to electricity in rural areas of south asia?",
+    "Compare GDP growth and inflation. Which countries have the highest unemployment?",
+    "Show co2 emissions from energy consumption. How much forest land area remains? "
+    "What about renewable energy?",
+    "Are citizens aware of financial consumer protection laws?",
+]
+
+
+def make_indicator_df(n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a synthetic Indicator table
+    
+    Args:
+        n: Number of indicators
+        seed: Random seed
+        
+    Returns:
+        DataFrame with the Indicator columns used by IndicatorSearch
+    """
+    rng = random.Random(seed)
+    
+    def text(length):
+        return " ".join(rng.choice(WORDS) for _ in range(length))
+    
+    return pd.DataFrame({
+        'id': [f"{i}_{text(2).replace(' ', '.')}" for i in range(n)],
+        'name': [text(6) for _ in range(n)],
+        'description': [text(25) for _ in range(n)],
+        'source': [text(3) for _ in range(n)],
+        'topic': [text(2) for _ in range(n)],
+    })
+
+
+def legacy_search(df: pd.DataFrame, vectorizer, tfidf_matrix, query: str, top_n: int = 5) -> str:
+    """Original ranking: one full DataFrame copy and sort per sentence"""
+    all_results = []
+    for part in split_sentences(query):
+        similarities = cosine_similarity(vectorizer.transform([part]), tfidf_matrix).flatten()
+        temp_df = df.copy()
+        temp_df['similarity'] = similarities
+        all_results.append(temp_df.sort_values(by='similarity', ascending=False).head(top_n))
+    
+    combined_results = pd.concat(all_results).drop_duplicates(subset='id').reset_index(drop=True)
+    combined_results = combined_results.sort_values(by='similarity', ascending=False)
+    final_results = combined_results.head(top_n)
+    output = [
+        f"id: {row['id']}, indicator_name: {row['name']}\n"
+        for _, row in final_results.iterrows()
+    ]
+    return "; ".join(output)
+
+
+def time_calls(fn, repeat: int) -> float:
+    """Return mean milliseconds per call over all queries"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in QUERIES:
+            fn(query)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(QUERIES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000, 50000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top-n', type=int, default=5)
+    args = parser.parse_args()
+    
+    print(f"{'indicators':>10} {'legacy ms':>10} {'batched ms':>11} {'speedup':>8} {'identical':>10}")
+    for n in args.sizes:
+        df = make_indicator_df(n)
+        with tempfile.TemporaryDirectory() as index_dir:
+            rows = ((i + 1, *row) for i, row in enumerate(df[list(CATALOG_COLUMNS)].itertuples(index=False)))
+            search = IndicatorSearch(IndicatorCatalog(rows), index_dir=index_dir)
+            
+            def legacy(query):
+                return legacy_search(df, search.vectorizer, search.tfidf_matrix,
+                                     query, args.top_n)
+            
+            def batched(query):
+                return search.search(query, top_n=args.top_n)
+            
+            identical = sum(legacy(q) == batched(q) for q in QUERIES)
+            legacy_ms = time_calls(legacy, args.repeat)
+            batched_ms = time_calls(batched, args.repeat)
+        
+        print(f"{n:>10} {legacy_ms:>10.2f} {batched_ms:>11.2f} "
+              f"{legacy_ms / batched_ms:>7.1f}x {identical:>6}/{len(QUERIES)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+Offline benchmark of the query pipeline on synthetic data with stub models
+
+For each data scale a synthetic database and few-shot file are generated,
+then latency percentiles, sequential throughput and peak Python heap usage
+are reported for IndicatorSearch.search, FewShotSelector.select_examples,
+SQL execution (result cache disabled) and the full main() path with the
+stub chat model, embeddings and summary client. Model latencies can be
+simulated with --llm-latency and --embed-latency.
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline --scales small medium
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+from agent import WorldBankAgent
+from benchmarks.stubs import StubChatModel, StubEmbeddings, StubSummaryClient
+from benchmarks.synthetic_data import SCALES, generate_database, generate_few_shots
+from config import Config
+from database import CachedSQLDatabase, get_engine
+from fast_path import FastPathPlanner
+from few_shot_selector import FewShotSelector
+from indicator_catalog import IndicatorCatalog
+from indicator_search import IndicatorSearch
+from llm_scheduler import scheduler
+from main import main as run_main
+from metrics import metrics
+from pipeline import QueryPipeline
+from prepare_db import prepare_database
+
+
+QUESTION_TEMPLATES = (
+    "What is {indicator} in {country}?",
+    "Compare {indicator} between {country} and {other}. Which one grew faster?",
+    "Show {indicator} trends in {region} since 2018",
+    "How does {country} rank on {topic} indicators?",
+)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(fn: Callable, inputs: List, repeat: int = 1) -> Dict:
+    """
+    Time fn over every input, repeat times
+    
+    Args:
+        fn: Callable taking one input
+        inputs: Inputs to call fn with
+        repeat: Number of passes over the inputs
+    
+    Returns:
+        Dictionary with 'n', latency percentiles in ms and 'ops_per_s'
+    """
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            call_start = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    
+    latencies.sort()
+    return {
+        'n': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'ops_per_s': len(latencies) / elapsed,
+    }
+
+
+def peak_memory(fn: Callable, inputs: List) -> float:
+    """
+    Peak Python heap growth in MB while calling fn over the inputs once
+    
+    Measured in a separate pass because tracing slows every allocation down.
+    """
+    tracemalloc.start()
+    try:
+        for item in inputs:
+            fn(item)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1e6
+
+
+def query_counters(pipeline: QueryPipeline) -> Dict[str, float]:
+    """Current totals of the token counters by type, finished and fast path queries, and model calls"""
+    totals = {
+        'llm_calls': pipeline.agent.llm.calls + pipeline.agent.summary_client.calls,
+    }
+    for (name, labels), value in metrics.snapshot()['counters'].items():
+        if name == 'tokens_total':
+            key = dict(labels)['type']
+        elif name == 'queries_total':
+            key = 'queries'
+        elif name == 'fast_path_total' and dict(labels)['result'] == 'hit':
+            key = 'fast_path'
+        else:
+            continue
+        totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def measure_concurrent(fn: Callable, inputs: List, concurrency: int) -> Dict:
+    """Throughput of fn over the inputs with a thread pool, discarding anything printed"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool, contextlib.redirect_stdout(io.StringIO()):
+        list(pool.map(fn, inputs))
+    return {'n': len(inputs), 'ops_per_s': len(inputs) / (time.perf_counter() - start)}
+
+
+def make_questions(generated: Dict, n: int, seed: int = 0) -> List[str]:
+    """Build natural language questions about the generated indicators and countries"""
+    rng = random.Random(seed)
+    countries = generated['countries']
+    questions = []
+    for i in range(n):
+        indicator = rng.choice(generated['indicators'])
+        country, other = rng.sample(countries, 2)
+        questions.append(QUESTION_TEMPLATES[i % len(QUESTION_TEMPLATES)].format(
+            indicator=indicator['name'], topic=indicator['topic'],
+            country=country[1], other=other[1], region=country[2],
+        ))
+    return questions
+
+
+def make_sql(generated: Dict, n: int, seed: int = 0) -> List[str]:
+    """Build the query shapes the agent issues most often over the generated data"""
+    rng = random.Random(seed)
+    queries = []
+    for i in range(n):
+        indicator = rng.choice(generated['indicators'])['id']
+        country = rng.choice(generated['countries'])
+        shape = i % 3
+        if shape == 0:
+            queries.append(f"SELECT * FROM Information WHERE indicator_id = '{indicator}' "
+                           f"AND country_name = '{country[1]}'")
+        elif shape == 1:
+            queries.append(f"SELECT country_name, year, value FROM Information "
+                           f"WHERE indicator_id = '{indicator}' AND country_region = '{country[2]}'")
+        else:
+            queries.append(f"SELECT indicator_name, value FROM Information "
+                           f"WHERE country_name = '{country[1]}' AND year = '2020'")
+    return queries
+
+
+def indicator_memory(db_path: str, index_dir: str) -> Dict:
+    """
+    Memory per indicator of a worker loading the indicator search from its persisted index
+    
+    Returns:
+        Bytes per indicator: 'catalog' for the packed ids and names,
+        'retained' and 'peak' Python heap of loading IndicatorSearch (the
+        TF-IDF matrix is memory-mapped), and 'dataframe' for a
+        SELECT * DataFrame of the table for comparison
+    """
+    tracemalloc.start()
+    try:
+        search = IndicatorSearch(IndicatorCatalog.from_database(db_path), index_dir=index_dir)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    with get_engine(db_path).connect() as conn:
+        df = pd.read_sql("SELECT * FROM Indicator", conn)
+    
+    n = max(1, len(search.catalog))
+    return {
+        'catalog': search.catalog.nbytes / n,
+        'retained': retained / n,
+        'peak': peak / n,
+        'dataframe': int(df.memory_usage(deep=True).sum()) / n,
+    }
+
+
+def build_pipeline(db_path: str, few_shots_path: str, work_dir: str, countries: List[str],
+                   llm_latency: float, embed_latency: float,
+                   fast_path: bool = True) -> (QueryPipeline, Dict):
+    """
+    Build a pipeline over the synthetic data with stub models
+    
+    Returns:
+        Tuple of (pipeline, start-up timings in seconds)
+    """
+    setup = {}
+    # The stub models have no rate limits to stay under
+    scheduler.tokens_per_minute, scheduler.requests_per_minute = {}, {}
+    scheduler.set_share(1.0)
+    
+    start = time.perf_counter()
+    indicator_search = IndicatorSearch(
+        IndicatorCatalog.from_database(db_path), index_dir=os.path.join(work_dir, 'indicator_index')
+    )
+    setup['indicator_index_s'] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    few_shot_selector = FewShotSelector(
+        few_shots_path, api_key='stub', embeddings=StubEmbeddings(latency=embed_latency),
+        index_dir=os.path.join(work_dir, 'few_shots_faiss')
+    )
+    setup['few_shot_index_s'] = time.perf_counter() - start
+    
+    Config.SCHEMA_CATALOG_PATH = os.path.join(work_dir, 'schema_catalog.json')
+    start = time.perf_counter()
+    agent = WorldBankAgent(
+        db_url=f"sqlite:///{db_path}", api_key='stub',
+        llm=StubChatModel(latency=llm_latency, countries=countries),
+        summary_client=StubSummaryClient(latency=llm_latency)
+    )
+    agent.db.warm_up()
+    setup['agent_s'] = time.perf_counter() - start
+    
+    planner = FastPathPlanner(agent.schema_catalog) if fast_path else None
+    return QueryPipeline(few_shot_selector, indicator_search, agent, answer_cache=None,
+                         fast_path=planner), setup
+
+
+def bench_scale(scale: str, args) -> Dict:
+    """Generate one data scale and benchmark every stage on it"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        db_path = os.path.join(work_dir, 'world_bank.db')
+        few_shots_path = os.path.join(work_dir, 'fewshots.json')
+        
+        start = time.perf_counter()
+        generated = generate_database(db_path, *SCALES[scale], seed=args.seed)
+        generate_few_shots(few_shots_path, generated['indicators'], generated['countries'],
+                           args.examples, args.seed)
+        if not args.no_prepare:
+            prepare_database(db_path)
+        generate_s = time.perf_counter() - start
+        
+        countries = [country[1] for country in generated['countries']]
+        pipeline, setup = build_pipeline(db_path, few_shots_path, work_dir, countries,
+                                         args.llm_latency, args.embed_latency,
+                                         fast_path=not args.no_fast_path)
+        questions = make_questions(generated, args.queries, args.seed)
+        sql = make_sql(generated, args.queries, args.seed)
+        
+        memory = indicator_memory(db_path, os.path.join(work_dir, 'indicator_index'))
+        
+        sql_db = CachedSQLDatabase.from_path(db_path)
+        sql_db.sql_cache = None
+        
+        def full_path(question):
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_main(question, pipeline)
+        
+        stages = {
+            'indicator_search': (lambda q: pipeline.indicator_search.search(q, top_n=5), questions),
+            'few_shot_select': (pipeline.few_shot_selector.select_examples, questions),
+            'sql_execute': (sql_db.run, sql),
+            'main': (full_path, questions),
+        }
+        
+        results = {}
+        for name, (fn, inputs) in stages.items():
+            if name == 'main':
+                before = query_counters(pipeline)
+            fn(inputs[0])
+            repeat = 1 if name == 'main' else args.repeat
+            results[name] = measure(fn, inputs, repeat)
+            results[name]['peak_mb'] = peak_memory(fn, inputs[:args.memory_samples])
+        
+        after = query_counters(pipeline)
+        delta = {key: after.get(key, 0) - before.get(key, 0) for key in after}
+        prompt_tokens = delta.get('prompt', 0)
+        queries = max(1, delta.get('queries', 0))
+        tokens = {
+            'prompt_per_query': prompt_tokens / queries,
+            'cached_ratio': delta.get('cached', 0) / prompt_tokens if prompt_tokens else 0.0,
+            'llm_calls_per_query': delta['llm_calls'] / queries,
+            'fast_path_ratio': delta.get('fast_path', 0) / queries,
+        }
+        
+        if args.concurrency > 1:
+            results[f"pipeline x{args.concurrency}"] = measure_concurrent(
+                pipeline.run_with_details, questions, args.concurrency
+            )
+        
+        return {
+            'scale': scale,
+            'indicators': len(generated['indicators']),
+            'rows': generated['rows'],
+            'generate_s': generate_s,
+            'setup': setup,
+            'indicator_bytes': memory,
+            'tokens': tokens,
+            'stages': results,
+        }
+
+
+def print_report(report: Dict):
+    """Print one scale's results as a table"""
+    setup = ", ".join(f"{k} {v:.2f}" for k, v in report['setup'].items())
+    print(f"\n{report['scale']}: {report['indicators']} indicators, {report['rows']} rows "
+          f"(generated in {report['generate_s']:.1f}s; {setup})")
+    memory = report['indicator_bytes']
+    print(f"bytes per indicator: catalog {memory['catalog']:.0f}, retained {memory['retained']:.0f}, "
+          f"peak {memory['peak']:.0f} (SELECT * DataFrame {memory['dataframe']:.0f})")
+    print(f"{'stage':>18} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9} {'peak MB':>8}")
+    for name, stats in report['stages'].items():
+        if 'p50_ms' not in stats:
+            print(f"{name:>18} {stats['n']:>6} {'':>9} {'':>9} {'':>9} {stats['ops_per_s']:>9.1f}")
+            continue
+        print(f"{name:>18} {stats['n']:>6} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['ops_per_s']:>9.1f} {stats['peak_mb']:>8.2f}")
+    tokens = report['tokens']
+    print(f"prompt tokens per query {tokens['prompt_per_query']:.0f}, {tokens['cached_ratio']:.0%} cached; "
+          f"model calls per query {tokens['llm_calls_per_query']:.1f}, "
+          f"{tokens['fast_path_ratio']:.0%} answered by the fast path")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', nargs='+', choices=sorted(SCALES), default=['small', 'medium'])
+    parser.add_argument('--queries', type=int, default=40, help="Distinct questions and SQL statements")
+    parser.add_argument('--repeat', type=int, default=3, help="Passes over the inputs for the stage benchmarks")
+    parser.add_argument('--examples', type=int, default=200, help="Few-shot examples")
+    parser.add_argument('--memory-samples', type=int, default=10, help="Calls traced for peak memory")
+    parser.add_argument('--concurrency', type=int, default=1, help="Also measure pipeline throughput with N threads")
+    parser.add_argument('--llm-latency', type=float, default=0.0, help="Simulated seconds per model call")
+    parser.add_argument('--embed-latency', type=float, default=0.0, help="Simulated seconds per embedding call")
+    parser.add_argument('--no-prepare', action='store_true', help="Skip prepare_db indexes and derived columns")
+    parser.add_argument('--no-fast-path', action='store_true', help="Send every question to the agent")
+    parser.add_argument('--no-validation', action='store_true', help="Run the agent's SQL without local repair")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.no_validation:
+        Config.SQL_VALIDATION_ENABLED = False
+    
+    reports = []
+    for scale in args.scales:
+        report = bench_scale(scale, args)
+        print_report(report)
+        reports.append(report)
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
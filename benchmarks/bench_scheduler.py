@@ -0,0 +1,156 @@
+"""
+Offline benchmark of the LLM scheduler against stub models with provider-side rate limits
+
+A batch of questions is answered at high concurrency with batch priority
+while a smaller stream of interactive questions runs next to it. Every
+stub model (agent chat model, summary model, embeddings) rejects calls
+over its own token budget with a 429, the way OpenAI enforces tokens per
+minute; a one-second window stands in for the minute so a run takes
+seconds. Each run is repeated with the scheduler throttling to those
+limits and without limits, where calls are only retried with backoff
+after a 429. Some questions are asked twice at the same time, so merged
+summary and embedding calls show up in the scheduled run.
+
+Run from the repository root:
+    python -m benchmarks.bench_scheduler --batch 60 --interactive 12
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from benchmarks.bench_pipeline import build_pipeline, make_questions, percentile
+from benchmarks.stubs import StubRateLimit
+from benchmarks.synthetic_data import SCALES, generate_database, generate_few_shots
+from config import Config
+from llm_scheduler import BATCH, INTERACTIVE, llm_priority, scheduler
+from prepare_db import prepare_database
+
+
+def configure(pipeline, limits: Dict[str, StubRateLimit], throttle: bool):
+    """Attach the provider-side limits to the stubs and size the scheduler's buckets from them"""
+    pipeline.agent.llm.rate_limit = limits['chat']
+    pipeline.agent.summary_client.rate_limit = limits['summary']
+    pipeline.few_shot_selector.embeddings.rate_limit = limits['embeddings']
+    models = {
+        'chat': pipeline.agent.scheduled_llm.model_name,
+        'summary': Config.SUMMARY_MODEL,
+        'embeddings': pipeline.few_shot_selector._embedding_model(),
+    }
+    scheduler.tokens_per_minute = {}
+    scheduler.requests_per_minute = {}
+    # The stubs' budgets hold one window's worth, not a minute's
+    scheduler.burst = limits['chat'].window / 60
+    if throttle:
+        for name, limit in limits.items():
+            per_minute = limit.per_minute()
+            scheduler.tokens_per_minute[models[name]] = per_minute['tokens']
+            if per_minute['requests']:
+                scheduler.requests_per_minute[models[name]] = per_minute['requests']
+    # Start from full buckets and empty statistics
+    scheduler.set_share(1.0)
+
+
+def run_mix(pipeline, batch: List[str], interactive: List[str], concurrency: int) -> Dict:
+    """
+    Answer the batch and interactive questions at the same time
+    
+    Returns:
+        Dictionary with the elapsed seconds, latencies per priority and failed queries
+    """
+    latencies = {INTERACTIVE: [], BATCH: []}
+    failures = {INTERACTIVE: 0, BATCH: 0}
+    
+    def answer(question: str, priority: str):
+        start = time.perf_counter()
+        try:
+            with llm_priority(priority):
+                failed = bool(pipeline.run_with_details(question).get('error'))
+        except Exception:
+            failed = True
+        latencies[priority].append(time.perf_counter() - start)
+        failures[priority] += failed
+    
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), \
+            ThreadPoolExecutor(concurrency) as batch_pool, ThreadPoolExecutor(2) as interactive_pool:
+        futures = [batch_pool.submit(answer, q, BATCH) for q in batch]
+        futures += [interactive_pool.submit(answer, q, INTERACTIVE) for q in interactive]
+        for future in futures:
+            future.result()
+    return {'elapsed': time.perf_counter() - start, 'latencies': latencies, 'failures': failures}
+
+
+def print_report(mode: str, result: Dict, limits: Dict[str, StubRateLimit], queries: int):
+    """Print one run's throughput, latency per priority and rate-limit counts"""
+    stats = scheduler.stats()
+    rejected = sum(limit.rejected for limit in limits.values())
+    merged = sum(model['merged'] for model in stats.values())
+    parts = []
+    for priority in (INTERACTIVE, BATCH):
+        values = sorted(result['latencies'][priority])
+        if values:
+            parts.append(f"{percentile(values, 50):>7.2f} {percentile(values, 95):>7.2f}")
+    failures = result['failures'][INTERACTIVE] + result['failures'][BATCH]
+    print(f"{mode:>11} {queries / result['elapsed']:>6.1f} {' '.join(parts)} "
+          f"{rejected:>6} {merged:>6} {failures:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--batch', type=int, default=60, help="Batch questions")
+    parser.add_argument('--interactive', type=int, default=12, help="Interactive questions")
+    parser.add_argument('--concurrency', type=int, default=8, help="Batch questions answered at once")
+    parser.add_argument('--chat-tokens', type=int, default=20000, help="Agent model prompt tokens per second")
+    parser.add_argument('--summary-tokens', type=int, default=20000, help="Summary model prompt tokens per second")
+    parser.add_argument('--embed-tokens', type=int, default=200, help="Embedding tokens per second")
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="Simulated seconds per model call")
+    parser.add_argument('--base-delay', type=float, default=0.2, help="Delay before the first retry")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    Config.RATE_LIMIT_BASE_DELAY = scheduler.base_delay = args.base_delay
+    scheduler.max_delay = 2.0
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        db_path = os.path.join(work_dir, 'world_bank.db')
+        few_shots_path = os.path.join(work_dir, 'fewshots.json')
+        generated = generate_database(db_path, *SCALES[args.scale], seed=args.seed)
+        generate_few_shots(few_shots_path, generated['indicators'], generated['countries'], 200, args.seed)
+        prepare_database(db_path)
+        countries = [country[1] for country in generated['countries']]
+        pipeline, _ = build_pipeline(db_path, few_shots_path, work_dir, countries,
+                                     args.llm_latency, args.llm_latency, fast_path=False)
+        
+        # A quarter of the batch questions are asked twice, one right after the other
+        rng = random.Random(args.seed)
+        questions = make_questions(generated, args.batch + args.interactive, args.seed)
+        duplicates = args.batch // 4
+        groups = [[q, q] for q in questions[:duplicates]]
+        groups += [[q] for q in questions[duplicates:args.batch - duplicates]]
+        rng.shuffle(groups)
+        batch = [q for group in groups for q in group]
+        interactive = questions[args.batch:]
+        
+        print(f"{len(batch)} batch questions at concurrency {args.concurrency}, "
+              f"{len(interactive)} interactive questions at concurrency 2")
+        print(f"{'scheduler':>11} {'q/s':>6} {'int p50':>7} {'int p95':>7} {'bat p50':>7} {'bat p95':>7} "
+              f"{'429s':>6} {'merged':>6} {'failed':>6}")
+        for mode, throttle in (('throttled', True), ('retry only', False)):
+            limits = {
+                'chat': StubRateLimit(args.chat_tokens),
+                'summary': StubRateLimit(args.summary_tokens),
+                'embeddings': StubRateLimit(args.embed_tokens),
+            }
+            configure(pipeline, limits, throttle)
+            result = run_mix(pipeline, batch, interactive, args.concurrency)
+            print_report(mode, result, limits, len(batch) + len(interactive))
+
+
+if __name__ == "__main__":
+    main()
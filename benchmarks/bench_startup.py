@@ -0,0 +1,147 @@
+"""
+Start-up budget check for the command line and service entry points
+
+Every entry module is imported in a fresh interpreter with -X importtime.
+Its median cumulative import time is compared with its budget, and the
+heaviest top-level imports are listed. LangChain, scikit-learn, pandas,
+FAISS and the other HEAVY_PACKAGES are only needed once the pipeline is
+built, so importing an entry point must not load any of them. The exit
+status is 1 when a budget is exceeded or a heavy package is imported, so
+the check can guard against start-up regressions.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+
+# Budget in ms for the cumulative import time of each entry module
+STARTUP_BUDGETS_MS = {
+    'main': 400,
+    'service': 400,
+    'batch': 400,
+    'prepare_db': 200,
+    'pipeline': 400,
+}
+
+# Modules imported while the pipeline is built; reported for reference only
+DEFERRED_MODULES = ('indicator_search', 'few_shot_selector', 'agent')
+
+HEAVY_PACKAGES = (
+    'langchain', 'langchain_community', 'langchain_core', 'langchain_openai',
+    'openai', 'tiktoken', 'sklearn', 'scipy', 'pandas', 'numpy', 'faiss',
+    'nltk', 'sqlalchemy',
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """
+    Parse -X importtime output
+    
+    Args:
+        stderr: Standard error of the interpreter
+    
+    Returns:
+        Dictionary of module name to cumulative import time in microseconds
+    """
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        cumulative[parts[2].strip()] = int(parts[1])
+    return cumulative
+
+
+def profile_import(module: str, runs: int = 5) -> Dict:
+    """
+    Import a module in fresh interpreters and collect its import times
+    
+    Args:
+        module: Module to import
+        runs: Number of interpreters to start; the median is reported
+    
+    Returns:
+        Dictionary with the median 'import_ms' and 'process_ms', the
+        'heaviest' top-level imports and the 'heavy' packages loaded
+    """
+    import_times, process_times = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        )
+        process_times.append(time.perf_counter() - start)
+        cumulative = parse_importtime(completed.stderr)
+        import_times.append(cumulative.get(module, 0))
+    
+    top_level = {name.split('.')[0] for name in cumulative}
+    heaviest = sorted(
+        ((name, us) for name, us in cumulative.items() if '.' not in name and name != module),
+        key=lambda item: -item[1]
+    )[:3]
+    return {
+        'import_ms': statistics.median(import_times) / 1000,
+        'process_ms': statistics.median(process_times) * 1000,
+        'heaviest': [(name, us / 1000) for name, us in heaviest],
+        'heavy': sorted(top_level & set(HEAVY_PACKAGES)),
+    }
+
+
+def check_startup(modules: List[str], runs: int, scale: float) -> bool:
+    """
+    Profile the entry modules, print a report and check the budgets
+    
+    Args:
+        modules: Entry modules to check
+        runs: Interpreters started per module
+        scale: Factor applied to every budget, e.g. 2 on a slow machine
+    
+    Returns:
+        True if every module is within budget and imports no heavy package
+    """
+    ok = True
+    print(f"{'module':>18} {'import ms':>10} {'process ms':>11} {'budget':>7}  heaviest imports")
+    for module in modules:
+        result = profile_import(module, runs)
+        budget = STARTUP_BUDGETS_MS.get(module)
+        heaviest = ", ".join(f"{name} {ms:.0f}ms" for name, ms in result['heaviest'])
+        status = ''
+        if budget is not None:
+            budget *= scale
+            if result['import_ms'] > budget:
+                status = '  OVER BUDGET'
+                ok = False
+            if result['heavy']:
+                status += f"  HEAVY: {', '.join(result['heavy'])}"
+                ok = False
+        budget_text = f"{budget:.0f}" if budget is not None else '-'
+        print(f"{module:>18} {result['import_ms']:>10.1f} {result['process_ms']:>11.1f} "
+              f"{budget_text:>7}  {heaviest}{status}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the entry points")
+    parser.add_argument('--modules', nargs='+', default=list(STARTUP_BUDGETS_MS) + list(DEFERRED_MODULES))
+    parser.add_argument('--runs', type=int, default=5, help="Interpreters started per module")
+    parser.add_argument('--budget-scale', type=float, default=1.0, help="Multiply every budget, e.g. on slow machines")
+    args = parser.parse_args()
+    
+    if not check_startup(args.modules, args.runs, args.budget_scale):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Offline benchmark of the pre-fork worker pool on synthetic data with stub models
+
+For each worker count the same questions are answered by a WorkerPool
+that loads the indicator and few-shot indexes once in the parent and
+shares them with the forked workers, and by one in which every worker
+loads its own copy, as independent processes would. Throughput and the
+RSS, PSS and USS of every worker are reported; the sum of the workers'
+PSS is the memory the pool really uses, since pages shared by N workers
+are counted 1/N in each.
+
+Run from the repository root:
+    python -m benchmarks.bench_workers --scale medium --workers 1 2 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from agent import WorldBankAgent
+from benchmarks.bench_pipeline import make_questions
+from benchmarks.stubs import StubChatModel, StubEmbeddings, StubSummaryClient
+from benchmarks.synthetic_data import SCALES, generate_database, generate_few_shots
+from config import Config
+from few_shot_selector import FewShotSelector
+from indicator_catalog import IndicatorCatalog
+from indicator_search import IndicatorSearch
+from llm_scheduler import scheduler
+from prepare_db import prepare_database
+from worker_pool import WorkerPool, process_memory
+
+
+def quiet_details(pipeline, question: str) -> Dict:
+    """Answer a question in a worker, discarding the agent's verbose output"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return pipeline.run_with_details(question)
+
+
+def bench_pool(workers: int, preload: bool, questions: List[str], factories: Dict,
+               threads: int) -> Dict:
+    """
+    Answer the questions with one pool and measure it
+    
+    Returns:
+        Dictionary with 'queries_per_s', 'startup_s' and the 'workers'
+        report of WorkerPool.report()
+    """
+    start = time.perf_counter()
+    with WorkerPool(workers, threads, handler=quiet_details, preload=preload, **factories) as pool:
+        startup_s = time.perf_counter() - start
+        # One pass to warm every worker, then the measured pass
+        list(pool.map(questions[:workers * threads]))
+        pool.completed.clear()
+        start = time.perf_counter()
+        for result in pool.map(questions):
+            if result.get('error'):
+                raise RuntimeError(result['error'])
+        elapsed = time.perf_counter() - start
+        return {
+            'queries_per_s': len(questions) / elapsed,
+            'startup_s': startup_s,
+            'workers': pool.report(elapsed),
+        }
+
+
+def print_report(workers: int, mode: str, report: Dict):
+    """Print one pool's throughput and per-worker memory"""
+    mib = 2 ** 20
+    per_worker = list(report['workers'].values())
+    if per_worker and 'pss' in per_worker[0]:
+        rss = sum(w['rss'] for w in per_worker) / len(per_worker) / mib
+        pss = sum(w['pss'] for w in per_worker) / len(per_worker) / mib
+        uss = sum(w['uss'] for w in per_worker) / len(per_worker) / mib
+        total = sum(w['pss'] for w in per_worker) / mib
+        memory = f"{rss:>8.0f} {pss:>8.0f} {uss:>8.0f} {total:>9.0f}"
+    else:
+        memory = f"{'n/a':>8} {'n/a':>8} {'n/a':>8} {'n/a':>9}"
+    print(f"{workers:>7} {mode:>11} {report['startup_s']:>9.2f} {report['queries_per_s']:>9.1f} {memory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='medium')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=2, help="Queries each worker answers at once")
+    parser.add_argument('--queries', type=int, default=80)
+    parser.add_argument('--examples', type=int, default=2000, help="Few-shot examples")
+    parser.add_argument('--llm-latency', type=float, default=0.0, help="Simulated seconds per model call")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    if process_memory() is None:
+        print("/proc/<pid>/smaps_rollup is not available; memory is not reported")
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        db_path = os.path.join(work_dir, 'world_bank.db')
+        few_shots_path = os.path.join(work_dir, 'fewshots.json')
+        generated = generate_database(db_path, *SCALES[args.scale], seed=args.seed)
+        generate_few_shots(few_shots_path, generated['indicators'], generated['countries'],
+                           args.examples, args.seed)
+        prepare_database(db_path)
+        countries = [country[1] for country in generated['countries']]
+        questions = make_questions(generated, args.queries, args.seed)
+        
+        Config.SCHEMA_CATALOG_PATH = os.path.join(work_dir, 'schema_catalog.json')
+        Config.ANSWER_CACHE_ENABLED = False
+        # The stub models have no rate limits to stay under
+        scheduler.tokens_per_minute, scheduler.requests_per_minute = {}, {}
+        factories = {
+            'indicator_search_factory': lambda: IndicatorSearch(
+                IndicatorCatalog.from_database(db_path), index_dir=os.path.join(work_dir, 'indicator_index')
+            ),
+            'few_shot_selector_factory': lambda: FewShotSelector(
+                few_shots_path, api_key='stub', embeddings=StubEmbeddings(),
+                index_dir=os.path.join(work_dir, 'few_shots_faiss')
+            ),
+            'embeddings_factory': StubEmbeddings,
+            'agent_factory': lambda: WorldBankAgent(
+                db_url=f"sqlite:///{db_path}", api_key='stub',
+                llm=StubChatModel(latency=args.llm_latency, countries=countries),
+                summary_client=StubSummaryClient(latency=args.llm_latency)
+            ),
+        }
+        # Build the persisted indexes and the schema catalog once so every pool only loads them
+        factories['indicator_search_factory']()
+        factories['few_shot_selector_factory']()
+        factories['agent_factory']()
+        
+        print(f"{args.scale}: {len(generated['indicators'])} indicators, {generated['rows']} rows, "
+              f"{args.examples} few-shot examples, {args.threads} threads per worker")
+        print(f"{'workers':>7} {'indexes':>11} {'start s':>9} {'q/s':>9} "
+              f"{'RSS MiB':>8} {'PSS MiB':>8} {'USS MiB':>8} {'total PSS':>9}")
+        for workers in args.workers:
+            for preload in (True, False):
+                report = bench_pool(workers, preload, questions, factories, args.threads)
+                print_report(workers, 'shared' if preload else 'per-worker', report)
+
+
+if __name__ == "__main__":
+    main()
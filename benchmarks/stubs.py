@@ -0,0 +1,288 @@
+"""
+Deterministic local stand-ins for the OpenAI chat model, embeddings and summary call
+
+They let the full pipeline run offline with reproducible results, so a
+benchmark measures this repository's code plus an optional fixed latency
+per model call instead of network and model variance. A StubRateLimit
+passed to a stub makes it reject calls over a token or request budget
+with the 429 error the OpenAI client raises.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, FunctionMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.pydantic_v1 import Field
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count used for the stub usage reports"""
+    return (len(text) + 3) // 4
+
+
+class StubRateLimit:
+    """
+    Provider-side rate limit, shared by the stubs it is passed to
+    
+    Like OpenAI's limits, the token and request budgets replenish
+    continuously up to one window's worth. A call the remaining budget
+    cannot pay for is rejected with openai.RateLimitError, carrying a
+    Retry-After header when retry_after is set. A window shorter than a
+    minute compresses time so a benchmark takes seconds.
+    """
+    
+    def __init__(self, tokens_per_window: int, requests_per_window: int = None,
+                 window: float = 1.0, retry_after: float = None):
+        """
+        Initialize the limit with full budgets
+        
+        Args:
+            tokens_per_window: Prompt tokens replenished per window
+            requests_per_window: Calls replenished per window, unlimited if None
+            window: Window length in seconds
+            retry_after: Seconds sent in the Retry-After header of rejections
+        """
+        self.tokens_per_window = tokens_per_window
+        self.requests_per_window = requests_per_window
+        self.window = window
+        self.retry_after = retry_after
+        self.accepted = 0
+        self.rejected = 0
+        self._tokens = float(tokens_per_window)
+        self._requests = float(requests_per_window or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def per_minute(self) -> Dict[str, float]:
+        """The budget as per-minute token and request limits"""
+        scale = 60 / self.window
+        return {
+            'tokens': self.tokens_per_window * scale,
+            'requests': self.requests_per_window * scale if self.requests_per_window else None,
+        }
+    
+    def check(self, tokens: int):
+        """
+        Count a call, rejecting it if the remaining budget cannot pay for it
+        
+        Raises:
+            openai.RateLimitError: If the call exceeds the budget
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed = (now - self._updated) / self.window
+            self._updated = now
+            self._tokens = min(self.tokens_per_window, self._tokens + elapsed * self.tokens_per_window)
+            if self.requests_per_window:
+                self._requests = min(self.requests_per_window,
+                                     self._requests + elapsed * self.requests_per_window)
+            if tokens > self._tokens or (self.requests_per_window and self._requests < 1):
+                self.rejected += 1
+                raise self._error()
+            self._tokens -= tokens
+            self._requests -= 1
+            self.accepted += 1
+    
+    def _error(self) -> Exception:
+        import httpx
+        import openai
+        
+        headers = {'retry-after': f"{self.retry_after:g}"} if self.retry_after is not None else {}
+        response = httpx.Response(
+            429, headers=headers, request=httpx.Request('POST', 'https://stub.invalid/v1/chat/completions')
+        )
+        return openai.RateLimitError("Rate limit reached (stub)", response=response, body=None)
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Function-calling chat model that answers in two steps like the real agent
+    
+    The first call requests sql_db_query with a query over the indicator ids
+    from the indicator hints and the countries named in the question,
+    capitalized the way models tend to write them. If that finds nothing
+    it retries once with lowercase names; once rows are in the conversation
+    it returns a final answer.
+    Usage reports cached prompt tokens the way OpenAI's prompt cache does:
+    the longest prefix shared with a recent prompt, from 1024 tokens on in
+    steps of 128.
+    """
+    
+    model_name: str = 'gpt-4o'
+    latency: float = 0.0
+    countries: List[str] = []
+    recent_prompts: List[str] = Field(default_factory=list)
+    calls: int = 0
+    rate_limit: Optional[StubRateLimit] = None
+    
+    @property
+    def _llm_type(self) -> str:
+        return 'stub-chat'
+    
+    def _build_sql(self, text: str, retry: bool = False) -> str:
+        indicator_ids = re.findall(r"id: ([^,]+), indicator_name", text)[:5]
+        lowered = text.lower()
+        countries = [c for c in self.countries if c in lowered][:5]
+        
+        conditions = []
+        if indicator_ids:
+            conditions.append("indicator_id IN ({})".format(", ".join(f"'{i}'" for i in indicator_ids)))
+        if countries:
+            names = countries if retry else [c.title() for c in countries]
+            conditions.append("country_name IN ({})".format(", ".join(f"'{c}'" for c in names)))
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return (f"SELECT indicator_name, country_name, year, value, unitofmeasure "
+                f"FROM Information{where} LIMIT 100")
+    
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt_text = "\n".join(str(m.content) for m in messages)
+        if self.rate_limit is not None:
+            self.rate_limit.check(estimate_tokens(prompt_text))
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        
+        question = "\n".join(str(m.content) for m in messages if isinstance(m, HumanMessage))
+        tool_results = [m for m in messages if isinstance(m, FunctionMessage)]
+        found_rows = tool_results and str(tool_results[-1].content).startswith("[")
+        if tool_results and (found_rows or len(tool_results) > 1):
+            answer = f"Here is the data I found:\n{str(tool_results[-1].content)[:2000]}"
+            message = AIMessage(content=answer)
+            completion_text = answer
+        else:
+            arguments = json.dumps({'query': self._build_sql(question, retry=bool(tool_results))})
+            message = AIMessage(content="", additional_kwargs={
+                'function_call': {'name': 'sql_db_query', 'arguments': arguments}
+            })
+            completion_text = arguments
+        
+        prompt_tokens = estimate_tokens(prompt_text)
+        completion_tokens = estimate_tokens(completion_text)
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={
+                'model_name': self.model_name,
+                'token_usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens,
+                    'prompt_tokens_details': {'cached_tokens': self._cached_tokens(prompt_text)},
+                },
+            },
+        )
+    
+    def _cached_tokens(self, prompt_text: str) -> int:
+        shared = max((len(os.path.commonprefix([prompt_text, seen])) for seen in self.recent_prompts),
+                     default=0)
+        self.recent_prompts.append(prompt_text)
+        del self.recent_prompts[:-20]
+        tokens = estimate_tokens(prompt_text[:shared]) if shared else 0
+        return tokens // 128 * 128 if tokens >= 1024 else 0
+
+
+class StubEmbeddings(Embeddings):
+    """Hashed bag-of-words embeddings: similar texts get similar vectors"""
+    
+    def __init__(self, dimensions: int = 256, latency: float = 0.0, rate_limit: StubRateLimit = None):
+        """
+        Initialize the embeddings
+        
+        Args:
+            dimensions: Vector size
+            latency: Seconds to sleep per call, standing in for the API round trip
+            rate_limit: Provider-side limit the calls are counted against
+        """
+        self.dimensions = dimensions
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.calls = 0
+        self.model = f"stub-hash-{dimensions}"
+    
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode('utf-8')).digest()
+            vector[int.from_bytes(digest[:4], 'little') % self.dimensions] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+    
+    def _call(self, texts: List[str]):
+        if self.rate_limit is not None:
+            self.rate_limit.check(sum(estimate_tokens(text) for text in texts))
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._call(texts)
+        return [self._embed(text) for text in texts]
+    
+    def embed_query(self, text: str) -> List[float]:
+        self._call([text])
+        return self._embed(text)
+
+
+class StubSummaryClient:
+    """Stands in for the openai module's chat.completions.create(), with and without streaming"""
+    
+    def __init__(self, latency: float = 0.0, chunk_size: int = 4, rate_limit: StubRateLimit = None):
+        """
+        Initialize the client
+        
+        Args:
+            latency: Seconds to sleep per call
+            chunk_size: Words per streamed chunk
+            rate_limit: Provider-side limit the calls are counted against
+        """
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+    
+    @staticmethod
+    def _summarize(prompt: str) -> str:
+        numbers = [float(n) for n in re.findall(r"(?<![\w.])\d+\.\d+(?![\w.])", prompt)]
+        if not numbers:
+            return "I don't have available data for this question."
+        return (f"The data covers {len(numbers)} values, averaging {sum(numbers) / len(numbers):.2f} "
+                f"and ranging from {min(numbers):.2f} to {max(numbers):.2f}.")
+    
+    def create(self, model: str, messages: List[dict], stream: bool = False, **kwargs):
+        prompt = "\n".join(m['content'] for m in messages)
+        if self.rate_limit is not None:
+            self.rate_limit.check(estimate_tokens(prompt))
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        
+        content = self._summarize(prompt)
+        usage = SimpleNamespace(
+            prompt_tokens=estimate_tokens(prompt),
+            completion_tokens=estimate_tokens(content),
+            total_tokens=estimate_tokens(prompt) + estimate_tokens(content),
+        )
+        if not stream:
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                usage=usage,
+            )
+        
+        words = content.split(" ")
+        chunks = [" ".join(words[i:i + self.chunk_size]) + " "
+                  for i in range(0, len(words), self.chunk_size)]
+        return iter(
+            [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))], usage=None)
+             for chunk in chunks]
+            + [SimpleNamespace(choices=[], usage=usage)]
+        )
@@ -0,0 +1,259 @@
+"""
+Synthetic World Bank database and few-shot file for offline benchmarks
+
+The tables follow the schema described in prompts.py: an Indicator table
+(id, name, description, source, topic) and an Information table with one
+row per indicator, country and period, where periods are TEXT years such as
+"2021", "2023q4" or "2030 target" and values are TEXT numbers.
+
+Run from the repository root:
+    python -m benchmarks.synthetic_data --db data/world_bank_data_updated.db \
+        --few-shots data/Worldbankfewshots.json --indicators 5000
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+from typing import Dict, List
+
+
+WORDS = (
+    "access electricity rural urban population energy consumption renewable "
+    "gdp growth income poverty education primary secondary school pupils "
+    "health mortality infant maternal water sanitation forest land area "
+    "emissions co2 agriculture fertilizer hectares trade exports imports "
+    "debt inflation employment unemployment female male labor finance "
+    "consumer protection account ownership mobile internet broadband"
+).split()
+
+TOPICS = (
+    "energy", "education", "health", "environment", "economy", "finance",
+    "agriculture", "social protection", "gender", "infrastructure",
+)
+
+UNITS = ('Percent', '% of land area', 'hectares', '% of total', 'Kg per hectare', 'current US$')
+
+# The countries listed in the prompt, then synthetic ones up to the requested count
+BASE_COUNTRIES = [
+    ('afg', 'afghanistan', 'south asia', 'low income', 'Ida'),
+    ('are', 'united arab emirates', 'middle east & north africa', 'high income', 'not classified'),
+    ('aus', 'australia', 'east asia & pacific', 'high income', 'not classified'),
+    ('bgd', 'bangladesh', 'south asia', 'lower middle income', 'Ida'),
+    ('can', 'canada', 'north america', 'high income', 'not classified'),
+    ('chn', 'china', 'east asia & pacific', 'upper middle income', 'Ibrd'),
+    ('deu', 'germany', 'europe & central asia', 'high income', 'not classified'),
+    ('fra', 'france', 'europe & central asia', 'high income', 'not classified'),
+    ('gbr', 'united kingdom', 'europe & central asia', 'high income', 'not classified'),
+    ('ind', 'india', 'south asia', 'lower middle income', 'Ibrd'),
+    ('pak', 'pakistan', 'south asia', 'lower middle income', 'blend'),
+    ('usa', 'united states', 'north america', 'high income', 'not classified'),
+]
+
+REGIONS = sorted({country[2] for country in BASE_COUNTRIES})
+INCOME_LEVELS = ('low income', 'lower middle income', 'upper middle income', 'high income')
+LENDING_TYPES = ('Ida', 'not classified', 'Ibrd', 'blend')
+
+# Annual, quarterly and target periods as they appear in the year column
+PERIODS = (
+    [str(year) for year in range(2015, 2025)]
+    + [f"{year}q{quarter}" for year in range(2015, 2025) for quarter in range(1, 5)]
+    + ["2015 target", "2030", "2050"]
+)
+
+# (scale name) -> (indicators, countries, countries per indicator, periods per series)
+SCALES = {
+    'small': (1000, 12, 6, 10),
+    'medium': (5000, 40, 12, 12),
+    'large': (20000, 100, 20, 15),
+}
+
+FEW_SHOT_TEMPLATES = [
+    ("What is {indicator} in {country} in {year}?",
+     "SELECT indicator_name, country_name, year, value, unitofmeasure FROM Information "
+     "WHERE indicator_id = '{indicator_id}' AND country_name = '{country}' AND year = '{year}'"),
+    ("Compare {indicator} across {region} countries",
+     "SELECT country_name, year, value, unitofmeasure FROM Information "
+     "WHERE indicator_id = '{indicator_id}' AND country_region = '{region}'"),
+    ("How has {indicator} changed in {country} since {year}?",
+     "SELECT year, value, unitofmeasure FROM Information WHERE indicator_id = '{indicator_id}' "
+     "AND country_name = '{country}' AND year >= '{year}' ORDER BY year"),
+    ("Show all indicators for {country} in {year}",
+     "SELECT indicator_name, value, unitofmeasure FROM Information "
+     "WHERE country_name = '{country}' AND year = '{year}' LIMIT 50"),
+]
+
+
+def make_countries(n: int, seed: int = 0) -> List[tuple]:
+    """
+    Build the country list
+    
+    Args:
+        n: Number of countries
+        seed: Random seed
+    
+    Returns:
+        List of (country_id, name, region, income level, lending type) tuples
+    """
+    rng = random.Random(seed)
+    countries = list(BASE_COUNTRIES[:n])
+    for i in range(len(countries), n):
+        countries.append((
+            f"c{i:03d}", f"country {i:03d}", rng.choice(REGIONS),
+            rng.choice(INCOME_LEVELS), rng.choice(LENDING_TYPES),
+        ))
+    return countries
+
+
+def make_indicators(n: int, seed: int = 0) -> List[Dict]:
+    """
+    Build synthetic Indicator rows
+    
+    Args:
+        n: Number of indicators
+        seed: Random seed
+    
+    Returns:
+        List of dictionaries with the Indicator columns and a unit
+    """
+    rng = random.Random(seed)
+    
+    def text(length):
+        return " ".join(rng.choice(WORDS) for _ in range(length))
+    
+    indicators = []
+    for i in range(n):
+        name = text(5)
+        indicators.append({
+            'id': f"{i // 100 + 1}.{i % 100 + 1}_{'.'.join(name.split()[:3])}",
+            'name': name,
+            'description': f"{text(20)}. country-specific definition, method and targets "
+                           f"are determined by countries themselves.",
+            'source': text(3),
+            'topic': rng.choice(TOPICS),
+            'unit': rng.choice(UNITS),
+        })
+    return indicators
+
+
+def generate_database(path: str, n_indicators: int = 1000, n_countries: int = 12,
+                      countries_per_indicator: int = 6, periods_per_series: int = 10,
+                      seed: int = 0) -> Dict:
+    """
+    Write a synthetic World Bank database
+    
+    Every indicator gets values for a random subset of countries and
+    periods; about 5% of the values are NULL, as in the real data.
+    
+    Args:
+        path: Output SQLite file, replaced if it exists
+        n_indicators: Number of indicators
+        n_countries: Number of countries
+        countries_per_indicator: Countries with data for each indicator
+        periods_per_series: Periods with data for each indicator and country
+        seed: Random seed
+    
+    Returns:
+        Dictionary with the generated 'indicators', 'countries' and row count
+    """
+    rng = random.Random(seed)
+    indicators = make_indicators(n_indicators, seed)
+    countries = make_countries(n_countries, seed)
+    countries_per_indicator = min(countries_per_indicator, len(countries))
+    periods_per_series = min(periods_per_series, len(PERIODS))
+    
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("CREATE TABLE Indicator (id TEXT, name TEXT, description TEXT, source TEXT, topic TEXT)")
+        conn.execute(
+            "CREATE TABLE Information (id INTEGER, indicator_id TEXT, indicator_name TEXT, "
+            "indicator_description TEXT, country_id TEXT, country_name TEXT, country_region TEXT, "
+            "country_incomelevel TEXT, country_lendingtype TEXT, year TEXT, value TEXT, "
+            "unitofmeasure TEXT)"
+        )
+        conn.executemany(
+            "INSERT INTO Indicator VALUES (?, ?, ?, ?, ?)",
+            [(i['id'], i['name'], i['description'], i['source'], i['topic']) for i in indicators]
+        )
+        
+        row_id = 0
+        batch = []
+        for indicator in indicators:
+            scale = 10 ** rng.randint(0, 6)
+            for country in rng.sample(countries, countries_per_indicator):
+                for period in rng.sample(PERIODS, periods_per_series):
+                    row_id += 1
+                    value = None if rng.random() < 0.05 else f"{rng.uniform(0, scale):.2f}"
+                    batch.append((
+                        row_id, indicator['id'], indicator['name'], indicator['description'],
+                        *country, period, value, indicator['unit'],
+                    ))
+            if len(batch) >= 50000:
+                conn.executemany("INSERT INTO Information VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO Information VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        conn.commit()
+    finally:
+        conn.close()
+    
+    return {'indicators': indicators, 'countries': countries, 'rows': row_id}
+
+
+def generate_few_shots(path: str, indicators: List[Dict], countries: List[tuple],
+                       n: int = 100, seed: int = 0):
+    """
+    Write a synthetic few-shot file in the {"FewShots": [{"input", "query"}]} format
+    
+    Args:
+        path: Output JSON file
+        indicators: Indicators returned by generate_database()
+        countries: Countries returned by generate_database()
+        n: Number of examples
+        seed: Random seed
+    """
+    rng = random.Random(seed)
+    examples = []
+    for i in range(n):
+        question, query = FEW_SHOT_TEMPLATES[i % len(FEW_SHOT_TEMPLATES)]
+        indicator = rng.choice(indicators)
+        country = rng.choice(countries)
+        values = {
+            'indicator': indicator['name'],
+            'indicator_id': indicator['id'],
+            'country': country[1],
+            'region': country[2],
+            'year': rng.choice(PERIODS[:10]),
+        }
+        examples.append({'input': question.format(**values), 'query': query.format(**values)})
+    
+    with open(path, 'w') as f:
+        json.dump({'FewShots': examples}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic World Bank database and few-shot file")
+    parser.add_argument('--db', required=True, help="Output SQLite file")
+    parser.add_argument('--few-shots', help="Output few-shot JSON file")
+    parser.add_argument('--scale', choices=sorted(SCALES), help="Preset size, overrides the counts below")
+    parser.add_argument('--indicators', type=int, default=1000)
+    parser.add_argument('--countries', type=int, default=12)
+    parser.add_argument('--countries-per-indicator', type=int, default=6)
+    parser.add_argument('--periods', type=int, default=10, help="Periods per indicator and country")
+    parser.add_argument('--examples', type=int, default=100, help="Number of few-shot examples")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    sizes = SCALES[args.scale] if args.scale else (
+        args.indicators, args.countries, args.countries_per_indicator, args.periods
+    )
+    generated = generate_database(args.db, *sizes, seed=args.seed)
+    print(f"Wrote {len(generated['indicators'])} indicators and {generated['rows']} rows to {args.db}")
+    if args.few_shots:
+        generate_few_shots(args.few_shots, generated['indicators'], generated['countries'],
+                           args.examples, args.seed)
+        print(f"Wrote {args.examples} few-shot examples to {args.few_shots}")
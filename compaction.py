@@ -0,0 +1,289 @@
+"""
+Token-budgeted compaction of SQL results before they are summarized
+"""
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+
+# Columns that identify a row but carry no information for the summary
+DROPPED_COLUMNS = ('id',)
+
+# Long descriptive columns that are repeated for every row of an indicator or country
+VERBOSE_COLUMNS = ('indicator_description', 'country_id', 'country_lendingtype')
+
+# Stated before results the row or byte cap cut short, so the summary does not present them as complete
+PARTIAL_NOTE = ("Partial data: the query matched more rows than could be fetched, only the first "
+                "{rows} were retrieved, so some indicators, countries or years may be missing.")
+
+# Progressively coarser groupings used when the rows do not fit the budget
+AGGREGATION_LEVELS = (
+    ('indicator_name', 'country_name'),
+    ('indicator_name', 'country_region'),
+    ('indicator_name', 'country_incomelevel'),
+    ('indicator_name', 'year'),
+    ('indicator_name',),
+)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    """Load the tiktoken encoding for a model, or None if it cannot be loaded (e.g. offline)"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        try:
+            return tiktoken.get_encoding('cl100k_base')
+        except Exception:
+            return None
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str = 'gpt-4o-mini') -> int:
+    """
+    Count the tokens of a text for a model
+    
+    Falls back to an estimate of four characters per token when no
+    tiktoken encoding is available.
+    
+    Args:
+        text: Text to measure
+        model: Model name used to pick the encoding
+    
+    Returns:
+        Number of tokens
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _is_null(value) -> bool:
+    """Whether a cell is empty for summarization purposes"""
+    if value is None:
+        return True
+    if isinstance(value, float) and value != value:
+        return True
+    return isinstance(value, str) and value.strip().lower() in ('', 'null', 'none', 'nan')
+
+
+def _to_number(value) -> Optional[float]:
+    """Parse a numeric cell, returning None if it is not a number"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _format_number(value: float) -> str:
+    """Format a number compactly"""
+    return f"{value:.4g}" if abs(value) < 1e6 else f"{value:.4e}"
+
+
+def clean_rows(rows: List[Dict]) -> List[Dict]:
+    """
+    Drop identifier columns, NULL values and duplicate rows
+    
+    Args:
+        rows: Result rows as dictionaries
+    
+    Returns:
+        Cleaned rows in their original order
+    """
+    cleaned = []
+    seen = set()
+    for row in rows:
+        row = {k: v for k, v in row.items() if k not in DROPPED_COLUMNS}
+        if 'value' in row and _is_null(row['value']):
+            continue
+        if all(_is_null(v) for v in row.values()):
+            continue
+        key = tuple(row.items())
+        if key in seen:
+            continue
+        seen.add(key)
+        cleaned.append(row)
+    return cleaned
+
+
+def _render(rows: List[Dict], note: str = "") -> str:
+    """Render rows as a pipe-separated table with constant columns factored out"""
+    if not rows:
+        return "No rows."
+    
+    columns = list(rows[0].keys())
+    constant = OrderedDict(
+        (column, rows[0][column]) for column in columns
+        if len(rows) > 1 and all(row.get(column) == rows[0][column] for row in rows)
+    )
+    varying = [column for column in columns if column not in constant]
+    
+    lines = []
+    if note:
+        lines.append(note)
+    if constant:
+        lines.append("Same for all rows: " + "; ".join(f"{k} = {v}" for k, v in constant.items()))
+    if varying:
+        lines.append(" | ".join(varying))
+        lines.extend(" | ".join("" if _is_null(row.get(c)) else str(row.get(c)) for c in varying)
+                     for row in rows)
+    lines.append(f"({len(rows)} rows)")
+    return "\n".join(lines)
+
+
+def _year_key(year: str) -> tuple:
+    """Sort key comparing years as numbers, so text years do not sort lexically"""
+    match = re.match(r"\s*(\d+)", year)
+    return (int(match.group(1)) if match else float('inf'), year)
+
+
+def _aggregate(rows: List[Dict], keys: tuple) -> List[Dict]:
+    """Average the numeric 'value' over every other column, grouped by keys"""
+    groups = OrderedDict()
+    for row in rows:
+        number = _to_number(row.get('value'))
+        if number is None:
+            continue
+        group = groups.setdefault(tuple(row.get(k) for k in keys), {'values': [], 'years': [], 'unit': set()})
+        group['values'].append(number)
+        if not _is_null(row.get('year')):
+            group['years'].append(str(row['year']))
+        if not _is_null(row.get('unitofmeasure')):
+            group['unit'].add(row['unitofmeasure'])
+    
+    aggregated = []
+    for key_values, group in groups.items():
+        values = group['values']
+        row = dict(zip(keys, key_values))
+        row['avg_value'] = _format_number(sum(values) / len(values))
+        row['min_value'] = _format_number(min(values))
+        row['max_value'] = _format_number(max(values))
+        if group['years'] and 'year' not in keys:
+            row['years'] = f"{min(group['years'], key=_year_key)}-{max(group['years'], key=_year_key)}"
+        if group['unit']:
+            row['unitofmeasure'] = ", ".join(sorted(group['unit']))
+        row['n'] = len(values)
+        aggregated.append(row)
+    return aggregated
+
+
+def compact_rows(rows: List[Dict], token_budget: int,
+                 counter: Callable[[str], int] = count_tokens) -> str:
+    """
+    Render result rows as compact text that fits a token budget
+    
+    NULL and duplicate rows are dropped and constant columns are stated
+    once. If the table is still too large, verbose descriptive columns are
+    removed, then values are averaged per progressively coarser groups
+    (indicator and country, region, income level, year, indicator). As a
+    last resort the rendered table is cut to the budget.
+    
+    Args:
+        rows: Result rows as dictionaries
+        token_budget: Maximum number of tokens for the rendered text
+        counter: Function counting the tokens of a text
+    
+    Returns:
+        Compact text representation of the rows
+    """
+    rows = clean_rows(rows)
+    text = _render(rows)
+    if counter(text) <= token_budget:
+        return text
+    
+    rows = [{k: v for k, v in row.items() if k not in VERBOSE_COLUMNS} for row in rows]
+    text = _render(rows)
+    if counter(text) <= token_budget:
+        return text
+    
+    if 'indicator_name' not in (rows[0] if rows else {}) and rows and 'indicator_id' in rows[0]:
+        rows = [{**row, 'indicator_name': row['indicator_id']} for row in rows]
+    
+    for keys in AGGREGATION_LEVELS:
+        if not rows or not all(k in rows[0] for k in keys):
+            continue
+        aggregated = _aggregate(rows, keys)
+        if not aggregated:
+            break
+        text = _render(aggregated, note=f"Averaged per {', '.join(keys)} from {len(rows)} rows:")
+        if counter(text) <= token_budget:
+            return text
+    
+    return truncate_to_budget(text, token_budget, counter)
+
+
+def truncate_to_budget(text: str, token_budget: int,
+                       counter: Callable[[str], int] = count_tokens) -> str:
+    """
+    Cut text at a line boundary so it fits a token budget
+    
+    Args:
+        text: Text to shorten
+        token_budget: Maximum number of tokens
+        counter: Function counting the tokens of a text
+    
+    Returns:
+        Text that fits the budget, with a note if lines were removed
+    """
+    if counter(text) <= token_budget:
+        return text
+    
+    lines = text.split("\n")
+    low, high = 0, len(lines)
+    while low < high:
+        middle = (low + high + 1) // 2
+        candidate = "\n".join(lines[:middle]) + "\n(truncated)"
+        if counter(candidate) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    return "\n".join(lines[:low]) + "\n(truncated)"
+
+
+def compact_results(tables: List[List[Dict]], token_budget: int,
+                    counter: Callable[[str], int] = count_tokens) -> str:
+    """
+    Compact the results of several queries into one text within a token budget
+    
+    Tables with the same columns are merged before compaction and the
+    budget is shared evenly between the remaining groups. A group with a
+    table the row or byte cap cut short starts with a note that the data
+    is partial.
+    
+    Args:
+        tables: Result rows of each query
+        token_budget: Maximum number of tokens for the combined text
+        counter: Function counting the tokens of a text
+    
+    Returns:
+        Compact text representation of all results
+    """
+    groups = OrderedDict()
+    partial = set()
+    for rows in tables:
+        if rows:
+            columns = tuple(rows[0].keys())
+            groups.setdefault(columns, []).extend(rows)
+            if getattr(rows, 'truncated', False):
+                partial.add(columns)
+    if not groups:
+        return ""
+    
+    share = max(1, token_budget // len(groups))
+    texts = []
+    for columns, rows in groups.items():
+        if columns in partial:
+            note = PARTIAL_NOTE.format(rows=len(rows))
+            texts.append(note + "\n" + compact_rows(rows, max(1, share - counter(note)), counter))
+        else:
+            texts.append(compact_rows(rows, share, counter))
+    return "\n\n".join(texts)
@@ -18,17 +18,104 @@ class Config:
     
     # Few-shot examples path
     FEW_SHOTS_JSON_PATH = os.getenv('FEW_SHOTS_JSON_PATH', 'data/Worldbankfewshots.json')
+    # Persisted FAISS index (defaults to a folder next to the JSON file)
+    FEW_SHOTS_INDEX_DIR = os.getenv('FEW_SHOTS_INDEX_DIR')
     
     # Model configuration
     CHAT_MODEL = os.getenv('CHAT_MODEL', 'gpt-4o')
     SUMMARY_MODEL = os.getenv('SUMMARY_MODEL', 'gpt-4o-mini')
     TEMPERATURE = float(os.getenv('TEMPERATURE', '0.1'))
     
+    # Maximum tokens of query results passed to the summary model
+    SUMMARY_TOKEN_BUDGET = int(os.getenv('SUMMARY_TOKEN_BUDGET', '2000'))
+    
+    # Rate-limit backoff for OpenAI calls
+    RATE_LIMIT_RETRIES = int(os.getenv('RATE_LIMIT_RETRIES', '5'))
+    RATE_LIMIT_BASE_DELAY = float(os.getenv('RATE_LIMIT_BASE_DELAY', '2'))
+    
+    # Client-side OpenAI limits per process as "model=limit" lists; models not listed are not throttled
+    LLM_TOKENS_PER_MINUTE = os.getenv(
+        'LLM_TOKENS_PER_MINUTE', 'gpt-4o=30000,gpt-4o-mini=200000,text-embedding-ada-002=1000000'
+    )
+    LLM_REQUESTS_PER_MINUTE = os.getenv(
+        'LLM_REQUESTS_PER_MINUTE', 'gpt-4o=500,gpt-4o-mini=500,text-embedding-ada-002=3000'
+    )
+    
+    # Column catalog generated from the database for the agent prompt
+    SCHEMA_CATALOG_PATH = os.getenv('SCHEMA_CATALOG_PATH', 'data/schema_catalog.json')
+    # Columns with more distinct values are described by a count and examples
+    SCHEMA_CATALOG_MAX_VALUES = int(os.getenv('SCHEMA_CATALOG_MAX_VALUES', '60'))
+    
     # Indicator search configuration
     TOP_N_INDICATORS = int(os.getenv('TOP_N_INDICATORS', '5'))
+    INDICATOR_INDEX_DIR = os.getenv('INDICATOR_INDEX_DIR', 'data/indicator_index')
+    # Share of indicators changed since the last full build above which the index is rebuilt
+    INDICATOR_INDEX_REBUILD_DRIFT = float(os.getenv('INDICATOR_INDEX_REBUILD_DRIFT', '0.2'))
+    
+    # Deterministic SQL for questions naming indicators, places and years
+    FAST_PATH_ENABLED = os.getenv('FAST_PATH_ENABLED', 'true').lower() == 'true'
+    # Lowest indicator search score answered without the agent
+    FAST_PATH_MIN_SCORE = float(os.getenv('FAST_PATH_MIN_SCORE', '0.3'))
+    # Indicators scoring at least this share of the best score are queried too
+    FAST_PATH_SCORE_RATIO = float(os.getenv('FAST_PATH_SCORE_RATIO', '0.9'))
+    FAST_PATH_MAX_INDICATORS = int(os.getenv('FAST_PATH_MAX_INDICATORS', '3'))
+    
+    # Repair and check the agent's SQL locally instead of with the model-based query checker
+    SQL_VALIDATION_ENABLED = os.getenv('SQL_VALIDATION_ENABLED', 'true').lower() == 'true'
     
     # Query limits
     DEFAULT_LIMIT = int(os.getenv('DEFAULT_LIMIT', '150'))
+    DB_MAX_RESULT_BYTES = int(os.getenv('DB_MAX_RESULT_BYTES', str(1024 * 1024)))
+    DB_QUERY_TIMEOUT = float(os.getenv('DB_QUERY_TIMEOUT', '10'))
+    DB_FETCH_BATCH_SIZE = int(os.getenv('DB_FETCH_BATCH_SIZE', '50'))
+    DB_PROGRESS_STEPS = int(os.getenv('DB_PROGRESS_STEPS', '10000'))
+    
+    # SQLite connection pool and pragmas
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_POOL_MAX_OVERFLOW = int(os.getenv('DB_POOL_MAX_OVERFLOW', '10'))
+    DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+    DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', str(64 * 1024)))
+    
+    # SQL result cache configuration
+    SQL_CACHE_ENABLED = os.getenv('SQL_CACHE_ENABLED', 'true').lower() == 'true'
+    SQL_CACHE_MAX_BYTES = int(os.getenv('SQL_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    SQL_CACHE_MAX_ENTRIES = int(os.getenv('SQL_CACHE_MAX_ENTRIES', '1024'))
+    
+    # Answer cache configuration
+    ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+    ANSWER_CACHE_PATH = os.getenv('ANSWER_CACHE_PATH', 'data/answer_cache.db')
+    ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', str(24 * 60 * 60)))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '5000'))
+    ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.95'))
+    
+    # Service mode configuration
+    SERVICE_HOST = os.getenv('SERVICE_HOST', '127.0.0.1')
+    SERVICE_PORT = int(os.getenv('SERVICE_PORT', '8000'))
+    SERVICE_MAX_CONCURRENCY = int(os.getenv('SERVICE_MAX_CONCURRENCY', '4'))
+    SERVICE_QUEUE_TIMEOUT = float(os.getenv('SERVICE_QUEUE_TIMEOUT', '30'))
+    SERVICE_RELOAD_INTERVAL = float(os.getenv('SERVICE_RELOAD_INTERVAL', '10'))
+    
+    # Per-query pipeline stage timeouts in seconds
+    STAGE_TIMEOUT_RETRIEVAL = float(os.getenv('STAGE_TIMEOUT_RETRIEVAL', '30'))
+    STAGE_TIMEOUT_AGENT = float(os.getenv('STAGE_TIMEOUT_AGENT', '300'))
+    STAGE_TIMEOUT_SUMMARY = float(os.getenv('STAGE_TIMEOUT_SUMMARY', '60'))
+    # Threads running blocking stages for all concurrent queries; most of them
+    # wait on the model, so there must be enough that interactive queries do
+    # not queue behind batch queries held by the LLM scheduler
+    PIPELINE_STAGE_THREADS = int(os.getenv('PIPELINE_STAGE_THREADS', '64'))
+    
+    # Logging and metrics
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_PROM_PATH = os.getenv('METRICS_PROM_PATH')
+    
+    # Batch mode configuration
+    BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+    
+    # Worker processes configuration (pre-forked workers sharing the indexes)
+    WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '1'))
+    WORKER_THREADS = int(os.getenv('WORKER_THREADS', '4'))
     
     @classmethod
     def validate(cls):
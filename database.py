@@ -0,0 +1,447 @@
+"""
+Database access helpers shared by the agent and the pipeline
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Literal, Optional, Sequence
+from langchain.sql_database import SQLDatabase
+from langchain_community.utilities.sql_database import truncate_word
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+from config import Config
+from metrics import metrics
+from sql_cache import SQLResultCache, is_read_query, normalize_sql
+from utils import file_fingerprint
+
+
+# Database path -> (engine, fingerprint of the file when the engine was created)
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune a new SQLite connection for read-only analytical queries"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA query_only = ON")
+        cursor.execute(f"PRAGMA mmap_size = {int(Config.DB_MMAP_SIZE)}")
+        # A negative cache_size is interpreted by SQLite as KiB
+        cursor.execute(f"PRAGMA cache_size = -{int(Config.DB_CACHE_SIZE_KB)}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+    finally:
+        cursor.close()
+    
+    # The progress handler aborts a statement once its deadline has passed
+    state = {'deadline': None}
+    
+    def check_deadline():
+        deadline = state['deadline']
+        return 1 if deadline is not None and time.monotonic() > deadline else 0
+    
+    dbapi_connection.set_progress_handler(check_deadline, Config.DB_PROGRESS_STEPS)
+    connection_record.info['query_state'] = state
+
+
+def _start_query_clock(conn, cursor, statement, parameters, context, executemany):
+    """Give every statement its own time budget"""
+    state = conn.info.get('query_state')
+    if state is not None:
+        state['deadline'] = time.monotonic() + Config.DB_QUERY_TIMEOUT
+
+
+def _stop_query_clock(dbapi_connection, connection_record):
+    """Clear the deadline when a connection goes back to the pool"""
+    state = connection_record.info.get('query_state')
+    if state is not None:
+        state['deadline'] = None
+
+
+def database_file_fingerprint(db_path: str):
+    """
+    Fingerprint of a SQLite database file
+    
+    The write-ahead log is included because WAL-mode writes do not touch
+    the main file until a checkpoint.
+    
+    Args:
+        db_path: Path to the SQLite database file
+    
+    Returns:
+        Tuple of the file_fingerprint() of the database and of its WAL
+    """
+    return (file_fingerprint(db_path), file_fingerprint(db_path + '-wal'))
+
+
+def get_engine(db_path: str) -> Engine:
+    """
+    Get the shared read-only engine for a SQLite database
+    
+    Connections are opened in read-only URI mode with query_only, mmap and
+    cache pragmas, pooled for concurrent use, and interrupted when a single
+    statement runs longer than Config.DB_QUERY_TIMEOUT seconds. When the
+    file changed since the engine was created the engine is disposed and
+    replaced, since pooled connections keep reading a file that was
+    replaced on disk.
+    
+    Args:
+        db_path: Path to the SQLite database file
+    
+    Returns:
+        SQLAlchemy engine shared by every caller using the same path
+    """
+    db_path = os.path.abspath(db_path)
+    fingerprint = database_file_fingerprint(db_path)
+    with _engines_lock:
+        engine, engine_fingerprint = _engines.get(db_path, (None, None))
+        if engine is not None and engine_fingerprint != fingerprint:
+            engine.dispose()
+            engine = None
+        if engine is None:
+            engine = create_engine(
+                f"sqlite:///file:{db_path}?mode=ro&uri=true",
+                poolclass=QueuePool,
+                pool_size=Config.DB_POOL_SIZE,
+                max_overflow=Config.DB_POOL_MAX_OVERFLOW,
+                connect_args={'check_same_thread': False, 'timeout': Config.DB_QUERY_TIMEOUT}
+            )
+            event.listen(engine, 'connect', _set_sqlite_pragmas)
+            event.listen(engine, 'before_cursor_execute', _start_query_clock)
+            event.listen(engine, 'checkin', _stop_query_clock)
+            _engines[db_path] = (engine, fingerprint)
+        return engine
+
+
+def dispose_engines():
+    """
+    Forget the pooled connections of every shared engine without closing them
+    
+    Called in a forked worker process so it opens connections of its own
+    instead of using the parent's.
+    """
+    with _engines_lock:
+        for engine, _ in _engines.values():
+            engine.dispose(close=False)
+
+
+class _Rows(list):
+    """Result rows that remember whether the row or byte cap cut them short"""
+    truncated = False
+    
+    def to_json(self) -> str:
+        """Serialize the rows and the truncation flag for the result cache"""
+        return json.dumps({'rows': self, 'truncated': self.truncated}, default=str)
+    
+    @classmethod
+    def from_json(cls, data: str) -> "_Rows":
+        """Rebuild rows serialized by to_json()"""
+        data = json.loads(data)
+        rows = cls(data['rows'])
+        rows.truncated = data['truncated']
+        return rows
+
+
+class CachedSQLDatabase(SQLDatabase):
+    """SQLDatabase with cached schema reflection and query results, streamed fetches and hard result caps"""
+    
+    # Path of the SQLite file when the engine is the shared one from get_engine()
+    _shared_path = None
+    
+    def __init__(self, engine, sql_cache: SQLResultCache = None, **kwargs):
+        """
+        Initialize the database wrapper
+        
+        Args:
+            engine: SQLAlchemy engine
+            sql_cache: Cache for read query results, created from Config if not given
+            **kwargs: Arguments passed on to SQLDatabase
+        """
+        self.max_rows = Config.DEFAULT_LIMIT
+        self.max_result_bytes = Config.DB_MAX_RESULT_BYTES
+        if sql_cache is None and Config.SQL_CACHE_ENABLED:
+            sql_cache = SQLResultCache(Config.SQL_CACHE_MAX_BYTES, Config.SQL_CACHE_MAX_ENTRIES)
+        self.sql_cache = sql_cache
+        # SQLValidator applied to every query passed to run(), set by the agent
+        self.validator = None
+        self._init_kwargs = kwargs
+        self._schema_lock = threading.RLock()
+        # Row count and rows of the last run() in each thread, see last_row_count() and last_rows()
+        self._last_run = threading.local()
+        self._table_info_cache = {}
+        self._schema_fingerprint = None
+        super().__init__(engine, **kwargs)
+        self._schema_fingerprint = self.database_fingerprint()
+    
+    @classmethod
+    def from_uri(
+        cls, database_uri: str, engine_args: Optional[dict] = None, **kwargs: Any
+    ) -> "CachedSQLDatabase":
+        """Construct from a URI; SQLite files use the shared read-only engine."""
+        url = make_url(database_uri)
+        if (url.get_backend_name() == 'sqlite' and url.database
+                and url.database != ':memory:' and not engine_args):
+            return cls.from_path(url.database, **kwargs)
+        return super().from_uri(database_uri, engine_args, **kwargs)
+    
+    @classmethod
+    def from_path(cls, db_path: str, **kwargs: Any) -> "CachedSQLDatabase":
+        """
+        Create a database wrapper over the shared read-only engine for a SQLite file
+        
+        Args:
+            db_path: Path to the SQLite database file
+            **kwargs: Arguments passed on to the constructor
+        
+        Returns:
+            Database wrapper
+        """
+        db = cls(get_engine(db_path), **kwargs)
+        db._shared_path = db_path
+        return db
+    
+    def database_fingerprint(self):
+        """Fingerprint of the underlying database file (see database_file_fingerprint()), if it is file based"""
+        path = self._engine.url.database
+        if not path or path == ':memory:':
+            return None
+        if path.startswith('file:'):
+            path = path[len('file:'):]
+        return database_file_fingerprint(path)
+    
+    def _refresh_if_changed(self):
+        """
+        Reconnect, reflect the schema again and drop cached table info if the database changed
+        
+        The shared engine is replaced by a new one (see get_engine()) and
+        any other engine is disposed, so no pooled connection still reads
+        the previous file.
+        """
+        fingerprint = self.database_fingerprint()
+        if fingerprint == self._schema_fingerprint:
+            return
+        
+        with self._schema_lock:
+            if fingerprint == self._schema_fingerprint:
+                return
+            self._schema_fingerprint = None
+            if self._shared_path is not None:
+                self._engine = get_engine(self._shared_path)
+            else:
+                self._engine.dispose()
+            super().__init__(self._engine, **self._init_kwargs)
+            self._table_info_cache = {}
+            self._schema_fingerprint = fingerprint
+    
+    def get_usable_table_names(self) -> Iterable[str]:
+        """Get names of tables available."""
+        if self._schema_fingerprint is not None:
+            self._refresh_if_changed()
+        return super().get_usable_table_names()
+    
+    def get_table_info(self, table_names: Optional[List[str]] = None) -> str:
+        """Get information about specified tables, served from cache while the schema is unchanged."""
+        self._refresh_if_changed()
+        key = tuple(sorted(table_names)) if table_names is not None else None
+        
+        table_info = self._table_info_cache.get(key)
+        if table_info is None:
+            table_info = super().get_table_info(table_names)
+            with self._schema_lock:
+                self._table_info_cache[key] = table_info
+        return table_info
+    
+    def warm_up(self):
+        """
+        Load the schema of every usable table into the cache and open a pooled connection
+        
+        Called while the pipeline is being built so the first query does not
+        pay for schema reflection or connection setup.
+        """
+        table_names = list(self.get_usable_table_names())
+        self.get_table_info()
+        self.get_table_info(table_names)
+        for table_name in table_names:
+            self.get_table_info([table_name])
+        with self._engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    
+    def _execute(
+        self,
+        command: str,
+        fetch: Literal["all", "one"] = "all",
+        parameters: Dict[str, Any] = None,
+    ) -> Sequence[Dict[str, Any]]:
+        """
+        Execute a SQL command, streaming rows until the row or byte cap is reached
+        
+        Rows are fetched in batches so a query matching millions of rows
+        never materializes more than the cap in memory. Named parameters
+        of the command are bound from parameters.
+        """
+        if fetch not in ("all", "one"):
+            raise ValueError("Fetch parameter must be either 'one' or 'all'")
+        if self._schema_fingerprint is not None:
+            self._refresh_if_changed()
+        max_rows = 1 if fetch == "one" else self.max_rows
+        
+        rows = _Rows()
+        size = 0
+        with metrics.span('sql_execute') as span, self._engine.connect() as connection:
+            try:
+                cursor = connection.execute(text(command), parameters or {})
+                if not cursor.returns_rows:
+                    return rows
+                # Set once the row or byte cap is reached; only "all" reports the cut as truncation
+                full = False
+                while not full:
+                    batch = cursor.fetchmany(Config.DB_FETCH_BATCH_SIZE)
+                    if not batch:
+                        break
+                    for row in batch:
+                        if len(rows) >= max_rows or size >= self.max_result_bytes:
+                            full = True
+                            rows.truncated = fetch == "all"
+                            break
+                        row = row._asdict()
+                        size += sum(len(str(value)) for value in row.values())
+                        rows.append(row)
+                cursor.close()
+                span['rows'] = len(rows)
+                span['truncated'] = rows.truncated
+                metrics.inc('sql_rows_total', len(rows))
+            except OperationalError as e:
+                if 'interrupted' in str(e.orig):
+                    raise SQLAlchemyError(
+                        f"Query exceeded the {Config.DB_QUERY_TIMEOUT}s time budget; "
+                        f"add filters on indicator_id, country_name or year"
+                    ) from e
+                raise
+        return rows
+    
+    def _format_rows(self, result: Sequence[Dict[str, Any]], include_columns: bool = False) -> str:
+        """Format rows like SQLDatabase.run, noting when the result was truncated"""
+        res = [
+            {
+                column: truncate_word(value, length=self._max_string_length)
+                for column, value in r.items()
+            }
+            for r in result
+        ]
+        if not include_columns:
+            res = [tuple(row.values()) for row in res]
+        
+        if not res:
+            return ""
+        if getattr(result, 'truncated', False):
+            return (f"{res}\n(Result truncated to the first {len(res)} rows; "
+                    f"use filters, GROUP BY or LIMIT to narrow the query)")
+        return str(res)
+    
+    def run(
+        self,
+        command: str,
+        fetch: Literal["all", "one"] = "all",
+        include_columns: bool = False,
+    ) -> str:
+        """
+        Execute a SQL command and return a string representing the results, reusing cached read results.
+        
+        With a validator the command is repaired and checked first: a
+        rejected command raises SQLAlchemyError with the validator's hint,
+        and the repairs made are noted after the results. The number of
+        rows returned is available from last_row_count() afterwards, and
+        the rows themselves from last_rows().
+        """
+        self._last_run.row_count = None
+        self._last_run.rows = None
+        note = ""
+        if self.validator is not None:
+            checked = self.validator.validate(command)
+            metrics.inc('sql_validation_total',
+                        result='rejected' if checked['error'] else 'repaired' if checked['fixes'] else 'ok')
+            if checked['error']:
+                raise SQLAlchemyError(checked['error'])
+            command = checked['sql']
+            if checked['fixes']:
+                note = f"\n(Query adjusted before running: {'; '.join(checked['fixes'])})"
+        
+        if self.sql_cache is None or not is_read_query(command):
+            rows = self._execute(command, fetch)
+            self._last_run.row_count = len(rows)
+            self._last_run.rows = rows if fetch == "all" else None
+            return self._format_rows(rows, include_columns) + note
+        
+        normalized = normalize_sql(command)
+        key = (normalized, fetch, include_columns)
+        version = self.database_fingerprint()
+        cached = self.sql_cache.get(key, version)
+        metrics.inc('sql_cache_requests_total', result='miss' if cached is None else 'hit')
+        if cached is None:
+            rows = self._execute(command, fetch)
+            self._last_run.rows = rows if fetch == "all" else None
+            result, row_count = self._format_rows(rows, include_columns), len(rows)
+            self.sql_cache.put(key, version, json.dumps({'text': result, 'row_count': row_count}))
+            if fetch == "all":
+                # Keep the structured rows too, so fetch_table() after the agent run is free
+                self.sql_cache.put(('table', normalized), version, rows.to_json())
+        else:
+            cached = json.loads(cached)
+            result, row_count = cached['text'], cached['row_count']
+        self._last_run.row_count = row_count
+        return result + note
+    
+    def last_row_count(self) -> Optional[int]:
+        """
+        Number of rows the last run() in the calling thread returned
+        
+        Returns:
+            Row count, or None if that run() failed or none ran yet
+        """
+        return getattr(self._last_run, 'row_count', None)
+    
+    def last_rows(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Rows the last run() in the calling thread fetched from the database
+        
+        Returns:
+            Rows as returned by fetch_table(), or None if that run() failed,
+            fetched only one row or was answered from the result cache
+            (where fetch_table() finds them too)
+        """
+        return getattr(self._last_run, 'rows', None)
+    
+    def fetch_table(self, command: str, parameters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        Execute a read query and return its rows as dictionaries
+        
+        Shares the result cache with run(), so rows the agent already
+        fetched are not read from SQLite again. Queries without parameters
+        get the same repairs as in run().
+        
+        Args:
+            command: SQL query
+            parameters: Values of the query's named parameters
+        
+        Returns:
+            List of rows as column-to-value dictionaries; its 'truncated'
+            attribute is True when the row or byte cap cut the result short
+        """
+        if self.validator is not None and not parameters:
+            command, _ = self.validator.repair(command)
+        if self.sql_cache is None or not is_read_query(command):
+            return self._execute(command, parameters=parameters)
+        
+        key = ('table', normalize_sql(command))
+        if parameters:
+            key += (tuple(sorted(parameters.items())),)
+        version = self.database_fingerprint()
+        cached = self.sql_cache.get(key, version)
+        if cached is not None:
+            return _Rows.from_json(cached)
+        
+        rows = self._execute(command, parameters=parameters)
+        self.sql_cache.put(key, version, rows.to_json())
+        return rows
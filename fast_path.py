@@ -0,0 +1,267 @@
+"""
+Deterministic SQL planner for questions that name indicators, places and years
+"""
+import datetime
+import re
+from typing import Callable, Dict, List, Optional
+from config import Config
+from schema_catalog import TABLE_NAME
+
+
+# Questions asking for rankings, aggregates or comparisons across all
+# countries need SQL the fast path does not write, so they go to the agent
+AGENT_TERMS = (
+    'rank', 'ranking', 'ranked', 'highest', 'lowest', 'top', 'bottom', 'most', 'least',
+    'best', 'worst', 'average', 'mean', 'median', 'maximum', 'minimum', 'how many',
+    'count', 'correlation', 'correlate', 'correlated', 'ratio', 'latest', 'most recent',
+    'which countries', 'which country', 'all countries', 'every country', 'each country',
+    'except', 'excluding', 'other than', 'quarter', 'quarterly',
+)
+
+# ISO3 country codes that are also English words; written in capitals
+# they are more likely emphasis than a country
+CODE_WORDS = (
+    'AND', 'ARE', 'ARM', 'CAN', 'COD', 'CUB', 'FIN', 'GAB', 'GIN', 'GUM', 'HUN', 'LIE',
+    'MAC', 'MAR', 'NOR', 'PAN', 'PER', 'TON', 'TUN', 'VAT',
+)
+
+RESULT_COLUMNS = ('indicator_id', 'indicator_name', 'country_name', 'year', 'value', 'unitofmeasure')
+
+_AGENT_TERMS = re.compile(r"\b(" + "|".join(re.escape(term) for term in AGENT_TERMS) + r")\b")
+_YEAR = r"(1[89]\d{2}|20\d{2}|2100)"
+_YEAR_RANGE = re.compile(
+    rf"\b(?:between\s+{_YEAR}\s+and\s+{_YEAR}|{_YEAR}\s*(?:-|–|to|until|through)\s*{_YEAR})\b"
+)
+_YEAR_SINCE = re.compile(rf"\b(since|from|after|starting)\s+(?:in\s+)?{_YEAR}\b")
+_YEAR_BEFORE = re.compile(rf"\b(before|until|up to|through)\s+{_YEAR}\b")
+_YEAR_SINGLE = re.compile(rf"\b{_YEAR}\b")
+_LAST_YEARS = re.compile(r"\b(?:last|past|previous)\s+(\d{1,2})\s+years\b")
+_COUNTRY_CODE = re.compile(r"\b[A-Z]{3}\b")
+
+
+def _phrase_pattern(phrases: List[str]) -> re.Pattern:
+    """Regex matching any of the phrases as whole words, longest first"""
+    alternatives = sorted({phrase for phrase in phrases if phrase}, key=len, reverse=True)
+    if not alternatives:
+        return re.compile(r"(?!x)x")
+    return re.compile(r"(?<!\w)(" + "|".join(re.escape(p) for p in alternatives) + r")(?!\w)")
+
+
+class FastPathPlanner:
+    """
+    Builds a parameterized SELECT over the Information table without the agent
+    
+    A question is planned when indicator search found a confident match and
+    the question names at least one country, region or income level from
+    the schema catalog, optionally with years or a year range. Anything
+    else, such as rankings, aggregates or questions without a place, is
+    left to the SQL agent.
+    """
+    
+    def __init__(self, catalog: Dict, min_score: float = None, score_ratio: float = None,
+                 max_indicators: int = None):
+        """
+        Index the places and years of the schema catalog
+        
+        Args:
+            catalog: Schema catalog, see schema_catalog.build_schema_catalog()
+            min_score: Lowest indicator search score planned, defaults to Config.FAST_PATH_MIN_SCORE
+            score_ratio: Indicators scoring at least this share of the best
+                score are queried too, defaults to Config.FAST_PATH_SCORE_RATIO
+            max_indicators: Most indicators queried, defaults to Config.FAST_PATH_MAX_INDICATORS
+        """
+        self.min_score = min_score if min_score is not None else Config.FAST_PATH_MIN_SCORE
+        self.score_ratio = score_ratio if score_ratio is not None else Config.FAST_PATH_SCORE_RATIO
+        self.max_indicators = max_indicators or Config.FAST_PATH_MAX_INDICATORS
+        
+        self.country_ids = {}
+        for country_id, name in catalog['countries']:
+            self.country_ids[str(name).lower()] = country_id
+        self.country_codes = {str(country_id).upper(): country_id for country_id, _ in catalog['countries']}
+        self.regions = self._aliases(catalog['values'].get('country_region', []))
+        self.income_levels = self._aliases(catalog['values'].get('country_incomelevel', []))
+        self.annual_years = sorted(int(year) for year in catalog['years'] if re.fullmatch(r"\d{4}", year))
+        
+        self._countries = _phrase_pattern(list(self.country_ids))
+        self._regions = _phrase_pattern(list(self.regions))
+        self._income_levels = _phrase_pattern(list(self.income_levels))
+    
+    @staticmethod
+    def _aliases(values: List[str]) -> Dict[str, str]:
+        """Map lowercase spellings, with '&' also written as 'and', to the stored value"""
+        aliases = {}
+        for value in values:
+            lowered = str(value).lower()
+            aliases[lowered] = value
+            aliases[lowered.replace('&', 'and')] = value
+            aliases[lowered.replace(' ', '-')] = value
+        return aliases
+    
+    def _years(self, query: str) -> List[int]:
+        """
+        Annual years the question asks for, or None if it names no years
+        
+        Years without data are dropped, so an empty list means the question
+        asks only for years the database does not have.
+        """
+        wanted = set()
+        if self.annual_years:
+            # Relative ranges end at the latest year with data, not at target years
+            this_year = datetime.date.today().year
+            latest = max([year for year in self.annual_years if year <= this_year] or self.annual_years)
+            for match in _LAST_YEARS.finditer(query):
+                wanted.update(range(latest - int(match.group(1)) + 1, latest + 1))
+        for match in _YEAR_RANGE.finditer(query):
+            low, high = sorted(int(year) for year in match.groups() if year)
+            wanted.update(range(low, high + 1))
+        query = _YEAR_RANGE.sub(" ", query)
+        for match in _YEAR_SINCE.finditer(query):
+            start = int(match.group(2)) + (match.group(1) == 'after')
+            wanted.update(year for year in self.annual_years if year >= start)
+        for match in _YEAR_BEFORE.finditer(query):
+            end = int(match.group(2)) - (match.group(1) == 'before')
+            wanted.update(year for year in self.annual_years if year <= end)
+        query = _YEAR_BEFORE.sub(" ", _YEAR_SINCE.sub(" ", query))
+        wanted.update(int(year) for year in _YEAR_SINGLE.findall(query))
+        
+        if not wanted:
+            return None
+        return sorted(wanted & set(self.annual_years))
+    
+    def _places(self, query: str) -> Dict[str, List[str]]:
+        """Countries, regions and income levels a question names, in order of appearance"""
+        lowered = query.lower()
+        countries = [self.country_ids[name] for name in self._countries.findall(lowered)]
+        # A code stands out only in a question that is not written in capitals throughout
+        if query != query.upper():
+            countries += [self.country_codes[code] for code in _COUNTRY_CODE.findall(query)
+                          if code in self.country_codes and code not in CODE_WORDS]
+        return {
+            'countries': list(dict.fromkeys(countries)),
+            'regions': list(dict.fromkeys(self.regions[m] for m in self._regions.findall(lowered))),
+            'income_levels': list(dict.fromkeys(
+                self.income_levels[m] for m in self._income_levels.findall(lowered)
+            )),
+        }
+    
+    def entities(self, query: str,
+                 unknown_terms: Optional[Callable[[str], List[str]]] = None) -> Dict:
+        """
+        Places and years a question names, independent of their order
+        
+        Two questions asking for the same indicators about different places
+        or years can be almost identical as text, so the answer cache only
+        treats questions with equal entities as near-duplicates. A question
+        naming no known place may still name one the catalog lacks (e.g.
+        'UK'), so its words unknown to the similarity vectorizer are
+        included as well.
+        
+        Args:
+            query: Natural language question, as asked (country codes are
+                only recognized in their original case)
+            unknown_terms: Callable returning the words of a question the
+                similarity vectorizer does not know
+        
+        Returns:
+            Dictionary with the sorted 'countries', 'regions', 'income_levels'
+            and 'years' (None if no years are named), plus the
+            'unknown_terms' when no place was recognized
+        """
+        places = self._places(query)
+        entities = {name: sorted(values) for name, values in places.items()}
+        entities['years'] = self._years(query.lower())
+        if unknown_terms is not None and not any(places.values()):
+            entities['unknown_terms'] = sorted(unknown_terms(query))
+        return entities
+    
+    def plan(self, query: str, indicators: List[Dict]) -> Dict:
+        """
+        Plan the SQL for a question
+        
+        Args:
+            query: Natural language question
+            indicators: Output of IndicatorSearch.search_results()
+        
+        Returns:
+            Dictionary with the 'sql' and its bound 'parameters', the
+            'indicator_ids', 'countries', 'regions', 'income_levels' and
+            'years' it filters on, and the top indicator 'score'. When the
+            question should go to the agent instead, 'sql' is None and
+            'fallback' gives the reason.
+        """
+        lowered = query.lower()
+        plan = {
+            'sql': None, 'parameters': {}, 'indicator_ids': [], 'countries': [], 'regions': [],
+            'income_levels': [], 'years': None, 'score': indicators[0]['score'] if indicators else 0.0,
+            'fallback': None,
+        }
+        
+        if not indicators or plan['score'] < self.min_score:
+            plan['fallback'] = 'no confident indicator match'
+            return plan
+        term = _AGENT_TERMS.search(lowered)
+        if term:
+            plan['fallback'] = f"question asks for '{term.group(1)}'"
+            return plan
+        
+        plan.update(self._places(query))
+        if not (plan['countries'] or plan['regions'] or plan['income_levels']):
+            plan['fallback'] = 'no country, region or income level named'
+            return plan
+        
+        plan['years'] = self._years(lowered)
+        if plan['years'] == []:
+            plan['fallback'] = 'no data for the requested years'
+            return plan
+        
+        threshold = plan['score'] * self.score_ratio
+        plan['indicator_ids'] = [
+            result['id'] for result in indicators if result['score'] >= threshold
+        ][:self.max_indicators]
+        
+        plan['sql'], plan['parameters'] = self._build_sql(plan)
+        return plan
+    
+    @staticmethod
+    def _build_sql(plan: Dict) -> (str, Dict):
+        """
+        Build the SELECT statement with one bound parameter per value
+        
+        Returns:
+            Tuple of (SQL text, parameters)
+        """
+        parameters = {}
+        
+        def placeholders(name: str, values: List) -> str:
+            names = []
+            for i, value in enumerate(values):
+                parameters[f"{name}_{i}"] = value
+                names.append(f":{name}_{i}")
+            return ", ".join(names)
+        
+        conditions = [f"indicator_id IN ({placeholders('indicator', plan['indicator_ids'])})"]
+        
+        # Named countries are added to the countries of the named regions and income levels
+        places = []
+        if plan['countries']:
+            places.append(f"country_id IN ({placeholders('country', plan['countries'])})")
+        groups = []
+        if plan['regions']:
+            groups.append(f"country_region IN ({placeholders('region', plan['regions'])})")
+        if plan['income_levels']:
+            groups.append(f"country_incomelevel IN ({placeholders('income', plan['income_levels'])})")
+        if groups:
+            places.append("(" + " AND ".join(groups) + ")")
+        conditions.append("(" + " OR ".join(places) + ")")
+        
+        if plan['years']:
+            conditions.append(f"year IN ({placeholders('year', [str(y) for y in plan['years']])})")
+        conditions.append("value IS NOT NULL")
+        
+        # One row over the fetch cap, so a result cut short is flagged as truncated
+        sql = (
+            f"SELECT DISTINCT {', '.join(RESULT_COLUMNS)} FROM {TABLE_NAME} "
+            f"WHERE {' AND '.join(conditions)} "
+            f"ORDER BY indicator_id, country_name, year DESC LIMIT {int(Config.DEFAULT_LIMIT) + 1}"
+        )
+        return sql, parameters
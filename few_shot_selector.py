@@ -1,55 +1,201 @@
 """
 Few-shot example selector using semantic similarity
 """
+import hashlib
 import json
+import logging
+import os
+import shutil
 from typing import List, Dict
 from langchain_community.vectorstores import FAISS
-from langchain_core.example_selectors import SemanticSimilarityExampleSelector
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
 from config import Config
+from llm_scheduler import estimate_tokens, scheduler
+from metrics import metrics
+from utils import replace_directory
+
+
+logger = logging.getLogger(__name__)
 
 
 class FewShotSelector:
     """Manages few-shot example selection based on semantic similarity"""
     
-    def __init__(self, json_path: str = None, api_key: str = None):
+    def __init__(self, json_path: str = None, api_key: str = None,
+                 embeddings: Embeddings = None, index_dir: str = None):
         """
         Initialize the few-shot selector
         
         Args:
             json_path: Path to JSON file containing examples
             api_key: OpenAI API key
+            embeddings: Embedding model, defaults to OpenAIEmbeddings
+            index_dir: Directory holding the persisted FAISS index,
+                defaults to a folder next to the JSON file
         """
         self.json_path = json_path or Config.FEW_SHOTS_JSON_PATH
         self.api_key = api_key or Config.OPENAI_API_KEY
+        if embeddings is None:
+            from langchain_openai import OpenAIEmbeddings
+            embeddings = OpenAIEmbeddings(api_key=self.api_key, max_retries=0)
+        self.embeddings = embeddings
+        self.index_dir = (
+            index_dir or Config.FEW_SHOTS_INDEX_DIR
+            or os.path.splitext(self.json_path)[0] + '_faiss'
+        )
         self.examples = self._load_examples()
-        
+        self.vectorstore = self._load_or_build_index()
+    
     def _load_examples(self) -> List[Dict]:
         """Load examples from JSON file"""
         with open(self.json_path, 'r') as f:
             json_obj = json.load(f)
             return json_obj['FewShots']
     
+    @staticmethod
+    def _example_hash(example: Dict) -> str:
+        """
+        Compute a content hash identifying an example
+        
+        Args:
+            example: Example dictionary
+        
+        Returns:
+            Hex digest of the example contents
+        """
+        payload = json.dumps(example, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _embedder_id(self) -> str:
+        """Identify the embedding model so vectors from another model are never reused"""
+        model = getattr(self.embeddings, 'model', None)
+        name = type(self.embeddings).__name__
+        return f"{name}:{model}" if model else name
+    
+    def _embedding_model(self) -> str:
+        """Model name the embedding calls are scheduled under"""
+        return getattr(self.embeddings, 'model', None) or type(self.embeddings).__name__
+    
+    def _load_or_build_index(self):
+        """
+        Load the persisted FAISS index and bring it in sync with the examples file
+        
+        Only examples whose content hash is not in the index are embedded;
+        entries for removed or edited examples are deleted.
+        
+        Returns:
+            FAISS vector store, or None if there are no examples
+        """
+        current = {self._example_hash(example): example for example in self.examples}
+        vectorstore = self._load_index()
+        changed = False
+        
+        if vectorstore is not None:
+            stored_ids = set(vectorstore.index_to_docstore_id.values())
+            removed = [doc_id for doc_id in stored_ids if doc_id not in current]
+            if len(removed) == len(stored_ids):
+                vectorstore, stored_ids = None, set()
+            elif removed:
+                vectorstore.delete(removed)
+                changed = True
+        else:
+            stored_ids = set()
+        
+        added = [doc_id for doc_id in current if doc_id not in stored_ids]
+        if added:
+            texts = [current[doc_id]['input'] for doc_id in added]
+            with metrics.span('few_shot_embed', examples=len(texts)):
+                vectors = scheduler.call(
+                    self._embedding_model(), lambda: self.embeddings.embed_documents(texts),
+                    tokens=sum(estimate_tokens(text) for text in texts)
+                )
+            metadatas = [current[doc_id] for doc_id in added]
+            if vectorstore is None:
+                vectorstore = FAISS.from_embeddings(
+                    list(zip(texts, vectors)), self.embeddings, metadatas=metadatas, ids=added
+                )
+            else:
+                vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=added)
+            changed = True
+            logger.info(f"Embedded {len(added)} new or changed few-shot examples")
+        
+        if changed and vectorstore is not None:
+            try:
+                self._save_index(vectorstore)
+            except OSError as e:
+                logger.warning(f"Could not save few-shot index to {self.index_dir}: {e}")
+        
+        return vectorstore
+    
+    def _load_index(self):
+        """
+        Load the persisted FAISS index from disk
+        
+        Returns:
+            FAISS vector store, or None if missing or built with another embedder
+        """
+        meta_path = os.path.join(self.index_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta.get('embedder') != self._embedder_id():
+                return None
+            return FAISS.load_local(self.index_dir, self.embeddings)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable few-shot index in {self.index_dir}: {e}")
+            return None
+    
+    def _save_index(self, vectorstore: FAISS):
+        """
+        Persist the FAISS index next to the examples file
+        
+        Args:
+            vectorstore: FAISS vector store to save
+        """
+        tmp_dir = f"{self.index_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        vectorstore.save_local(tmp_dir)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'embedder': self._embedder_id()}, f)
+        replace_directory(tmp_dir, self.index_dir)
+    
+    def use_embeddings(self, embeddings: Embeddings):
+        """
+        Embed queries with another client of the same model, e.g. one owned by a worker process
+        
+        Args:
+            embeddings: Embedding model the index was built with
+        """
+        self.embeddings = embeddings
+        if self.vectorstore is not None:
+            self.vectorstore.embedding_function = embeddings
+    
     def select_examples(self, query: str, k: int = 5) -> List[Dict]:
         """
         Select the most relevant few-shot examples for a query
         
+        The query embedding goes through the LLM scheduler, so concurrent
+        requests for the same query share one embedding call.
+        
         Args:
             query: User query to match against
             k: Number of examples to return
-            
+        
         Returns:
             List of selected example dictionaries
         """
-        example_selector = SemanticSimilarityExampleSelector.from_examples(
-            self.examples,
-            OpenAIEmbeddings(api_key=self.api_key),
-            FAISS,
-            k=k,
-            input_keys=["input"]
-        )
+        if self.vectorstore is None:
+            return []
         
-        return example_selector.select_examples({"input": query})
+        vector = scheduler.call(
+            self._embedding_model(), lambda: self.embeddings.embed_query(query),
+            tokens=estimate_tokens(query), key=('embed_query', query)
+        )
+        example_docs = self.vectorstore.similarity_search_by_vector(vector, k=k)
+        return [dict(doc.metadata) for doc in example_docs]
     
     @staticmethod
     def format_examples(examples: List[Dict]) -> str:
@@ -58,7 +204,7 @@ class FewShotSelector:
         
         Args:
             examples: List of example dictionaries
-            
+        
         Returns:
             Formatted string of examples
         """
@@ -66,4 +212,4 @@ class FewShotSelector:
         for shot in examples:
             formatted += f"input: {shot['input']}\n"
             formatted += f"query: {shot['query']}\n\n"
-        return formatted
\ No newline at end of file
+        return formatted
@@ -0,0 +1,128 @@
+"""
+Compact in-memory catalog of the Indicator table
+"""
+import hashlib
+from typing import Iterable, Iterator, Tuple
+import numpy as np
+
+
+# Indicator columns used for retrieval, in the order they are selected
+CATALOG_COLUMNS = ('id', 'name', 'description', 'source', 'topic')
+
+
+class StringArray:
+    """Immutable sequence of strings stored as one UTF-8 buffer and an offset array"""
+    
+    def __init__(self, strings: Iterable[str]):
+        """
+        Pack the strings
+        
+        Args:
+            strings: Strings to store
+        """
+        encoded = [s.encode('utf-8') for s in strings]
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=self.offsets[1:])
+        self.data = b"".join(encoded)
+    
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+    
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+    
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the buffer and the offsets"""
+        return len(self.data) + self.offsets.nbytes
+
+
+class IndicatorCatalog:
+    """
+    Indicator ids and names in packed arrays, plus the search text until it is indexed
+    
+    Rows keep the table order. Equal ids share an integer code so results
+    can be deduplicated without comparing strings, and every row has a
+    64-bit hash of its id and text so an index can tell which rows changed.
+    """
+    
+    def __init__(self, rows: Iterable[Tuple]):
+        """
+        Build the catalog
+        
+        Args:
+            rows: (rowid, id, name, description, source, topic) tuples
+        """
+        rowids, ids, names, texts, row_hashes = [], [], [], [], []
+        for rowid, indicator_id, name, description, source, topic in rows:
+            indicator_id = '' if indicator_id is None else str(indicator_id)
+            text = self.indicator_text(name, description, source, topic)
+            rowids.append(rowid)
+            ids.append(indicator_id)
+            names.append('' if name is None else str(name))
+            texts.append(text)
+            row_hashes.append(hashlib.blake2b(
+                f"{indicator_id}\0{text}".encode('utf-8'), digest_size=8
+            ).digest())
+        
+        codes = {}
+        self.id_codes = np.fromiter(
+            (codes.setdefault(indicator_id, len(codes)) for indicator_id in ids),
+            dtype=np.int32, count=len(ids)
+        )
+        self.rowids = np.asarray(rowids, dtype=np.int64)
+        self.row_hashes = np.frombuffer(b"".join(row_hashes), dtype=np.uint64)
+        self.ids = StringArray(ids)
+        self.names = StringArray(names)
+        self.texts = texts
+        self.fingerprint = hashlib.sha256(
+            self.rowids.tobytes() + self.row_hashes.tobytes()
+        ).hexdigest()
+    
+    @staticmethod
+    def indicator_text(name: str, description: str, source: str, topic: str) -> str:
+        """
+        Combined text an indicator is indexed by
+        
+        An indicator with any field missing gets an empty text, as with the
+        original DataFrame concatenation.
+        """
+        if name is None or description is None or source is None or topic is None:
+            return ''
+        return f"name: {name} description: {description} source: {source} topic: {topic}"
+    
+    @classmethod
+    def from_database(cls, db_path: str, table_name: str = 'Indicator') -> "IndicatorCatalog":
+        """
+        Load the retrieval columns of the Indicator table
+        
+        Args:
+            db_path: Path to SQLite database
+            table_name: Name of the table to query
+        
+        Returns:
+            Catalog of the table's indicators
+        """
+        from sqlalchemy import text
+        from database import get_engine
+        
+        columns = ", ".join(CATALOG_COLUMNS)
+        with get_engine(db_path).connect() as conn:
+            result = conn.execute(text(f"SELECT rowid, {columns} FROM {table_name} ORDER BY rowid"))
+            return cls(result)
+    
+    def __len__(self) -> int:
+        return len(self.rowids)
+    
+    def release_text(self):
+        """Drop the search text once the index has been built or loaded"""
+        self.texts = None
+    
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the catalog arrays, excluding any unreleased text"""
+        return (self.ids.nbytes + self.names.nbytes + self.id_codes.nbytes
+                + self.rowids.nbytes + self.row_hashes.nbytes)
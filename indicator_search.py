@@ -1,88 +1,408 @@
 """
 Indicator search using TF-IDF and cosine similarity
 """
-import time
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from nltk.tokenize import sent_tokenize
+import json
+import logging
+import os
+import shutil
+from typing import Dict, List, Optional
+import numpy as np
+from scipy.sparse import csr_matrix, diags, vstack
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+from config import Config
+from indicator_catalog import IndicatorCatalog
+from metrics import metrics
+from utils import replace_directory, split_sentences
+
+
+logger = logging.getLogger(__name__)
+
+# Version of the on-disk index layout; indexes in another format are rebuilt
+INDEX_FORMAT = 2
+
+INDEX_ARRAYS = (
+    'data', 'indices', 'indptr', 'counts_data', 'counts_indices', 'counts_indptr',
+    'doc_freq', 'idf', 'rowids', 'row_hashes',
+)
 
 
 class IndicatorSearch:
     """Search for relevant indicators using TF-IDF similarity"""
     
-    def __init__(self, indicator_df: pd.DataFrame):
+    def __init__(self, catalog: IndicatorCatalog, index_dir: str = None):
         """
         Initialize indicator search
         
+        The catalog's search text is released once the index is built or
+        loaded; only the ids and names are kept for formatting results.
+        
         Args:
-            indicator_df: DataFrame containing indicator information
+            catalog: Indicator catalog, see IndicatorCatalog.from_database()
+            index_dir: Directory holding the persisted TF-IDF index
+        """
+        self.catalog = catalog
+        self.index_dir = index_dir or Config.INDICATOR_INDEX_DIR
+        self.fingerprint = catalog.fingerprint
+        self.vectorizer, self.tfidf_matrix = self._load_or_build_index()
+        self.catalog.release_text()
+    
+    def _load_or_build_index(self):
         """
-        self.df = indicator_df.copy()
-        self._prepare_indicators()
+        Load the persisted index, updating or rebuilding it if the indicator table changed
         
-    def _prepare_indicators(self):
-        """Prepare combined indicator text for searching"""
-        self.df['indicator_text'] = (
-            "name: " + self.df['name'] +
-            " description: " + self.df['description'] +
-            " source: " + self.df['source'] +
-            " topic: " + self.df['topic']
-        ).fillna('')
+        Returns:
+            Tuple of (fitted vectorizer, TF-IDF matrix)
+        """
+        index = self._load_index()
+        if index is not None and index['meta']['fingerprint'] == self.fingerprint:
+            return self._index_to_search(index)
+        
+        updated = self._update_index(index) if index is not None else None
+        if updated is None:
+            with metrics.span('indicator_index_build', indicators=len(self.catalog)):
+                updated = self._build_index()
+            logger.info(f"Built indicator index for {len(self.catalog)} indicators")
+        
+        try:
+            self._save_index(updated)
+        except OSError as e:
+            logger.warning(f"Could not save indicator index to {self.index_dir}: {e}")
+        
+        return self._index_to_search(updated)
+    
+    @staticmethod
+    def _idf(doc_freq: np.ndarray, n_rows: int) -> np.ndarray:
+        """Smoothed IDF weights, computed as TfidfVectorizer does"""
+        return np.log((1 + n_rows) / (1 + doc_freq)) + 1
     
-    def _compute_similarity(self, vectorizer, tfidf_matrix, query_part: str):
+    @staticmethod
+    def _weigh(counts: csr_matrix, idf: np.ndarray) -> csr_matrix:
+        """Turn term counts into L2-normalised TF-IDF rows"""
+        return normalize(counts @ diags(idf), norm='l2').tocsr()
+    
+    def _build_index(self) -> Dict:
+        """
+        Fit the index on every indicator
+        
+        Returns:
+            Index dictionary, see _load_index()
+        """
+        count_vectorizer = CountVectorizer()
+        counts = count_vectorizer.fit_transform(self.catalog.texts).tocsr()
+        vocabulary = {term: int(i) for term, i in count_vectorizer.vocabulary_.items()}
+        doc_freq = np.bincount(counts.indices, minlength=len(vocabulary))
+        idf = self._idf(doc_freq, counts.shape[0])
+        
+        return {
+            'meta': {
+                'fingerprint': self.fingerprint,
+                'built_rows': counts.shape[0],
+                'changed_rows': 0,
+            },
+            'vocabulary': vocabulary,
+            'counts': counts,
+            'tfidf': self._weigh(counts, idf),
+            'doc_freq': doc_freq,
+            'idf': idf,
+            'rowids': self.catalog.rowids,
+            'row_hashes': self.catalog.row_hashes,
+        }
+    
+    def _update_index(self, index: Dict) -> Optional[Dict]:
         """
-        Compute cosine similarity between query and indicators
+        Bring a persisted index up to date with the catalog
+        
+        Rows are matched by rowid and compared by content hash. Only added
+        and changed rows are vectorized; unchanged rows are copied with
+        their existing weights. Document frequencies and IDF weights are
+        updated exactly, so queries and new rows use the current IDF while
+        unchanged rows keep the IDF they were weighted with. Once the rows
+        changed since the last full build exceed
+        Config.INDICATOR_INDEX_REBUILD_DRIFT of the table, the index is
+        rebuilt instead so that the stale weights are refreshed.
         
         Args:
-            vectorizer: Fitted TF-IDF vectorizer
-            tfidf_matrix: TF-IDF matrix of indicators
-            query_part: Query text to compare
+            index: Index dictionary from _load_index()
+        
+        Returns:
+            Updated index dictionary, or None if a full build is needed
+        """
+        meta = index['meta']
+        old_rowids, old_hashes = index['rowids'], index['row_hashes']
+        new_rowids, new_hashes = self.catalog.rowids, self.catalog.row_hashes
+        
+        # Position of every catalog row in the old index, and whether it is unchanged
+        unchanged = np.zeros(len(new_rowids), dtype=bool)
+        old_positions = np.zeros(len(new_rowids), dtype=np.int64)
+        if len(old_rowids):
+            order = np.argsort(old_rowids, kind='stable')
+            found = np.searchsorted(old_rowids, new_rowids, sorter=order)
+            old_positions = order[np.minimum(found, len(old_rowids) - 1)]
+            unchanged = ((old_rowids[old_positions] == new_rowids)
+                         & (old_hashes[old_positions] == new_hashes))
+        kept = old_positions[unchanged]
+        stale = np.ones(len(old_rowids), dtype=bool)
+        stale[kept] = False
+        changed = np.flatnonzero(~unchanged)
+        
+        # Added and changed rows, plus deleted rows
+        n_changes = len(changed) + int(stale.sum()) - int(np.isin(old_rowids[stale], new_rowids).sum())
+        drift = (meta['changed_rows'] + n_changes) / max(1, meta['built_rows'])
+        if drift > Config.INDICATOR_INDEX_REBUILD_DRIFT:
+            logger.info(f"Indicator table drifted by {drift:.0%} since the last build; rebuilding the index")
+            return None
+        
+        with metrics.span('indicator_index_update', changed=n_changes):
+            vocabulary = dict(index['vocabulary'])
+            texts = [self.catalog.texts[i] for i in changed]
+            analyzer = CountVectorizer().build_analyzer()
+            for text in texts:
+                for term in analyzer(text):
+                    vocabulary.setdefault(term, len(vocabulary))
+            n_terms = len(vocabulary)
+            
+            old_counts = self._resize(index['counts'], n_terms)
+            new_counts = CountVectorizer(vocabulary=vocabulary).transform(texts).tocsr()
             
+            doc_freq = np.zeros(n_terms, dtype=np.int64)
+            doc_freq[:len(index['doc_freq'])] = index['doc_freq']
+            doc_freq -= np.bincount(old_counts[np.flatnonzero(stale)].indices, minlength=n_terms)
+            doc_freq += np.bincount(new_counts.indices, minlength=n_terms)
+            idf = self._idf(doc_freq, len(new_rowids))
+            
+            # Unchanged rows come first in catalog order, then the re-vectorized ones
+            source = np.empty(len(new_rowids), dtype=np.int64)
+            source[unchanged] = np.arange(len(kept))
+            source[changed] = len(kept) + np.arange(len(changed))
+            counts = vstack([old_counts[kept], new_counts]).tocsr()[source]
+            tfidf = vstack([
+                self._resize(index['tfidf'], n_terms)[kept], self._weigh(new_counts, idf)
+            ]).tocsr()[source]
+        
+        logger.info(f"Updated indicator index: {n_changes} of {len(new_rowids)} indicators changed")
+        return {
+            'meta': {
+                'fingerprint': self.fingerprint,
+                'built_rows': meta['built_rows'],
+                'changed_rows': meta['changed_rows'] + n_changes,
+            },
+            'vocabulary': vocabulary,
+            'counts': counts,
+            'tfidf': tfidf,
+            'doc_freq': doc_freq,
+            'idf': idf,
+            'rowids': new_rowids,
+            'row_hashes': new_hashes,
+        }
+    
+    @staticmethod
+    def _resize(matrix: csr_matrix, n_columns: int) -> csr_matrix:
+        """View a CSR matrix with more columns for terms added to the vocabulary"""
+        return csr_matrix((matrix.data, matrix.indices, matrix.indptr),
+                          shape=(matrix.shape[0], n_columns))
+    
+    @staticmethod
+    def _index_to_search(index: Dict):
+        """
+        Build the query vectorizer for an index
+        
         Returns:
-            Array of similarity scores
+            Tuple of (vectorizer, TF-IDF matrix)
         """
-        query_vec = vectorizer.transform([query_part])
-        cosine_similarities = cosine_similarity(query_vec, tfidf_matrix).flatten()
-        return cosine_similarities
+        vectorizer = TfidfVectorizer(vocabulary=index['vocabulary'])
+        vectorizer.idf_ = np.asarray(index['idf'])
+        return vectorizer, index['tfidf']
     
-    def search(self, query: str, top_n: int = 5) -> str:
+    def _load_index(self) -> Optional[Dict]:
         """
-        Search for top N most relevant indicators
+        Load a persisted index from disk, memory-mapping its arrays
+        
+        Returns:
+            Dictionary with 'meta', 'vocabulary', the 'counts' and 'tfidf'
+            matrices, 'doc_freq' and 'idf' per term and 'rowids' and
+            'row_hashes' per indicator, or None if missing, unreadable or
+            written in an older format
+        """
+        meta_path = os.path.join(self.index_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta.get('format') != INDEX_FORMAT:
+                return None
+            
+            with open(os.path.join(self.index_dir, 'vocabulary.json'), 'r') as f:
+                vocabulary = json.load(f)
+            
+            arrays = {
+                name: np.load(os.path.join(self.index_dir, f"{name}.npy"), mmap_mode='r')
+                for name in INDEX_ARRAYS
+            }
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable indicator index in {self.index_dir}: {e}")
+            return None
+        
+        shape = (len(arrays['rowids']), len(vocabulary))
+        return {
+            'meta': meta,
+            'vocabulary': vocabulary,
+            'counts': csr_matrix(
+                (arrays['counts_data'], arrays['counts_indices'], arrays['counts_indptr']), shape=shape
+            ),
+            'tfidf': csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape),
+            'doc_freq': arrays['doc_freq'],
+            'idf': arrays['idf'],
+            'rowids': arrays['rowids'],
+            'row_hashes': arrays['row_hashes'],
+        }
+    
+    def _save_index(self, index: Dict):
+        """
+        Persist the vocabulary, term statistics, both matrices and the row watermark
+        
+        Args:
+            index: Index dictionary, see _load_index()
+        """
+        tmp_dir = f"{self.index_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        
+        arrays = {
+            'data': index['tfidf'].data,
+            'indices': index['tfidf'].indices,
+            'indptr': index['tfidf'].indptr,
+            'counts_data': index['counts'].data,
+            'counts_indices': index['counts'].indices,
+            'counts_indptr': index['counts'].indptr,
+            'doc_freq': index['doc_freq'],
+            'idf': index['idf'],
+            'rowids': index['rowids'],
+            'row_hashes': index['row_hashes'],
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        with open(os.path.join(tmp_dir, 'vocabulary.json'), 'w') as f:
+            json.dump(index['vocabulary'], f)
+        # meta.json is written last so a partially written index is never loaded
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({**index['meta'], 'format': INDEX_FORMAT}, f)
+        
+        replace_directory(tmp_dir, self.index_dir)
+    
+    def _compute_similarities(self, query_parts: List[str]) -> np.ndarray:
+        """
+        Compute cosine similarity between every query part and every indicator
+        
+        Args:
+            query_parts: Query texts to compare
+        
+        Returns:
+            Array of similarity scores with one row per query part
+        """
+        # Both sides are L2-normalised by the vectorizer, so a single sparse
+        # product gives the cosine similarities for the whole batch
+        query_vecs = self.vectorizer.transform(query_parts)
+        return (query_vecs @ self.tfidf_matrix.T).toarray()
+    
+    def unknown_terms(self, text: str) -> List[str]:
+        """
+        Words of a text that are not in the index vocabulary
+        
+        Such words, e.g. place names, are ignored by the similarity scores.
+        
+        Args:
+            text: Text to split into words
+        
+        Returns:
+            Distinct unknown words in order of appearance
+        """
+        vocabulary = self.vectorizer.vocabulary
+        terms = self.vectorizer.build_analyzer()(text)
+        return list(dict.fromkeys(term for term in terms if term not in vocabulary))
+    
+    @staticmethod
+    def _top_k_rows(similarities: np.ndarray, k: int) -> np.ndarray:
+        """
+        Find the k highest scoring indicator rows for each query part
+        
+        Args:
+            similarities: Similarity scores with one row per query part
+            k: Number of rows to keep per query part
+        
+        Returns:
+            Array of indicator row positions with shape (query parts, k)
+        """
+        k = min(k, similarities.shape[1])
+        if k == similarities.shape[1]:
+            return np.tile(np.arange(k), (similarities.shape[0], 1))
+        return np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    
+    def search_results(self, query: str, top_n: int = 5) -> List[Dict]:
+        """
+        Search for the top N most relevant indicators
         
         Args:
             query: Search query
             top_n: Number of top results to return
-            
+        
         Returns:
-            Formatted string of indicator IDs and names
+            List of {'id', 'name', 'score'} dictionaries, best match first;
+            the score is the best cosine similarity of any query sentence
         """
-        indicators = self.df['indicator_text'].tolist()
-        vectorizer = TfidfVectorizer()
-        tfidf_matrix = vectorizer.fit_transform(indicators)
+        # Split query into sentences
+        query_parts = split_sentences(query)
+        if not query_parts or top_n <= 0 or self.tfidf_matrix.shape[0] == 0:
+            return []
         
-        # Tokenize query into sentences
-        query_parts = sent_tokenize(query)
+        similarities = self._compute_similarities(query_parts)
+        top_rows = self._top_k_rows(similarities, top_n)
         
-        all_results = []
+        candidate_rows = top_rows.ravel()
+        candidate_scores = np.take_along_axis(similarities, top_rows, axis=1).ravel()
         
-        for part in query_parts:
-            similarities = self._compute_similarity(vectorizer, tfidf_matrix, part)
-            
-            temp_df = self.df.copy()
-            temp_df['similarity'] = similarities
-            top_results = temp_df.sort_values(by='similarity', ascending=False).head(top_n)
-            all_results.append(top_results)
-        
-        # Combine and deduplicate results
-        combined_results = pd.concat(all_results).drop_duplicates(subset='id').reset_index(drop=True)
-        combined_results = combined_results.sort_values(by='similarity', ascending=False)
-        final_results = combined_results.head(top_n)
-        
-        # Format output
-        output = [
-            f"id: {row['id']}, indicator_name: {row['name']}\n"
-            for _, row in final_results.iterrows()
+        # Order candidates by score (ties broken by table order) and keep the
+        # best scoring occurrence of each indicator id
+        order = np.lexsort((candidate_rows, -candidate_scores))
+        candidate_rows = candidate_rows[order]
+        candidate_scores = candidate_scores[order]
+        _, first_seen = np.unique(self.catalog.id_codes[candidate_rows], return_index=True)
+        final = np.sort(first_seen)[:top_n]
+        
+        return [
+            {
+                'id': self.catalog.ids[row],
+                'name': self.catalog.names[row],
+                'score': float(score),
+            }
+            for row, score in zip(candidate_rows[final], candidate_scores[final])
         ]
+    
+    @staticmethod
+    def format_results(results: List[Dict]) -> str:
+        """
+        Format search results as the indicator hint text
+        
+        Args:
+            results: Output of search_results()
+        
+        Returns:
+            Formatted string of indicator IDs and names
+        """
+        output = [f"id: {r['id']}, indicator_name: {r['name']}\n" for r in results]
+        return "; ".join(output)
+    
+    def search(self, query: str, top_n: int = 5) -> str:
+        """
+        Search for top N most relevant indicators
+        
+        Args:
+            query: Search query
+            top_n: Number of top results to return
         
-        return "; ".join(output)
\ No newline at end of file
+        Returns:
+            Formatted string of indicator IDs and names
+        """
+        return self.format_results(self.search_results(query, top_n))
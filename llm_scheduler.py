@@ -0,0 +1,385 @@
+"""
+Client-side scheduling of OpenAI calls: rate limits, priorities, retries and request merging
+"""
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from config import Config
+from metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+# Lower values are served first
+PRIORITIES = {INTERACTIVE: 0, BATCH: 1}
+
+# Priority of the model calls made in the current context
+request_priority = contextvars.ContextVar('request_priority', default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def llm_priority(priority: str):
+    """
+    Run the model calls made inside the block with the given priority
+    
+    Args:
+        priority: INTERACTIVE or BATCH
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}', expected one of {', '.join(PRIORITIES)}")
+    token = request_priority.set(priority)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+def parse_model_limits(value: str) -> Dict[str, float]:
+    """
+    Parse a "model=limit,model=limit" list
+    
+    Args:
+        value: Limits as configured, e.g. 'gpt-4o=30000,gpt-4o-mini=200000'
+    
+    Returns:
+        Dictionary of model name to limit
+    """
+    limits = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        model, _, limit = item.partition('=')
+        try:
+            limits[model.strip()] = float(limit)
+        except ValueError:
+            raise ValueError(f"Invalid model limit '{item.strip()}', expected model=number") from None
+    return limits
+
+
+def estimate_tokens(text: str) -> int:
+    """Prompt tokens of a text at four characters per token, cheap enough to run before every call"""
+    return (len(text) + 3) // 4
+
+
+def _rate_limit_errors() -> tuple:
+    """Exception types meaning the provider rejected a call for exceeding a rate limit"""
+    import openai
+    
+    return (openai.RateLimitError,)
+
+
+class TokenBucket:
+    """Bucket refilled continuously at a per-minute rate"""
+    
+    def __init__(self, per_minute: Optional[float], burst: float = 1.0):
+        """
+        Initialize a full bucket
+        
+        Args:
+            per_minute: Units added per minute, or None for no limit
+            burst: Capacity in minutes of refill; OpenAI's limits hold one minute's worth
+        """
+        self.per_minute = per_minute
+        self.capacity = (per_minute or 0.0) * burst
+        self.available = self.capacity
+        self._updated = time.monotonic()
+    
+    def _refill(self, now: float):
+        if self.per_minute:
+            self.available = min(self.capacity,
+                                 self.available + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+    
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount units are available; amounts above the capacity wait for a full bucket"""
+        if not self.per_minute:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.available
+        return max(0.0, missing * 60 / self.per_minute)
+    
+    def take(self, amount: float):
+        """Remove units, which must be available (see wait_time())"""
+        if self.per_minute:
+            self.available -= min(amount, self.capacity)
+
+
+class _Lane:
+    """Rate limits and waiting callers of one model"""
+    
+    def __init__(self, tokens_per_minute: Optional[float], requests_per_minute: Optional[float],
+                 burst: float):
+        self.tokens = TokenBucket(tokens_per_minute, burst)
+        self.requests = TokenBucket(requests_per_minute, burst)
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'merged': 0, 'rate_limited': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+
+
+class _Flight:
+    """A call shared by every caller asking for the same key while it runs"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LLMScheduler:
+    """
+    Shared scheduler for chat and embedding calls
+    
+    Every call names its model and an estimate of its prompt tokens. Calls
+    to one model wait in a single queue ordered by priority (interactive
+    before batch, then first come first served) until that model's token
+    and request buckets, sized from the configured per-minute limits, can
+    pay for them. A rate-limit error pauses the model's queue for a
+    jittered exponential backoff (or the Retry-After the provider sent)
+    and the call is queued again. Calls given a key are merged while in
+    flight: callers asking for the same summary prompt or query embedding
+    wait for the first call and share its result.
+    """
+    
+    def __init__(self, tokens_per_minute: Dict[str, float] = None,
+                 requests_per_minute: Dict[str, float] = None,
+                 retries: int = None, base_delay: float = None, max_delay: float = 60.0,
+                 retry_on: tuple = None, burst: float = 1.0):
+        """
+        Initialize the scheduler
+        
+        Args:
+            tokens_per_minute: Model name to prompt token limit, defaults to
+                Config.LLM_TOKENS_PER_MINUTE; models not listed are not throttled
+            requests_per_minute: Model name to request limit, defaults to Config.LLM_REQUESTS_PER_MINUTE
+            retries: Retries after a rate-limit error, defaults to Config.RATE_LIMIT_RETRIES
+            base_delay: Delay before the first retry in seconds, defaults to Config.RATE_LIMIT_BASE_DELAY
+            max_delay: Upper bound for a single delay in seconds
+            retry_on: Exception types that are retried, defaults to openai.RateLimitError
+            burst: Bucket capacity in minutes of the limits
+        """
+        self.tokens_per_minute = (parse_model_limits(Config.LLM_TOKENS_PER_MINUTE)
+                                  if tokens_per_minute is None else dict(tokens_per_minute))
+        self.requests_per_minute = (parse_model_limits(Config.LLM_REQUESTS_PER_MINUTE)
+                                    if requests_per_minute is None else dict(requests_per_minute))
+        self.retries = Config.RATE_LIMIT_RETRIES if retries is None else retries
+        self.base_delay = Config.RATE_LIMIT_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = max_delay
+        self._retry_on = retry_on
+        self.burst = burst
+        self.share = 1.0
+        self._lock = threading.Lock()
+        self._lanes = {}
+        self._flights = {}
+        self._sequence = itertools.count()
+    
+    @property
+    def retry_on(self) -> tuple:
+        if self._retry_on is None:
+            self._retry_on = _rate_limit_errors()
+        return self._retry_on
+    
+    def set_share(self, share: float):
+        """
+        Use only a share of the configured limits, e.g. 1/N in each of N worker processes
+        
+        Args:
+            share: Fraction of every limit this process may use
+        """
+        with self._lock:
+            self.share = share
+            self._lanes.clear()
+    
+    def _lane(self, model: str) -> _Lane:
+        with self._lock:
+            lane = self._lanes.get(model)
+            if lane is None:
+                tokens = self.tokens_per_minute.get(model)
+                requests = self.requests_per_minute.get(model)
+                lane = self._lanes[model] = _Lane(tokens and tokens * self.share,
+                                                  requests and requests * self.share, self.burst)
+            return lane
+    
+    def _acquire(self, lane: _Lane, priority: str, tokens: int) -> float:
+        """
+        Wait for this call's turn and for the buckets to pay for it
+        
+        Returns:
+            Seconds waited
+        """
+        start = time.monotonic()
+        ticket = (PRIORITIES[priority], next(self._sequence), priority)
+        with lane.condition:
+            heapq.heappush(lane.waiting, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if lane.waiting[0] is ticket:
+                        now = time.monotonic()
+                        timeout = max(lane.paused_until - now, lane.tokens.wait_time(tokens, now),
+                                      lane.requests.wait_time(1, now))
+                        if timeout <= 0:
+                            lane.tokens.take(tokens)
+                            lane.requests.take(1)
+                            lane.in_flight += 1
+                            break
+                    lane.condition.wait(timeout)
+            finally:
+                lane.waiting.remove(ticket)
+                heapq.heapify(lane.waiting)
+                lane.condition.notify_all()
+        return time.monotonic() - start
+    
+    def _release(self, lane: _Lane, waited: float, rate_limited: bool = False):
+        with lane.condition:
+            lane.in_flight -= 1
+            lane.stats['requests'] += 1
+            lane.stats['rate_limited'] += rate_limited
+            lane.stats['wait_seconds'] += waited
+            lane.stats['max_wait_seconds'] = max(lane.stats['max_wait_seconds'], waited)
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Retry-After sent with the error, or jittered exponential backoff"""
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        try:
+            retry_after = float(headers.get('retry-after'))
+        except (TypeError, ValueError):
+            retry_after = None
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) * random.uniform(1.0, 1.25)
+        return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+    
+    def _run(self, model: str, fn: Callable[[], Any], tokens: int, priority: str) -> Any:
+        """Call fn when the model's limits allow it, retrying rate-limit errors"""
+        lane = self._lane(model)
+        for attempt in range(self.retries + 1):
+            waited = self._acquire(lane, priority, tokens)
+            metrics.observe('llm_queue_wait_seconds', waited, model=model, priority=priority)
+            try:
+                result = fn()
+            except self.retry_on as e:
+                self._release(lane, waited, rate_limited=True)
+                metrics.inc('rate_limit_retries_total', model=model)
+                if attempt == self.retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                with lane.condition:
+                    # Every queued call to the model waits, not only this one
+                    lane.paused_until = max(lane.paused_until, time.monotonic() + delay)
+                    lane.condition.notify_all()
+                logger.warning(f"Rate limited on {model} ({e}); retrying in {delay:.1f}s")
+                continue
+            except BaseException:
+                self._release(lane, waited)
+                raise
+            self._release(lane, waited)
+            metrics.inc('llm_requests_total', model=model, priority=priority)
+            return result
+    
+    def call_merged(self, model: str, fn: Callable[[], Any], tokens: int = 0,
+                    key: Hashable = None, priority: str = None) -> Tuple[Any, bool]:
+        """
+        Schedule a model call and report whether its result was shared
+        
+        Args:
+            model: Model the call goes to; its limits apply
+            fn: Callable without arguments making the call
+            tokens: Estimated prompt tokens of the call
+            key: Identifies calls that may share one result, e.g. the model
+                and prompt; calls without a key are never merged
+            priority: INTERACTIVE or BATCH, defaults to the priority of the
+                current context (see llm_priority())
+        
+        Returns:
+            Tuple of (result of fn, True if it came from another caller's call)
+        """
+        priority = priority or request_priority.get()
+        if key is None:
+            return self._run(model, fn, tokens, priority), False
+        
+        with self._lock:
+            flight = self._flights.get((model, key))
+            leader = flight is None
+            if leader:
+                flight = self._flights[(model, key)] = _Flight()
+        
+        if not leader:
+            flight.done.wait()
+            lane = self._lane(model)
+            with lane.condition:
+                lane.stats['merged'] += 1
+            metrics.inc('llm_merged_requests_total', model=model)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        
+        try:
+            flight.result = self._run(model, fn, tokens, priority)
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[(model, key)]
+            flight.done.set()
+    
+    def call(self, model: str, fn: Callable[[], Any], tokens: int = 0,
+             key: Hashable = None, priority: str = None) -> Any:
+        """
+        Schedule a model call
+        
+        Args:
+            model: Model the call goes to; its limits apply
+            fn: Callable without arguments making the call
+            tokens: Estimated prompt tokens of the call
+            key: Identifies calls that may share one result, see call_merged()
+            priority: INTERACTIVE or BATCH, defaults to the priority of the current context
+        
+        Returns:
+            Result of fn
+        """
+        return self.call_merged(model, fn, tokens, key, priority)[0]
+    
+    def stats(self) -> Dict[str, Dict]:
+        """
+        Report queue depth and waiting per model
+        
+        Returns:
+            Dictionary of model name to the calls 'queued' per priority,
+            'in_flight', 'requests' made, 'merged' into another call,
+            'rate_limited' responses, 'avg_wait_seconds' and 'max_wait_seconds'
+        """
+        with self._lock:
+            lanes = dict(self._lanes)
+        report = {}
+        for model, lane in lanes.items():
+            with lane.condition:
+                queued = dict.fromkeys(PRIORITIES, 0)
+                for ticket in lane.waiting:
+                    queued[ticket[2]] += 1
+                stats = dict(lane.stats)
+                report[model] = {
+                    'queued': queued,
+                    'in_flight': lane.in_flight,
+                    'requests': stats['requests'],
+                    'merged': stats['merged'],
+                    'rate_limited': stats['rate_limited'],
+                    'avg_wait_seconds': stats['wait_seconds'] / stats['requests'] if stats['requests'] else 0.0,
+                    'max_wait_seconds': stats['max_wait_seconds'],
+                }
+        return report
+
+
+# Scheduler shared by every OpenAI call of the process
+scheduler = LLMScheduler()
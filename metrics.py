@@ -0,0 +1,338 @@
+"""
+Tracing spans, counters and histograms for the query pipeline
+
+Spans time a stage of the pipeline and record its duration in a histogram
+labelled with the stage name; counters track queries, SQL rows, tool calls,
+tokens and cost per model. Finished spans are written to the 'metrics'
+logger (DEBUG level, as JSON with LOG_FORMAT=json) and all metrics can be
+exported in the Prometheus text format. With METRICS_ENABLED=false every
+call returns immediately.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Tuple
+
+from config import Config
+
+
+logger = logging.getLogger('metrics')
+
+# Upper bounds in seconds of the stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# USD per 1K (prompt, completion, cached prompt) tokens for models the pinned LangChain release does not price
+MODEL_PRICES_PER_1K = {
+    'gpt-4o': (0.0025, 0.01, 0.00125),
+    'gpt-4o-mini': (0.00015, 0.0006, 0.000075),
+}
+
+METRIC_PREFIX = 'textsql'
+
+# Identifier of the query being processed, attached to every span
+trace_id = contextvars.ContextVar('trace_id', default=None)
+
+
+def token_cost(model: str, prompt_tokens: int, completion_tokens: int,
+               cached_tokens: int = 0) -> float:
+    """
+    Estimate the cost of a model call in USD
+    
+    Args:
+        model: OpenAI model name
+        prompt_tokens: Number of prompt tokens, including cached ones
+        completion_tokens: Number of completion tokens
+        cached_tokens: Prompt tokens served from the provider's prompt cache
+    
+    Returns:
+        Cost in USD, 0.0 for unknown models
+    """
+    prices = MODEL_PRICES_PER_1K.get(model)
+    if prices is not None:
+        return ((prompt_tokens - cached_tokens) * prices[0] + cached_tokens * prices[2]
+                + completion_tokens * prices[1]) / 1000
+    
+    from langchain_community.callbacks.openai_info import get_openai_token_cost_for_model
+    try:
+        return (get_openai_token_cost_for_model(model, prompt_tokens)
+                + get_openai_token_cost_for_model(model, completion_tokens, is_completion=True))
+    except ValueError:
+        return 0.0
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Formats log records as single-line JSON objects, merging in any extra 'fields' dictionary"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields is not None:
+            payload.update(fields)
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def setup_logging(level: str = None, log_format: str = None):
+    """
+    Configure the root logger for the command line entry points
+    
+    Args:
+        level: Log level name, defaults to Config.LOG_LEVEL
+        log_format: 'text' or 'json', defaults to Config.LOG_FORMAT
+    """
+    handler = logging.StreamHandler()
+    if (log_format or Config.LOG_FORMAT) == 'json':
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(message)s"))
+    
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel((level or Config.LOG_LEVEL).upper())
+
+
+class _NoopSpan(dict):
+    """Span returned while metrics are disabled; ignores everything"""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+    
+    def __setitem__(self, key, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span(dict):
+    """Times a block of code; attributes set on the span are logged with it"""
+    
+    def __init__(self, registry: "Metrics", name: str, attributes: Dict):
+        super().__init__(attributes)
+        self.registry = registry
+        self.name = name
+        self.start = None
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        self.registry.observe('stage_duration_seconds', duration, stage=self.name)
+        if exc_type is not None:
+            self.registry.inc('stage_errors_total', stage=self.name, error=exc_type.__name__)
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            record = {
+                'span': self.name,
+                'trace_id': trace_id.get(),
+                'duration_ms': round(duration * 1000, 3),
+                **self,
+            }
+            if exc_type is not None:
+                record['error'] = exc_type.__name__
+            logger.debug(f"{self.name} {duration * 1000:.1f}ms", extra={'fields': record})
+        return False
+
+
+class Metrics:
+    """Thread-safe registry of counters and duration histograms"""
+    
+    def __init__(self, enabled: bool = None):
+        """
+        Initialize the registry
+        
+        Args:
+            enabled: Whether to record anything, defaults to Config.METRICS_ENABLED
+        """
+        self.enabled = Config.METRICS_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+    
+    @staticmethod
+    def _key(name: str, labels: Dict) -> Tuple:
+        return (name, tuple(sorted(labels.items())))
+    
+    def span(self, name: str, **attributes):
+        """
+        Create a span timing a stage
+        
+        Use as a context manager; values assigned to the span (e.g.
+        span['rows'] = 10) are logged with it.
+        
+        Args:
+            name: Stage name
+            **attributes: Attributes logged with the span
+        
+        Returns:
+            Context manager
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Increase a counter
+        
+        Args:
+            name: Counter name without prefix
+            value: Amount to add
+            **labels: Label values
+        """
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    def observe(self, name: str, value: float, **labels):
+        """
+        Record a value in a histogram
+        
+        Args:
+            name: Histogram name without prefix
+            value: Observed value
+            **labels: Label values
+        """
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': [0] * len(DURATION_BUCKETS), 'sum': 0.0, 'count': 0
+                }
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+    
+    def record_tokens(self, tokens: Dict):
+        """
+        Add the token usage and cost of a model call to the per-model counters
+        
+        Args:
+            tokens: Dictionary with 'model', 'prompt_tokens', 'completion_tokens'
+                and optionally 'cached_tokens' and 'total_cost'
+        """
+        if not self.enabled or not tokens:
+            return
+        model = tokens.get('model', 'unknown')
+        self.inc('tokens_total', tokens.get('prompt_tokens', 0), model=model, type='prompt')
+        self.inc('tokens_total', tokens.get('cached_tokens', 0), model=model, type='cached')
+        self.inc('tokens_total', tokens.get('completion_tokens', 0), model=model, type='completion')
+        self.inc('cost_usd_total', tokens.get('total_cost', 0.0), model=model)
+    
+    def snapshot(self) -> Dict:
+        """
+        Copy the current counter and histogram values
+        
+        Returns:
+            Dictionary with 'counters' and 'histograms' keyed by name and labels
+        """
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'histograms': {key: {**h, 'buckets': list(h['buckets'])}
+                               for key, h in self._histograms.items()},
+            }
+    
+    def reset(self):
+        """Drop all recorded values"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+    
+    @staticmethod
+    def _format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+    
+    def prometheus_text(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+        
+        Returns:
+            Metrics text
+        """
+        snapshot = self.snapshot()
+        lines = []
+        
+        counters = {}
+        for (name, labels), value in snapshot['counters'].items():
+            counters.setdefault(name, []).append((labels, value))
+        for name in sorted(counters):
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# TYPE {metric} counter")
+            for labels, value in sorted(counters[name]):
+                lines.append(f"{metric}{self._format_labels(labels)} {value:g}")
+        
+        histograms = {}
+        for (name, labels), histogram in snapshot['histograms'].items():
+            histograms.setdefault(name, []).append((labels, histogram))
+        for name in sorted(histograms):
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, histogram in sorted(histograms[name], key=lambda item: item[0]):
+                for bound, count in zip(DURATION_BUCKETS, histogram['buckets']):
+                    lines.append(f"{metric}_bucket{self._format_labels(labels, (('le', f'{bound:g}'),))} {count}")
+                lines.append(f"{metric}_bucket{self._format_labels(labels, (('le', '+Inf'),))} {histogram['count']}")
+                lines.append(f"{metric}_sum{self._format_labels(labels)} {histogram['sum']:.6f}")
+                lines.append(f"{metric}_count{self._format_labels(labels)} {histogram['count']}")
+        
+        return "\n".join(lines) + "\n"
+    
+    def write_prometheus(self, path: str = None):
+        """
+        Write the Prometheus text to a file, e.g. for the node exporter textfile collector
+        
+        Args:
+            path: Output file, defaults to Config.METRICS_PROM_PATH; nothing is written if unset
+        """
+        path = path or Config.METRICS_PROM_PATH
+        if not self.enabled or not path:
+            return
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+def new_trace_id() -> str:
+    """
+    Start a trace for a new query in the current context
+    
+    Returns:
+        The new trace id
+    """
+    value = uuid.uuid4().hex[:16]
+    trace_id.set(value)
+    return value
+
+
+# Process-wide registry
+metrics = Metrics()
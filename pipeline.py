@@ -0,0 +1,566 @@
+"""
+Query pipeline that keeps its components warm between queries
+"""
+import asyncio
+import contextvars
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, List, Optional
+from config import Config
+from metrics import metrics, new_trace_id, trace_id
+from utils import data_files_fingerprint
+from answer_cache import AnswerCache
+from compaction import compact_results, count_tokens, truncate_to_budget
+from prompts import get_indicator_hints
+
+# The components pull in LangChain, scikit-learn, pandas and FAISS, so they
+# are imported when the pipeline is built rather than when this module loads
+if TYPE_CHECKING:
+    from agent import WorldBankAgent
+    from fast_path import FastPathPlanner
+    from few_shot_selector import FewShotSelector
+    from indicator_search import IndicatorSearch
+
+
+logger = logging.getLogger(__name__)
+
+# Statements the agent runs to explore the schema or the stored values rather than to fetch its answer
+_EXPLORATORY_SQL = re.compile(
+    r"^\s*pragma\b|\bsqlite_(master|schema)\b|^\s*select\s+distinct\b(?:(?!\bvalue\b).)*\bfrom\b",
+    re.IGNORECASE | re.DOTALL
+)
+
+
+class StageTimeoutError(TimeoutError):
+    """Raised when a pipeline stage does not finish within its timeout"""
+
+
+class QueryPipeline:
+    """Answers natural language queries with pre-initialized components"""
+    
+    def __init__(self, few_shot_selector: "FewShotSelector",
+                 indicator_search: "IndicatorSearch", agent: "WorldBankAgent",
+                 answer_cache: AnswerCache = None, fast_path: "FastPathPlanner" = None):
+        """
+        Initialize the pipeline
+        
+        Args:
+            few_shot_selector: Selector for relevant few-shot examples
+            indicator_search: Search over the Indicator table
+            agent: SQL agent used to answer the query
+            answer_cache: Cache of final answers, or None to always run the agent
+            fast_path: Planner answering simple questions without the agent,
+                or None to send every question to the agent
+        """
+        self.few_shot_selector = few_shot_selector
+        self.indicator_search = indicator_search
+        self.agent = agent
+        self.answer_cache = answer_cache
+        self.fast_path = fast_path
+        # Blocking stages (TF-IDF search, embedding calls, the agent, the summary) run here
+        self._executor = ThreadPoolExecutor(Config.PIPELINE_STAGE_THREADS, thread_name_prefix='pipeline-stage')
+    
+    def close(self):
+        """
+        Release the stage threads and the answer cache connection
+        
+        Called once no query is running on the pipeline any more. Stage
+        work still running after a timeout finishes in the background.
+        """
+        self._executor.shutdown(wait=False)
+        if self.answer_cache is not None:
+            self.answer_cache.close()
+    
+    @staticmethod
+    def _build_indicator_search() -> "IndicatorSearch":
+        """Load the Indicator table and its TF-IDF index"""
+        from indicator_catalog import IndicatorCatalog
+        from indicator_search import IndicatorSearch
+        
+        logger.info("Loading indicator data...")
+        with metrics.span('indicator_load'):
+            return IndicatorSearch(IndicatorCatalog.from_database(Config.DATABASE_PATH))
+    
+    @staticmethod
+    def _build_few_shot_selector() -> "FewShotSelector":
+        """Load the few-shot examples and their FAISS index"""
+        from few_shot_selector import FewShotSelector
+        
+        with metrics.span('few_shot_index_load'):
+            return FewShotSelector()
+    
+    @staticmethod
+    def _build_agent() -> "WorldBankAgent":
+        """Create the SQL agent and warm up its schema cache and connection pool"""
+        from agent import WorldBankAgent
+        
+        with metrics.span('agent_init'):
+            agent = WorldBankAgent()
+            agent.db.warm_up()
+            return agent
+    
+    @classmethod
+    def from_config(cls) -> "QueryPipeline":
+        """
+        Build a pipeline from the application configuration
+        
+        The indicator index, the few-shot index (which may call the
+        embedding API) and the agent with its database warm-up are built
+        in parallel, so start-up takes as long as the slowest of them.
+        
+        Returns:
+            Pipeline with all components initialized
+        """
+        # Validate configuration
+        Config.validate()
+        
+        # Import the components up front: the build threads would only
+        # serialize on the import lock, and can trip over circular imports
+        # when several of them import the same package at once
+        with metrics.span('imports'):
+            from agent import WorldBankAgent  # noqa: F401
+            from few_shot_selector import FewShotSelector  # noqa: F401
+            from indicator_search import IndicatorSearch  # noqa: F401
+        
+        # Initialize components
+        logger.info("Initializing components...")
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix='pipeline-init') as pool:
+            indicator_search_future = pool.submit(cls._build_indicator_search)
+            few_shot_future = pool.submit(cls._build_few_shot_selector)
+            agent_future = pool.submit(cls._build_agent)
+            indicator_search = indicator_search_future.result()
+            few_shot_selector = few_shot_future.result()
+            agent = agent_future.result()
+        
+        return cls.from_components(indicator_search, few_shot_selector, agent)
+    
+    @classmethod
+    def from_components(cls, indicator_search: "IndicatorSearch",
+                        few_shot_selector: "FewShotSelector",
+                        agent: "WorldBankAgent") -> "QueryPipeline":
+        """
+        Build a pipeline around loaded components, adding the answer cache
+        and the fast path when they are enabled in Config
+        
+        Args:
+            indicator_search: Search over the Indicator table
+            few_shot_selector: Selector for relevant few-shot examples
+            agent: SQL agent used to answer the query
+        
+        Returns:
+            Pipeline using the given components
+        """
+        from fast_path import FastPathPlanner
+        
+        # Also finds the places and years near-duplicate questions must share
+        planner = FastPathPlanner(agent.schema_catalog)
+        
+        answer_cache = None
+        if Config.ANSWER_CACHE_ENABLED:
+            answer_cache = AnswerCache(
+                Config.ANSWER_CACHE_PATH,
+                version_fn=lambda: repr(data_files_fingerprint()),
+                vectorize=indicator_search.vectorizer.transform,
+                entities=lambda question: planner.entities(question, indicator_search.unknown_terms),
+                similarity_threshold=Config.ANSWER_CACHE_SIMILARITY,
+                ttl=Config.ANSWER_CACHE_TTL,
+                max_entries=Config.ANSWER_CACHE_MAX_ENTRIES
+            )
+        
+        return cls(
+            few_shot_selector=few_shot_selector,
+            indicator_search=indicator_search,
+            agent=agent,
+            answer_cache=answer_cache,
+            fast_path=planner if Config.FAST_PATH_ENABLED else None
+        )
+    
+    @staticmethod
+    def _final_data_queries(sql_queries: List[str]) -> List[str]:
+        """
+        The statements that fetched the agent's answer
+        
+        Schema probes and SELECT DISTINCT lookups of stored values are
+        exploration. The data queries run since the last exploration are
+        the final ones; if the agent explored after its last data
+        queries, those are kept.
+        
+        Args:
+            sql_queries: Statements the agent ran successfully, in order
+        
+        Returns:
+            Final data queries in execution order
+        """
+        final, explored = [], False
+        for sql in sql_queries:
+            if _EXPLORATORY_SQL.search(sql):
+                explored = True
+            elif explored:
+                final, explored = [sql], False
+            else:
+                final.append(sql)
+        return final
+    
+    def _compact_response(self, result: Dict) -> str:
+        """
+        Build the summary input from the agent's answer and the rows behind it
+        
+        The agent's final response comes first, then the rows of its final
+        data queries, as the agent's tool fetched them (or from the result
+        cache): NULL and duplicate rows are dropped, constant columns
+        factored out and values pre-aggregated until the whole text fits
+        Config.SUMMARY_TOKEN_BUDGET. The response may take up to half the
+        budget.
+        
+        Args:
+            result: Output of WorldBankAgent.run_query()
+        
+        Returns:
+            Text passed to the summary prompt as the response
+        """
+        budget = Config.SUMMARY_TOKEN_BUDGET
+        from sqlalchemy.exc import SQLAlchemyError
+        
+        tables = []
+        fetched = result.get('rows', {})
+        for sql in self._final_data_queries(result.get('sql_queries', [])):
+            if sql in fetched:
+                tables.append(fetched[sql])
+                continue
+            try:
+                tables.append(self.agent.db.fetch_table(sql))
+            except SQLAlchemyError as e:
+                logger.warning(f"Could not re-read rows for compaction: {e}")
+        if not any(tables):
+            return truncate_to_budget(result['response'], budget)
+        
+        response = truncate_to_budget(result['response'], budget // 2)
+        label = "Rows behind this answer:"
+        compacted = compact_results(tables, max(1, budget - count_tokens(f"{response}\n\n{label}\n")))
+        return f"{response}\n\n{label}\n{compacted}"
+    
+    async def _stage(self, name: str, timings: Dict, timeout: float, fn: Callable):
+        """
+        Run a blocking stage in the stage executor with a timeout
+        
+        The work is timed as a metrics span in the worker thread, which
+        runs in a copy of the caller's context so the span carries the
+        query's trace id. On timeout or cancellation the caller stops
+        waiting; the worker thread cannot be interrupted and its result is
+        discarded.
+        
+        Args:
+            name: Stage name used for the timing and the error message
+            timings: Dictionary the stage duration is recorded in
+            timeout: Seconds to wait for the stage
+            fn: Callable without arguments doing the work
+        
+        Returns:
+            Result of fn
+        """
+        def traced():
+            with metrics.span(name):
+                return fn()
+        
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, context.run, traced), timeout
+            )
+        except asyncio.TimeoutError:
+            metrics.inc('stage_timeouts_total', stage=name)
+            raise StageTimeoutError(f"Stage '{name}' timed out after {timeout}s") from None
+        finally:
+            timings[name] = time.perf_counter() - start
+    
+    def _run_fast_path(self, plan: Dict, emit: Callable[[str, Dict], None]) -> Optional[List[Dict]]:
+        """
+        Run the planned SQL, reporting it with the same events as an agent query
+        
+        Args:
+            plan: Output of FastPathPlanner.plan() with a 'sql'
+            emit: Event callback
+        
+        Returns:
+            The fetched rows, or None if the query failed or found nothing
+        """
+        from sqlalchemy.exc import SQLAlchemyError
+        
+        emit('sql', {'query': plan['sql'], 'parameters': plan['parameters']})
+        try:
+            rows = self.agent.db.fetch_table(plan['sql'], plan['parameters'])
+        except SQLAlchemyError as e:
+            emit('sql_error', {'query': plan['sql'], 'error': str(e)})
+            logger.warning(f"Fast path query failed, falling back to the agent: {e}")
+            return None
+        emit('rows', {'query': plan['sql'], 'row_count': len(rows)})
+        if rows.truncated:
+            logger.warning(f"Fast path query stopped at {len(rows)} rows; the summary is told the data is partial")
+        return rows or None
+    
+    def _select_few_shots(self, user_query: str) -> str:
+        """Select and format the few-shot examples for a query"""
+        selected_examples = self.few_shot_selector.select_examples(user_query)
+        return self.few_shot_selector.format_examples(selected_examples)
+    
+    def run(self, user_query: str, on_event: Callable[[str, Dict], None] = None) -> str:
+        """
+        Answer a single user query
+        
+        Args:
+            user_query: Natural language query from user
+            on_event: Callback receiving pipeline events, see arun_with_details()
+        
+        Returns:
+            Summary of the query response
+        """
+        return self.run_with_details(user_query, on_event)['summary']
+    
+    def run_with_details(self, user_query: str,
+                         on_event: Callable[[str, Dict], None] = None) -> Dict:
+        """
+        Answer a single user query from synchronous code
+        
+        Runs arun_with_details() on a fresh event loop, so it must not be
+        called from a running event loop; await arun_with_details() there.
+        
+        Args:
+            user_query: Natural language query from user
+            on_event: Callback receiving pipeline events
+        
+        Returns:
+            See arun_with_details()
+        """
+        return asyncio.run(self.arun_with_details(user_query, on_event))
+    
+    async def arun_with_details(self, user_query: str,
+                                on_event: Callable[[str, Dict], None] = None) -> Dict:
+        """
+        Answer a single user query and report per-stage timings and token usage
+        
+        The indicator search runs first: its result is needed by the answer
+        cache and the fast path. Only when neither answers the question are
+        the few-shot examples selected (an embedding call) and the agent
+        run, and the summary waits for the agent. A question the fast path
+        can plan is answered with its SQL instead; it falls back to the
+        agent when the planned query fails or finds no rows. Each stage has a timeout from Config: a timed-out
+        retrieval stage is skipped (no indicator hints or no examples), a
+        timed-out agent, fast path or summary stage raises StageTimeoutError.
+        
+        If on_event is given it is called with (event name, event data) as
+        each stage finishes, in this order:
+            indicators     - {'indicator_ids'} once the indicator search is done
+            sql            - {'query'} before each SQL statement the agent runs,
+                             with its 'parameters' for fast path queries
+            rows           - {'query', 'row_count'} after a statement succeeded
+            sql_error      - {'query', 'error'} after a statement failed
+            summary_token  - {'text'} for each piece of the summary as it is generated
+            done           - the returned dictionary
+        A cached answer is sent as a single summary_token event. Events may
+        be sent from stage worker threads.
+        
+        Args:
+            user_query: Natural language query from user
+            on_event: Callback receiving pipeline events
+        
+        Returns:
+            Dictionary with the 'summary', resolved 'indicator_ids', stage
+            'timings' in seconds, 'tokens' per model, any agent 'error', the
+            answer 'cache' match type ('exact', 'similar' or None), the
+            'route' that answered it ('fast_path', 'agent', or None when
+            cached) and the agent's model calls ('iterations') and failed
+            tool calls ('tool_errors')
+        """
+        emit = on_event or (lambda event, data: None)
+        timings = {}
+        total_start = time.perf_counter()
+        new_trace_id()
+        
+        logger.info("Searching for relevant indicators...")
+        try:
+            indicators = await self._stage(
+                'indicator_search', timings, Config.STAGE_TIMEOUT_RETRIEVAL,
+                lambda: self.indicator_search.search_results(user_query, top_n=Config.TOP_N_INDICATORS)
+            )
+        except StageTimeoutError as e:
+            logger.warning(f"{e}; continuing without indicator hints")
+            indicators = []
+        indicator_ids = self.indicator_search.format_results(indicators)
+        emit('indicators', {'indicator_ids': indicator_ids})
+        
+        # Answer from cache if this question (or a close rephrasing) was answered before
+        if self.answer_cache is not None:
+            start = time.perf_counter()
+            with metrics.span('answer_cache'):
+                cached = self.answer_cache.get(user_query, indicator_ids)
+            timings['answer_cache'] = time.perf_counter() - start
+            if cached is not None:
+                logger.info(f"Answer cache hit ({cached['match']}, similarity {cached['similarity']:.2f})")
+                emit('summary_token', {'text': cached['answer']})
+                details = {
+                    'summary': cached['answer'],
+                    'indicator_ids': indicator_ids,
+                    'timings': timings,
+                    'tokens': [],
+                    'error': None,
+                    'cache': cached['match'],
+                    'route': None,
+                    'iterations': 0,
+                    'tool_errors': 0,
+                }
+                self._record_query(details, total_start)
+                emit('done', details)
+                return details
+        
+        # Questions naming indicators, places and years are answered with planned SQL
+        rows = None
+        if self.fast_path is not None:
+            plan = self.fast_path.plan(user_query, indicators)
+            if plan['sql'] is None:
+                logger.info(f"Using the agent: {plan['fallback']}")
+                metrics.inc('fast_path_total', result='fallback')
+            else:
+                logger.info("Executing fast path query...")
+                rows = await self._stage(
+                    'fast_path', timings, Config.STAGE_TIMEOUT_AGENT,
+                    lambda: self._run_fast_path(plan, emit)
+                )
+                metrics.inc('fast_path_total', result='hit' if rows else 'empty')
+        
+        if rows is None:
+            # The few-shot examples (an embedding call) are only needed by the agent
+            logger.info("Selecting few-shot examples...")
+            try:
+                formatted_examples = await self._stage(
+                    'few_shots', timings, Config.STAGE_TIMEOUT_RETRIEVAL,
+                    lambda: self._select_few_shots(user_query)
+                )
+            except StageTimeoutError as e:
+                logger.warning(f"{e}; continuing without few-shot examples")
+                formatted_examples = ""
+            
+            # Execute query; few-shots and indicator hints are prompt inputs of the shared agent
+            logger.info("Executing query...")
+            result = await self._stage(
+                'agent', timings, Config.STAGE_TIMEOUT_AGENT,
+                lambda: self.agent.run_query(
+                    user_query,
+                    few_shots=formatted_examples,
+                    indicator_hints=get_indicator_hints(indicator_ids),
+                    on_event=on_event
+                )
+            )
+        
+        # Compact the fetched rows so the summary input fits the token budget
+        start = time.perf_counter()
+        with metrics.span('compaction'):
+            if rows is None:
+                summary_input = self._compact_response(result)
+            else:
+                summary_input = compact_results([rows], Config.SUMMARY_TOKEN_BUDGET)
+        timings['compaction'] = time.perf_counter() - start
+        
+        # Generate summary
+        logger.info("Generating summary...")
+        on_token = (lambda text: emit('summary_token', {'text': text})) if on_event else None
+        summary = await self._stage(
+            'summary', timings, Config.STAGE_TIMEOUT_SUMMARY,
+            lambda: self.agent.summarize(user_query, summary_input, on_token=on_token)
+        )
+        
+        error = result['error'] if rows is None else None
+        if self.answer_cache is not None and error is None:
+            self.answer_cache.put(user_query, indicator_ids, summary['summary'])
+        
+        details = {
+            'summary': summary['summary'],
+            'indicator_ids': indicator_ids,
+            'timings': timings,
+            'tokens': [result['tokens'], summary['tokens']] if rows is None else [summary['tokens']],
+            'error': error,
+            'cache': None,
+            'route': 'agent' if rows is None else 'fast_path',
+            'iterations': result['iterations'] if rows is None else 0,
+            'tool_errors': result['tool_errors'] if rows is None else 0,
+        }
+        self._record_query(details, total_start)
+        emit('done', details)
+        return details
+    
+    def _record_query(self, details: Dict, total_start: float):
+        """
+        Record the total time, token usage and cost of a finished query
+        
+        Args:
+            details: Result dictionary of arun_with_details(); its timings get a 'total'
+            total_start: perf_counter() value when the query started
+        """
+        details['timings']['total'] = time.perf_counter() - total_start
+        metrics.observe('stage_duration_seconds', details['timings']['total'], stage='query')
+        metrics.inc('queries_total', cache=details['cache'] or 'miss',
+                    route=details['route'] or 'cache',
+                    status='error' if details['error'] else 'ok')
+        metrics.inc('agent_iterations_total', details['iterations'])
+        metrics.inc('agent_tool_errors_total', details['tool_errors'])
+        for tokens in details['tokens']:
+            metrics.record_tokens(tokens)
+        prompt_tokens = sum(tokens.get('prompt_tokens', 0) for tokens in details['tokens'])
+        cached_tokens = sum(tokens.get('cached_tokens', 0) for tokens in details['tokens'])
+        cached_ratio = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+        
+        logger.info(
+            f"Query finished in {details['timings']['total']:.2f}s "
+            f"({prompt_tokens} prompt tokens, {cached_ratio:.0%} cached)",
+            extra={'fields': {
+                'trace_id': trace_id.get(),
+                'timings_ms': {k: round(v * 1000, 1) for k, v in details['timings'].items()},
+                'tokens': details['tokens'],
+                'prompt_tokens': prompt_tokens,
+                'cached_ratio': round(cached_ratio, 3),
+                'cache': details['cache'],
+                'route': details['route'],
+                'iterations': details['iterations'],
+                'tool_errors': details['tool_errors'],
+                'error': details['error'],
+            }}
+        )
+    
+    async def stream(self, user_query: str) -> AsyncIterator[Dict]:
+        """
+        Answer a single user query, yielding pipeline events as they happen
+        
+        Each event is yielded as {'event': name, **data} (see
+        arun_with_details() for the events), so the first one arrives as
+        soon as the indicator search is done.
+        
+        Args:
+            user_query: Natural language query from user
+        
+        Yields:
+            Event dictionaries, ending with the 'done' event
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        
+        def on_event(event: str, data: Dict):
+            # Events also arrive from stage worker threads
+            loop.call_soon_threadsafe(queue.put_nowait, {'event': event, **data})
+        
+        task = asyncio.ensure_future(self.arun_with_details(user_query, on_event))
+        task.add_done_callback(lambda _: loop.call_soon_threadsafe(queue.put_nowait, None))
+        
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield item
+            
+            # Re-raise any exception from the pipeline
+            await task
+        finally:
+            task.cancel()
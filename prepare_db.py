@@ -0,0 +1,185 @@
+"""
+One-time, idempotent preparation of the World Bank database for fast queries
+
+Adds numeric columns derived from the TEXT 'year' and 'value' columns of the
+Information table, builds composite indexes for the filters the agent uses
+and runs ANALYZE. Query plans and timings for representative queries are
+reported before and after.
+
+Run from the repository root:
+    python prepare_db.py [--db data/world_bank_data_updated.db]
+"""
+import argparse
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Tuple
+
+from config import Config
+from metrics import setup_logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# Numeric columns derived from the TEXT year ("2021", "2023q4", "2015 target") and value columns
+DERIVED_COLUMNS = {
+    'year_num': "INTEGER",
+    'quarter': "INTEGER",
+    'is_target': "INTEGER",
+    'value_num': "REAL",
+}
+
+DERIVE_SQL = """
+UPDATE Information SET
+    year_num = CASE WHEN year GLOB '[0-9][0-9][0-9][0-9]*'
+                    THEN CAST(substr(year, 1, 4) AS INTEGER) END,
+    quarter = CASE WHEN lower(year) GLOB '[0-9][0-9][0-9][0-9]q[1-4]'
+                   THEN CAST(substr(year, 6, 1) AS INTEGER) END,
+    is_target = CASE WHEN lower(year) LIKE '%target%' THEN 1 ELSE 0 END,
+    value_num = CASE WHEN trim(value) GLOB '*[0-9]*'
+                      AND trim(value) NOT GLOB '*[^0-9.eE+-]*'
+                     THEN CAST(trim(value) AS REAL) END
+"""
+
+INDEXES = {
+    'idx_information_indicator_country_year': "Information (indicator_id, country_name, year)",
+    # The fast path filters on country_id, see fast_path.FastPathPlanner
+    'idx_information_indicator_countryid_year': "Information (indicator_id, country_id, year)",
+    'idx_information_indicator_region_year': "Information (indicator_id, country_region, year_num)",
+    'idx_information_country_year': "Information (country_name, year)",
+}
+
+
+def _sample_values(conn: sqlite3.Connection) -> Dict:
+    """Pick real filter values from the table for the representative queries"""
+    row = conn.execute(
+        "SELECT indicator_id, country_id, country_name, country_region FROM Information "
+        "WHERE indicator_id IS NOT NULL AND country_name IS NOT NULL LIMIT 1"
+    ).fetchone()
+    indicator_id, country_id, country_name, country_region = row or ('', '', '', '')
+    indicator_ids = [r[0] for r in conn.execute(
+        "SELECT DISTINCT indicator_id FROM Information LIMIT 3"
+    )] or [indicator_id]
+    return {
+        'indicator_id': indicator_id,
+        'indicator_ids': indicator_ids,
+        'country_id': country_id,
+        'country_name': country_name,
+        'country_region': country_region,
+    }
+
+
+def representative_queries(conn: sqlite3.Connection) -> List[Tuple[str, str, tuple]]:
+    """
+    Build the query shapes the agent issues most often
+    
+    Args:
+        conn: Open database connection
+    
+    Returns:
+        List of (label, SQL, parameters) tuples
+    """
+    values = _sample_values(conn)
+    placeholders = ", ".join("?" for _ in values['indicator_ids'])
+    return [
+        ("indicator + country + year",
+         "SELECT * FROM Information WHERE indicator_id = ? AND country_name = ? AND year = '2020'",
+         (values['indicator_id'], values['country_name'])),
+        ("indicator list + country",
+         f"SELECT * FROM Information WHERE indicator_id IN ({placeholders}) AND country_name = ?",
+         (*values['indicator_ids'], values['country_name'])),
+        ("indicator list + country code + year (fast path)",
+         f"SELECT * FROM Information WHERE indicator_id IN ({placeholders}) AND country_id IN (?) "
+         "AND year IN ('2020') AND value IS NOT NULL",
+         (*values['indicator_ids'], values['country_id'])),
+        ("indicator + region",
+         "SELECT * FROM Information WHERE indicator_id = ? AND country_region = ?",
+         (values['indicator_id'], values['country_region'])),
+        ("country + year",
+         "SELECT * FROM Information WHERE country_name = ? AND year = '2020'",
+         (values['country_name'],)),
+    ]
+
+
+def profile_queries(conn: sqlite3.Connection, queries: List[Tuple[str, str, tuple]],
+                    repeat: int = 3) -> List[Dict]:
+    """
+    Collect the query plan and best-of-N run time for each query
+    
+    Args:
+        conn: Open database connection
+        queries: List of (label, SQL, parameters) tuples
+        repeat: Number of timed runs per query
+    
+    Returns:
+        List of dictionaries with 'label', 'plan' and 'ms'
+    """
+    report = []
+    for label, sql, params in queries:
+        plan = "; ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            best = min(best, time.perf_counter() - start)
+        report.append({'label': label, 'plan': plan, 'ms': best * 1000})
+    return report
+
+
+def prepare_database(db_path: str) -> Dict:
+    """
+    Add derived numeric columns and indexes to the Information table and run ANALYZE
+    
+    Safe to run repeatedly: missing columns and indexes are created and the
+    derived values are recomputed so newly loaded rows are covered.
+    
+    Args:
+        db_path: Path to the SQLite database file
+    
+    Returns:
+        Dictionary with the 'before' and 'after' query profiles
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        queries = representative_queries(conn)
+        before = profile_queries(conn, queries)
+        
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(Information)")}
+        with conn:
+            for column, column_type in DERIVED_COLUMNS.items():
+                if column not in existing:
+                    logger.info(f"Adding column Information.{column}")
+                    conn.execute(f"ALTER TABLE Information ADD COLUMN {column} {column_type}")
+            
+            logger.info("Deriving numeric year, quarter, target and value columns...")
+            conn.execute(DERIVE_SQL)
+            
+            for name, definition in INDEXES.items():
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+        
+        logger.info("Running ANALYZE...")
+        conn.execute("ANALYZE")
+        
+        after = profile_queries(conn, queries)
+        return {'before': before, 'after': after}
+    finally:
+        conn.close()
+
+
+def print_report(report: Dict):
+    """Print before/after plans and timings side by side"""
+    for before, after in zip(report['before'], report['after']):
+        speedup = before['ms'] / after['ms'] if after['ms'] else float('inf')
+        print(f"\n{before['label']}: {before['ms']:.2f} ms -> {after['ms']:.2f} ms ({speedup:.1f}x)")
+        print(f"  before: {before['plan']}")
+        print(f"  after:  {after['plan']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prepare the World Bank database for fast queries")
+    parser.add_argument('--db', default=Config.DATABASE_PATH, help="Path to the SQLite database")
+    args = parser.parse_args()
+    
+    setup_logging()
+    print_report(prepare_database(args.db))
@@ -1,6 +1,8 @@
 """
 Prompt templates for the SQL agent and summarization
 """
+from typing import Dict
+from config import Config
 
 
 AGENT_INSTRUCTION_PROMPT = """
@@ -20,26 +22,17 @@ Always use LIMIT 150 if user asked for all results.
 """
 
 
-def get_sql_agent_prefix(few_shots: str) -> str:
-    """
-    Generate the SQL agent prefix with few-shot examples
-    
-    Args:
-        few_shots: Formatted few-shot examples
-        
-    Returns:
-        Complete SQL agent prefix prompt
-    """
-    return f"""You are an agent designed to interact with a SQL database.
+# Static part of the SQL agent system prompt; {first_year} and {columns} come from the schema catalog
+SQL_AGENT_PREFIX = """You are an agent designed to interact with a SQL database.
 First analyze the input and choose which function or tool you have to use.
 Given an input question, create a syntactically correct query to run, then look at the results of the query and return the answer.
 
 Unless the user specifies a specific number of examples they wish to obtain, do not impose a strict limit unless the result set is very large.
 You can order the results by a relevant column to return the most interesting examples in the database.
-You MUST double check your query before executing it. If you get an error while executing a query, rewrite the query and try again.
+Queries are checked before they run and obvious mistakes are corrected. If you get an error while executing a query, follow its hint, rewrite the query and try again.
 
 This is World Bank database
-The data is available from year 2015 onwards.
+The data is available from year {first_year} onwards.
 
 There are two ways to engage:
 1. First way: User will provide you 'indicator_id' you have to use them as filter in 'Information' table. and also use country in 'country_name' and dates in filters on 'year' if user specified it, and search for the relevant data in 'Information' Table.
@@ -47,7 +40,7 @@ Based on the user query, you have to provide relevant columns so that user gets
 Always SELECT * from 'Information' table.
 Always provide 'value' with 'unitofmeasure' in response.
 'country_name' table has country names in lower case (e.g, pakistan, canada, india etc.)
-'country_region' has following values in lower case(south asia, middle east & north africa, east asia & pacific, north america, europe & central asia).
+'country_region' values are in lower case; all countries, regions and periods are listed with the columns below.
 when user asks about a continent (europe, asia, oceania etc.), then randomly select 5-10 major countries from that region or continent, if asks for highest then select all those countries from that continent
 If user asks about all countries, then only mention major countries. Use LIMIT 150 logically if you think results will be larger and if user asked for all results.
 
@@ -66,79 +59,112 @@ Also you should not consider NULL values or rows.
 If the question does not seem related to the database, just return "I don't know" as the answer.
 
 These are the columns and its details in the 'Information' table.
-1. **id**:
- - **Type**: INTEGER
- - **Example Values**: 1, 2, 3  …
- - **Description**: Unique identifier for each record.
-
-2. **indicator_id**:
-  - **Type**: TEXT
-  - **Example Values**: '1.1_total.final.energy.consum', '1.2_access.electricity.rural'
-  - **Description**: Unique identifier for each indicator.
-
-3. **indicator_name**:
-  - **Type**: TEXT
-  - **Example Values**: "total final energy consumption (tfec)", "access to electricity (% of rural population)"
-  - **Description**: Name of the indicator.
-
-4. **indicator_description**:
-  - **Type**: TEXT
-  - **Example Values**: "number of rooms or single accommodations, minimally equipped, built for the first time in which a class of pupils in lower secondary school is taught. country-specific definition, method and targets are determined by countries themselves."
-"total population of pupils in primary school, regardless of age. country-specific definition, method and targets are determined by countries themselves."
-  - **Description**: Description of what the indicator measures.
-
-5. **country_id**:
-  - **Type**: TEXT
-  - **Example Values**: 'chn', 'deu', 'fra'
-  - **Description**: Unique identifier for each country.
-  - **All unique values of column**: ['afg', 'are', 'aus', 'bgd', 'can', 'chn', 'deu', 'fra', 'gbr', 'ind', 'pak', 'usa']
-
-6. **country_name**:
-  - **Type**: TEXT
-  - **Example Values**: 'france', 'united kingdom'
-  - **Description**: Full name of the country.
-  - **All unique values of column**: ['afghanistan', 'united arab emirates', 'australia', 'bangladesh', 'canada', 'china', 'germany', 'france', 'united kingdom', 'india', 'pakistan', 'united states']
-
-7. **country_region**:
-  - **Type**: TEXT
-  - **Example Values**: 'south asia', 'middle east & north africa'
-  - **Description**: Geographical region of the country.
-  - **All unique values of column**: ['south asia', 'middle east & north africa', 'east asia & pacific', 'north america', 'europe & central asia']
-
-8. **country_incomelevel**:
-  - **Type**: TEXT
-  - **Example Values**: 'low income', 'high income'
-  - **Description**: Income classification of the country.
-  - **All unique values of column**: ['low income', 'high income', 'lower middle income', 'upper middle income']
-
-9. **country_lendingtype**:
-  - **Type**: TEXT
-  - **Example Values**: 'Ibrd', 'blend'
-  - **Description**: Type of lending classification for the country.
-  - **All unique values of column**: ['Ida', 'not classified','Ibrd', 'blend']
-
-10. **year**:
-    - **Type**: TEXT
-    - **Example Values**: "2016", "2015"
-    - **Description**: Year of the record.
-    - **All unique values of column**: ["2016", "2015", "2015 target", "2021", "2017", "2020", "2019", "2018", "2022", "2023", "2100", "2050", "2030", "2024", "2024q1", "2023q4", "2023q3", "2023q2", "2023q1", "2022q4", "2022q3", "2022q2", "2022q1", "2021q4", "2021q3", "2021q2", "2021q1", "2020q4", "2020q3", "2020q2", "2020q1", "2019q4", "2019q3", "2019q2", "2019q1", "2018q4", "2018q3", "2018q2", "2018q1", "2017q4", "2017q3", "2017q2", "2017q1", "2016q4", "2016q3", "2016q2", "2016q1", "2015q4", "2015q3", "2015q2", "2015q1", "2024q2", "2026", "2025", "2095", "2090", "2085", "2080", "2075", "2070", "2065", "2060", "2055", "2045", "2040", "2035"]
-
-11. **value**:
-    - **Type**: TEXT
-    - **Example Values**: "2.5", "500000", "7.8"
-    - **Description**: Measured value for the indicator.
-
-12. **unitofmeasure**:
-    - **Type**: TEXT
-    - **Example Values**: 'Percent', '% of land area', 'hectares', '% of total', 'Kg per hectare'
-    - **Description**: Unit of measurement for the indicator value.
-
-
-### Relevant Few-Shot Examples:
+{columns}
+"""
+
+# (column, example values, description) of the 'Information' columns, in table order
+COLUMN_DESCRIPTIONS = [
+    ('id', "1, 2, 3  …", "Unique identifier for each record."),
+    ('indicator_id', "'1.1_total.final.energy.consum', '1.2_access.electricity.rural'",
+     "Unique identifier for each indicator."),
+    ('indicator_name', '"total final energy consumption (tfec)", "access to electricity (% of rural population)"',
+     "Name of the indicator."),
+    ('indicator_description',
+     '"total population of pupils in primary school, regardless of age. country-specific definition, '
+     'method and targets are determined by countries themselves."',
+     "Description of what the indicator measures."),
+    ('country_id', "'chn', 'deu', 'fra'", "Unique identifier for each country."),
+    ('country_name', "'france', 'united kingdom'", "Full name of the country."),
+    ('country_region', "'south asia', 'middle east & north africa'", "Geographical region of the country."),
+    ('country_incomelevel', "'low income', 'high income'", "Income classification of the country."),
+    ('country_lendingtype', "'Ibrd', 'blend'", "Type of lending classification for the country."),
+    ('year', '"2016", "2015"', "Year of the record."),
+    ('value', '"2.5", "500000", "7.8"', "Measured value for the indicator."),
+    ('unitofmeasure', "'Percent', '% of land area', 'hectares'", "Unit of measurement for the indicator value."),
+]
+
+# Per-query part of the system prompt, sent after the static prefix
+FEW_SHOTS_PROMPT = """### Relevant Few-Shot Examples:
 {few_shots}
 """
 
 
+def format_columns(catalog: Dict) -> str:
+    """
+    Describe the 'Information' columns with the value lists from the schema catalog
+    
+    Args:
+        catalog: Catalog from schema_catalog.load_schema_catalog()
+        
+    Returns:
+        Column details for the SQL agent prefix
+    """
+    from schema_catalog import compact_values, compact_years
+    
+    countries = catalog['countries']
+    all_values = {
+        'country_id': "see country_name",
+        'country_name': (
+            "(country_id: country_name) " + ", ".join(f"{cid}: {name}" for cid, name in countries)
+            if len(countries) <= Config.SCHEMA_CATALOG_MAX_VALUES
+            else compact_values([name for _, name in countries])
+        ),
+        'year': compact_years(catalog['years']),
+        **{column: compact_values(values) for column, values in catalog['values'].items()},
+    }
+    
+    sections = []
+    for number, (column, examples, description) in enumerate(COLUMN_DESCRIPTIONS, start=1):
+        lines = [
+            f"{number}. **{column}**:",
+            f"  - **Type**: {catalog['types'].get(column, 'TEXT')}",
+            f"  - **Example Values**: {examples}",
+            f"  - **Description**: {description}",
+        ]
+        if column in all_values:
+            lines.append(f"  - **All unique values of column**: {all_values[column]}")
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def get_sql_agent_prefix(catalog: Dict) -> str:
+    """
+    Generate the static SQL agent system prompt
+    
+    It is identical for every query against the same database, so the
+    provider can serve it from its prompt cache; the few-shot examples
+    follow in a separate message (see FEW_SHOTS_PROMPT).
+    
+    Args:
+        catalog: Catalog from schema_catalog.load_schema_catalog()
+        
+    Returns:
+        SQL agent instructions, column catalog and response guidelines
+    """
+    annual = [int(year) for year in catalog['years'] if year.isdigit()]
+    first_year = min(annual) if annual else 2015
+    prefix = SQL_AGENT_PREFIX.format(first_year=first_year, columns=format_columns(catalog))
+    return prefix + "\n" + AGENT_INSTRUCTION_PROMPT
+
+
+def get_indicator_hints(indicator_ids: str) -> str:
+    """
+    Generate the hint appended to the user query listing candidate indicators
+    
+    Args:
+        indicator_ids: Formatted indicator IDs and names from IndicatorSearch
+        
+    Returns:
+        Hint text, or an empty string if no indicators were found
+    """
+    if not indicator_ids:
+        return ""
+    return (
+        f" . **You should use relevant indicator_id's from these based on their description** "
+        f"{{ indicator_id = {indicator_ids} }}"
+    )
+
+
 SQL_AGENT_SUFFIX = """I should look at the input and select which function to call, always double check input and select appropriate function.
 If the input is related to database then I should look at the tables in the database to see what I can query. Then I should query the schema of the most relevant tables."""
 
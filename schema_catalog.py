@@ -0,0 +1,188 @@
+"""
+Column catalog of the Information table, generated from the database and cached on disk
+"""
+import json
+import logging
+import os
+import re
+from typing import Dict, List
+from sqlalchemy import text
+from config import Config
+from metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'Information'
+
+# Low-cardinality columns whose distinct values are listed in the prompt
+VALUE_COLUMNS = ('country_region', 'country_incomelevel', 'country_lendingtype', 'unitofmeasure')
+
+_ANNUAL = re.compile(r"^(\d{4})$")
+_QUARTERLY = re.compile(r"^(\d{4})q([1-4])$")
+
+
+def build_schema_catalog(db) -> Dict:
+    """
+    Read column types and distinct values from the database
+    
+    Args:
+        db: CachedSQLDatabase to read from
+    
+    Returns:
+        Dictionary with the column 'types', the 'countries' as
+        (id, name) pairs, the distinct 'years' and the distinct 'values'
+        of VALUE_COLUMNS
+    """
+    with db._engine.connect() as conn:
+        types = {
+            row[1]: row[2] for row in conn.execute(text(f"PRAGMA table_info({TABLE_NAME})"))
+        }
+        countries = [
+            list(row) for row in conn.execute(text(
+                f"SELECT DISTINCT country_id, country_name FROM {TABLE_NAME} "
+                f"WHERE country_name IS NOT NULL ORDER BY country_id"
+            ))
+        ]
+        years = [
+            row[0] for row in conn.execute(text(
+                f"SELECT DISTINCT year FROM {TABLE_NAME} WHERE year IS NOT NULL ORDER BY year"
+            ))
+        ]
+        values = {
+            column: [row[0] for row in conn.execute(text(
+                f"SELECT DISTINCT {column} FROM {TABLE_NAME} "
+                f"WHERE {column} IS NOT NULL ORDER BY {column}"
+            ))]
+            for column in VALUE_COLUMNS
+        }
+    return {'types': types, 'countries': countries, 'years': years, 'values': values}
+
+
+def load_schema_catalog(db, cache_path: str = None) -> Dict:
+    """
+    Load the schema catalog, regenerating it when the database changed
+    
+    The catalog is cached as JSON together with the database fingerprint,
+    so the distinct-value scans only run after the data was modified.
+    
+    Args:
+        db: CachedSQLDatabase to describe
+        cache_path: JSON cache file, defaults to Config.SCHEMA_CATALOG_PATH
+    
+    Returns:
+        Catalog dictionary, see build_schema_catalog()
+    """
+    cache_path = cache_path or Config.SCHEMA_CATALOG_PATH
+    fingerprint = db.database_fingerprint()
+    version = repr(fingerprint)
+    
+    if fingerprint is not None and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r') as f:
+                cached = json.load(f)
+            if cached.get('version') == version:
+                return cached['catalog']
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable schema catalog {cache_path}: {e}")
+    
+    with metrics.span('schema_catalog_build'):
+        catalog = build_schema_catalog(db)
+    logger.info(f"Built schema catalog: {len(catalog['countries'])} countries, {len(catalog['years'])} periods")
+    
+    if fingerprint is not None:
+        tmp_path = f"{cache_path}.tmp-{os.getpid()}"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': version, 'catalog': catalog}, f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not save schema catalog to {cache_path}: {e}")
+    return catalog
+
+
+def compact_runs(numbers: List[int], unit: str = 'years') -> List[str]:
+    """
+    Describe sorted integers as ranges with a constant step
+    
+    Args:
+        numbers: Sorted, distinct integers
+        unit: Unit named for steps larger than one
+    
+    Returns:
+        Parts such as '2015-2026', '2030-2100 every 5 years' or '2028'
+    """
+    parts = []
+    i = 0
+    while i < len(numbers):
+        j = i
+        if i + 2 < len(numbers):
+            step = numbers[i + 1] - numbers[i]
+            while j + 1 < len(numbers) and numbers[j + 1] - numbers[j] == step:
+                j += 1
+        if j - i >= 2:
+            parts.append(f"{numbers[i]}-{numbers[j]}" + (f" every {step} {unit}" if step > 1 else ""))
+            i = j + 1
+        else:
+            parts.append(str(numbers[i]))
+            i += 1
+    return parts
+
+
+def compact_years(years: List[str]) -> str:
+    """
+    Summarize the distinct values of the year column
+    
+    Args:
+        years: Distinct year strings such as '2021', '2023q4' or '2030 target'
+    
+    Returns:
+        Compact description, e.g. 'annual 2015-2026, 2030-2100 every 5 years;
+        quarterly (e.g. "2015q1") all quarters of 2015-2023, "2024q1"; other: "2015 target"'
+    """
+    annual, quarters, other = set(), {}, []
+    for year in years:
+        match = _ANNUAL.match(year)
+        if match:
+            annual.add(int(match.group(1)))
+            continue
+        match = _QUARTERLY.match(year)
+        if match:
+            quarters.setdefault(int(match.group(1)), set()).add(int(match.group(2)))
+            continue
+        other.append(year)
+    
+    parts = []
+    if annual:
+        parts.append("annual " + ", ".join(compact_runs(sorted(annual))))
+    if quarters:
+        full_years = sorted(y for y, q in quarters.items() if len(q) == 4)
+        partial = [f'"{y}q{q}"' for y in sorted(quarters) if len(quarters[y]) < 4
+                   for q in sorted(quarters[y])]
+        described = []
+        if full_years:
+            described.append("all quarters of " + ", ".join(compact_runs(full_years)))
+        described.extend(partial)
+        example = f"{min(quarters)}q{min(quarters[min(quarters)])}"
+        parts.append(f'quarterly (e.g. "{example}") ' + ", ".join(described))
+    if other:
+        parts.append("other: " + ", ".join(f'"{year}"' for year in other))
+    return "; ".join(parts)
+
+
+def compact_values(values: List[str], max_values: int = None) -> str:
+    """
+    List distinct values, or a count and a few examples when there are too many
+    
+    Args:
+        values: Distinct values
+        max_values: Most values listed in full, defaults to Config.SCHEMA_CATALOG_MAX_VALUES
+    
+    Returns:
+        Value list text
+    """
+    max_values = max_values or Config.SCHEMA_CATALOG_MAX_VALUES
+    quoted = [f"'{value}'" for value in values]
+    if len(quoted) <= max_values:
+        return ", ".join(quoted)
+    return f"{len(quoted)} values, e.g. " + ", ".join(quoted[:10])
@@ -0,0 +1,329 @@
+"""
+Long-lived HTTP service that keeps the query pipeline warm between requests
+
+Endpoints:
+    GET  /healthz  - process is up
+    GET  /readyz   - pipeline is loaded and can take queries
+    GET  /metrics  - Prometheus text metrics
+    POST /query    - {"query": "..."} -> {"query": "...", "summary": "..."}
+    POST /query/stream - {"query": "..."} -> newline-delimited JSON pipeline events
+    POST /reload   - rebuild the pipeline from the current data files
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+
+from config import Config
+from llm_scheduler import scheduler
+from metrics import metrics, setup_logging
+from pipeline import QueryPipeline
+from utils import data_files_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceBusyError(RuntimeError):
+    """Raised when no query slot frees up within the queue timeout"""
+
+
+class PipelineService:
+    """Owns a warm QueryPipeline, limits concurrency and reloads on data changes"""
+    
+    def __init__(self, pipeline_factory: Callable[[], QueryPipeline] = None,
+                 max_concurrency: int = None, queue_timeout: float = None,
+                 reload_interval: float = None):
+        """
+        Initialize the service
+        
+        Args:
+            pipeline_factory: Callable building a ready pipeline
+            max_concurrency: Maximum number of queries processed at once
+            queue_timeout: Seconds a query waits for a free slot before being rejected
+            reload_interval: Seconds between checks of the data files for changes
+        """
+        self.pipeline_factory = pipeline_factory or QueryPipeline.from_config
+        self.max_concurrency = max_concurrency or Config.SERVICE_MAX_CONCURRENCY
+        self.queue_timeout = queue_timeout if queue_timeout is not None else Config.SERVICE_QUEUE_TIMEOUT
+        self.reload_interval = reload_interval or Config.SERVICE_RELOAD_INTERVAL
+        
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pipeline = None
+        self._fingerprint = None
+        self._loaded_at = None
+        self._in_flight = 0
+        # Queries running per pipeline, and replaced pipelines closed once theirs finish
+        self._pipeline_queries = Counter()
+        self._retired = set()
+        self._last_error = None
+    
+    def start(self):
+        """Load the pipeline in the background and start watching the data files"""
+        threading.Thread(target=self._watch, name="pipeline-watcher", daemon=True).start()
+    
+    def stop(self):
+        """Stop watching the data files"""
+        self._stop.set()
+    
+    def reload(self) -> bool:
+        """
+        Rebuild the pipeline and swap it in once it is ready
+        
+        Queries already running keep using the previous pipeline, which is
+        closed once the last of them finished. If the rebuild fails the
+        previous pipeline stays in service.
+        
+        Returns:
+            True if the new pipeline was swapped in
+        """
+        with self._reload_lock:
+            fingerprint = data_files_fingerprint()
+            try:
+                pipeline = self.pipeline_factory()
+            except Exception as e:
+                logger.error(f"Pipeline reload failed: {e}")
+                self._last_error = str(e)
+                return False
+            
+            with self._lock:
+                previous, self._pipeline = self._pipeline, pipeline
+                self._fingerprint = fingerprint
+                self._loaded_at = time.time()
+                self._last_error = None
+                if previous is not None and self._pipeline_queries[previous]:
+                    self._retired.add(previous)
+                    previous = None
+            if previous is not None:
+                previous.close()
+            logger.info("Pipeline loaded")
+            return True
+    
+    def _watch(self):
+        """Reload the pipeline whenever the database or few-shot file changes"""
+        self.reload()
+        while not self._stop.wait(self.reload_interval):
+            if data_files_fingerprint() != self._fingerprint:
+                logger.info("Data files changed, reloading pipeline...")
+                self.reload()
+            try:
+                metrics.write_prometheus()
+            except OSError as e:
+                logger.warning(f"Could not write metrics file: {e}")
+    
+    @property
+    def ready(self) -> bool:
+        """Whether a pipeline is loaded"""
+        return self._pipeline is not None
+    
+    def status(self) -> dict:
+        """
+        Describe the service state for health and readiness checks
+        
+        Returns:
+            Dictionary with readiness, load and concurrency details, and
+            the queue depth and waiting of the LLM scheduler per model
+        """
+        with self._lock:
+            pipeline = self._pipeline
+            status = {
+                'ready': self.ready,
+                'loaded_at': self._loaded_at,
+                'in_flight': self._in_flight,
+                'max_concurrency': self.max_concurrency,
+                'last_error': self._last_error,
+            }
+        
+        sql_cache = pipeline.agent.db.sql_cache if pipeline is not None else None
+        if sql_cache is not None:
+            status['sql_cache'] = sql_cache.stats()
+        status['llm_scheduler'] = scheduler.stats()
+        return status
+    
+    def query(self, user_query: str, on_event: Callable[[str, Dict], None] = None) -> str:
+        """
+        Answer a query with the current pipeline
+        
+        Args:
+            user_query: Natural language query from user
+            on_event: Callback receiving pipeline events as they happen
+        
+        Returns:
+            Summary of the query response
+        """
+        if not self.ready:
+            raise ServiceBusyError("Pipeline is still loading")
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise ServiceBusyError("Too many concurrent queries")
+        
+        try:
+            with self._lock:
+                pipeline = self._pipeline
+                self._in_flight += 1
+                self._pipeline_queries[pipeline] += 1
+            return pipeline.run(user_query, on_event)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._pipeline_queries[pipeline] -= 1
+                if not self._pipeline_queries[pipeline]:
+                    del self._pipeline_queries[pipeline]
+                closing = pipeline in self._retired and pipeline not in self._pipeline_queries
+                if closing:
+                    self._retired.remove(pipeline)
+            if closing:
+                pipeline.close()
+            self._slots.release()
+
+
+def make_handler(service: PipelineService):
+    """
+    Build an HTTP request handler bound to a service
+    
+    Args:
+        service: Service answering the requests
+    
+    Returns:
+        BaseHTTPRequestHandler subclass
+    """
+    class Handler(BaseHTTPRequestHandler):
+        """JSON request handler for the pipeline service"""
+        
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def _read_json(self) -> dict:
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'{}')
+        
+        def do_GET(self):
+            if self.path == '/healthz':
+                self._send_json(200, {'status': 'ok'})
+            elif self.path == '/readyz':
+                status = service.status()
+                self._send_json(200 if status['ready'] else 503, status)
+            elif self.path == '/metrics':
+                body = metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._send_json(404, {'error': 'not found'})
+        
+        def _stream_query(self, user_query: str):
+            """Send pipeline events as newline-delimited JSON while the query runs"""
+            started = False
+            
+            def send_event(event: str, data: Dict):
+                nonlocal started
+                if not started:
+                    # HTTP/1.0 response without Content-Length: the body ends when the connection closes
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/x-ndjson')
+                    self.send_header('Cache-Control', 'no-cache')
+                    self.end_headers()
+                    started = True
+                self.wfile.write((json.dumps({'event': event, **data}, default=str) + "\n").encode('utf-8'))
+                self.wfile.flush()
+            
+            try:
+                service.query(user_query, on_event=send_event)
+            except (BrokenPipeError, ConnectionResetError):
+                logger.info("Client disconnected while streaming")
+            except Exception as e:
+                status = 503 if isinstance(e, ServiceBusyError) else 500
+                if not isinstance(e, ServiceBusyError):
+                    logger.error(f"Error while answering query: {e}")
+                if started:
+                    send_event('error', {'error': str(e)})
+                else:
+                    self._send_json(status, {'error': str(e)})
+        
+        def do_POST(self):
+            if self.path == '/reload':
+                reloaded = service.reload()
+                self._send_json(200 if reloaded else 500, service.status())
+                return
+            if self.path not in ('/query', '/query/stream'):
+                self._send_json(404, {'error': 'not found'})
+                return
+            
+            try:
+                user_query = self._read_json().get('query')
+            except (ValueError, AttributeError):
+                self._send_json(400, {'error': 'body must be a JSON object'})
+                return
+            if not isinstance(user_query, str) or not user_query.strip():
+                self._send_json(400, {'error': "'query' must be a non-empty string"})
+                return
+            
+            if self.path == '/query/stream':
+                self._stream_query(user_query)
+                return
+            
+            start = time.time()
+            try:
+                summary = service.query(user_query)
+            except ServiceBusyError as e:
+                self._send_json(503, {'error': str(e)})
+                return
+            except Exception as e:
+                logger.error(f"Error while answering query: {e}")
+                self._send_json(500, {'error': str(e)})
+                return
+            
+            self._send_json(200, {
+                'query': user_query,
+                'summary': summary,
+                'elapsed_seconds': round(time.time() - start, 3),
+            })
+    
+    return Handler
+
+
+def serve(host: str = None, port: int = None):
+    """
+    Run the service until interrupted
+    
+    Args:
+        host: Interface to bind
+        port: Port to listen on
+    """
+    host = host or Config.SERVICE_HOST
+    port = port or Config.SERVICE_PORT
+    
+    service = PipelineService()
+    service.start()
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    logger.info(f"Serving on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the World Bank SQL Agent as a service")
+    parser.add_argument('--host', default=None, help="Interface to bind")
+    parser.add_argument('--port', type=int, default=None, help="Port to listen on")
+    args = parser.parse_args()
+    
+    setup_logging()
+    serve(args.host, args.port)
@@ -0,0 +1,186 @@
+"""
+Result cache for read-only SQL queries issued by the agent
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+_TOKEN_PATTERN = re.compile(r"""
+    '(?:[^']|'')*'          # string literal
+  | "(?:[^"]|"")*"          # quoted identifier
+  | \d+(?:\.\d+)?           # number
+  | \w+                     # keyword or identifier
+  | <=|>=|<>|!=|\|\||\S     # operator or punctuation
+""", re.VERBOSE)
+
+
+def _is_literal(token: str) -> bool:
+    """Whether a token is a string or numeric literal"""
+    return token.startswith("'") or token[0].isdigit()
+
+
+def _sort_in_lists(tokens: list) -> list:
+    """Sort and deduplicate the items of IN (...) lists made only of literals"""
+    result = []
+    i = 0
+    while i < len(tokens):
+        result.append(tokens[i])
+        if tokens[i] == 'IN' and i + 1 < len(tokens) and tokens[i + 1] == '(':
+            end = i + 2
+            while end < len(tokens) and tokens[end] != ')':
+                end += 1
+            items = tokens[i + 2:end:2]
+            separators = tokens[i + 3:end:2]
+            if (end < len(tokens) and items and all(_is_literal(t) for t in items)
+                    and all(sep == ',' for sep in separators)):
+                ordered = sorted(set(items))
+                result.append('(')
+                result.append(' , '.join(ordered))
+                result.append(')')
+                i = end + 1
+                continue
+        i += 1
+    return result
+
+
+def normalize_sql(command: str) -> str:
+    """
+    Normalize a SQL statement so trivially different spellings share a cache key
+    
+    Whitespace is collapsed, keywords and identifiers are upper-cased, a
+    trailing semicolon is dropped and literal IN (...) lists are sorted.
+    String literals keep their case.
+    
+    Args:
+        command: SQL statement
+        
+    Returns:
+        Normalized SQL text
+    """
+    tokens = [
+        token if token.startswith(("'", '"')) else token.upper()
+        for token in _TOKEN_PATTERN.findall(command)
+    ]
+    while tokens and tokens[-1] == ';':
+        tokens.pop()
+    return ' '.join(_sort_in_lists(tokens))
+
+
+def is_read_query(command: str) -> bool:
+    """
+    Whether a statement only reads data and may be cached
+    
+    Args:
+        command: SQL statement
+        
+    Returns:
+        True for SELECT and WITH statements
+    """
+    return re.match(r"\s*(SELECT|WITH)\b", command, re.IGNORECASE) is not None
+
+
+class SQLResultCache:
+    """Thread-safe LRU cache of query results bounded by entry count and size in bytes"""
+    
+    def __init__(self, max_bytes: int, max_entries: int):
+        """
+        Initialize the cache
+        
+        Args:
+            max_bytes: Maximum total size of cached results in bytes
+            max_entries: Maximum number of cached results
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+    
+    def _check_version(self, version: Hashable):
+        """Drop every entry if the database version changed (caller holds the lock)"""
+        if version != self._version:
+            if self._entries:
+                self._invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+    
+    def get(self, key: Hashable, version: Hashable) -> Optional[str]:
+        """
+        Look up a cached result
+        
+        Args:
+            key: Cache key of the query
+            version: Current database version
+            
+        Returns:
+            Cached result, or None on a miss
+        """
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+    
+    def put(self, key: Hashable, version: Hashable, result: str):
+        """
+        Store a query result, evicting least recently used entries as needed
+        
+        Args:
+            key: Cache key of the query
+            version: Database version the result was read from
+            result: Query result
+        """
+        size = len(result.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            self._check_version(version)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+    
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self) -> Dict:
+        """
+        Report cache statistics
+        
+        Returns:
+            Dictionary of hit, miss, eviction and size counters
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
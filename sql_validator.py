@@ -0,0 +1,243 @@
+"""
+Local validation and repair of the agent's SQL before it is executed
+"""
+import difflib
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from config import Config
+from schema_catalog import TABLE_NAME
+
+
+logger = logging.getLogger(__name__)
+
+# Statements that write or change the database; none of them may appear in a query
+WRITE_STATEMENTS = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|REPLACE\s+INTO|DROP|ALTER|CREATE|ATTACH|DETACH|PRAGMA|VACUUM|REINDEX)\b",
+    re.IGNORECASE
+)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r"\x00(\d+)\x00")
+_NUMBER = r"-?\d+(?:\.\d+)?"
+_COLUMN = r"(?:\w+\.)?"
+_COMPARISON = r"(==|=|!=|<>|<=|>=|<|>)"
+# Comments, semicolons and whitespace after the last clause of a statement
+_TRAILING = re.compile(r"(?:\s|;|--[^\n]*|/\*(?:(?!\*/).)*\*/)+$", re.DOTALL)
+_COMPOUND = re.compile(r"\b(UNION|INTERSECT|EXCEPT)\b", re.IGNORECASE)
+_LIMIT = re.compile(r"\bLIMIT\s+\d+(\s*(,|OFFSET)\s*\d+)?\s*$", re.IGNORECASE)
+
+
+class SQLValidator:
+    """
+    Checks the agent's queries locally and repairs common mistakes
+
+    Only single read statements pass. Before a query runs, literals of
+    the catalog columns are given their stored spelling ('France' becomes
+    'france'), years compared for equality are quoted like the stored
+    TEXT, year ranges and the value column are compared as numbers, and
+    a LIMIT is added when the
+    query has none. The repaired query is compiled with EXPLAIN, so
+    unknown tables and columns are reported with the closest valid names
+    without running the query or asking the model to check it.
+    """
+
+    def __init__(self, db, catalog: Dict):
+        """
+        Read the table columns and index the catalog values
+
+        Args:
+            db: CachedSQLDatabase the queries run against
+            catalog: Schema catalog, see schema_catalog.build_schema_catalog()
+        """
+        self.db = db
+        self.tables = {}
+        with db._engine.connect() as conn:
+            for table in db.get_usable_table_names():
+                self.tables[table] = [row[1] for row in conn.execute(text(f"PRAGMA table_info('{table}')"))]
+        columns = set(self.tables.get(TABLE_NAME, []))
+        self.numeric_year = 'year_num' in columns
+        self.numeric_value = 'value_num' in columns
+
+        # Stored spelling of every catalog value, by column and lowercase value
+        self.values = {
+            'country_id': {str(c[0]).lower(): c[0] for c in catalog['countries']},
+            'country_name': {str(c[1]).lower(): c[1] for c in catalog['countries']},
+        }
+        for column, values in catalog['values'].items():
+            self.values[column] = {str(value).lower(): value for value in values}
+        self._value_columns = re.compile(
+            rf"\b{_COLUMN}({'|'.join(self.values)})\s*(==|=|!=|<>|\bIN\s*\(|\bNOT\s+IN\s*\()\s*",
+            re.IGNORECASE
+        )
+
+    @staticmethod
+    def _mask_literals(sql: str) -> Tuple[str, List[str]]:
+        """Replace string literals with numbered placeholders so the rules never look inside them"""
+        literals = []
+
+        def mask(match):
+            literals.append(match.group(0))
+            return f"\x00{len(literals) - 1}\x00"
+
+        return _STRING_LITERAL.sub(mask, sql), literals
+
+    @staticmethod
+    def _unmask_literals(sql: str, literals: List[str]) -> str:
+        return _PLACEHOLDER.sub(lambda m: literals[int(m.group(1))], sql)
+
+    def _fix_literal_case(self, masked: str, literals: List[str], fixes: List[str]):
+        """Give literals compared with catalog columns their stored spelling"""
+        for match in self._value_columns.finditer(masked):
+            stored = self.values[match.group(1).lower()]
+            rest = masked[match.end():]
+            if match.group(2).strip().upper().endswith('('):
+                rest = rest[:rest.find(')')] if ')' in rest else ''
+            else:
+                rest = rest[:rest.find('\x00', 1) + 1] if rest.startswith('\x00') else ''
+            for index in _PLACEHOLDER.findall(rest):
+                index = int(index)
+                value = literals[index][1:-1].replace("''", "'")
+                fixed = stored.get(value.lower())
+                if fixed is not None and fixed != value:
+                    literals[index] = "'" + str(fixed).replace("'", "''") + "'"
+                    fixes.append(f"{match.group(1)} '{value}' written as '{fixed}'")
+
+    def _fix_numeric_columns(self, masked: str, literals: List[str], fixes: List[str]) -> str:
+        """Compare, order and aggregate the TEXT year and value columns numerically"""
+        year_number = re.compile(rf"\b({_COLUMN})year\s*{_COMPARISON}\s*({_NUMBER})\b", re.IGNORECASE)
+        year_literal = re.compile(rf"\b({_COLUMN})year\s*(<=|>=|<|>)\s*\x00(\d+)\x00", re.IGNORECASE)
+        year_between = re.compile(
+            rf"\b({_COLUMN})year\s+BETWEEN\s+({_NUMBER})\s+AND\s+({_NUMBER})\b", re.IGNORECASE
+        )
+        year_in = re.compile(rf"\b({_COLUMN})year\s+IN\s*\(\s*({_NUMBER}(?:\s*,\s*{_NUMBER})*)\s*\)", re.IGNORECASE)
+
+        def numeric_year(prefix: str) -> str:
+            # Quoted years would be compared as text, where '999' > '2018'
+            return f"{prefix}year_num" if self.numeric_year else f"CAST({prefix}year AS INTEGER)"
+
+        def fix_year(match):
+            prefix, op, number = match.groups()
+            if op in ('==', '=', '!=', '<>'):
+                return f"{prefix}year {op} '{number}'"
+            return f"{numeric_year(prefix)} {op} {number}"
+
+        def fix_year_literal(match):
+            prefix, op, index = match.groups()
+            number = literals[int(index)][1:-1].strip()
+            if not re.fullmatch(_NUMBER, number):
+                return match.group(0)
+            return f"{numeric_year(prefix)} {op} {number}"
+
+        def fix_year_between(match):
+            prefix, low, high = match.groups()
+            return f"{numeric_year(prefix)} BETWEEN {low} AND {high}"
+
+        def fix_year_in(match):
+            prefix, numbers = match.groups()
+            return f"{prefix}year IN (" + ", ".join(f"'{n.strip()}'" for n in numbers.split(',')) + ")"
+
+        repaired = year_number.sub(fix_year, masked)
+        repaired = year_literal.sub(fix_year_literal, repaired)
+        repaired = year_between.sub(fix_year_between, repaired)
+        repaired = year_in.sub(fix_year_in, repaired)
+        if repaired != masked:
+            fixes.append("year numbers quoted as TEXT for equality, compared as numbers in ranges")
+
+        def numeric_value(prefix: str) -> str:
+            return f"{prefix}value_num" if self.numeric_value else f"CAST({prefix}value AS REAL)"
+
+        value_number = re.compile(rf"\b({_COLUMN})value\s*{_COMPARISON}\s*({_NUMBER})\b", re.IGNORECASE)
+        value_order = re.compile(rf"(\bORDER\s+BY\s+(?:[^;]*?,\s*)?)({_COLUMN})value\b(?!\s*\()", re.IGNORECASE)
+        value_extreme = re.compile(rf"\b(MAX|MIN)\s*\(\s*({_COLUMN})value\s*\)", re.IGNORECASE)
+
+        before = repaired
+        repaired = value_number.sub(lambda m: f"{numeric_value(m.group(1))} {m.group(2)} {m.group(3)}", repaired)
+        # ORDER BY terms of a compound SELECT must be result columns, so a CAST is not allowed there
+        if not _COMPOUND.search(repaired):
+            repaired = value_order.sub(lambda m: m.group(1) + numeric_value(m.group(2)), repaired)
+        repaired = value_extreme.sub(lambda m: f"{m.group(1)}({numeric_value(m.group(2))})", repaired)
+        if repaired != before:
+            fixes.append("value compared, ordered and aggregated as a number")
+        return repaired
+
+    def repair(self, sql: str) -> Tuple[str, List[str]]:
+        """
+        Fix common mistakes in a query without touching the database
+
+        Args:
+            sql: Query written by the agent
+
+        Returns:
+            Tuple of (repaired query, descriptions of the fixes applied)
+        """
+        fixes = []
+        masked, literals = self._mask_literals(sql)
+        # A LIMIT appended after a trailing -- comment would be commented out
+        masked = _TRAILING.sub("", masked)
+        self._fix_literal_case(masked, literals, fixes)
+        masked = self._fix_numeric_columns(masked, literals, fixes)
+        if re.match(r"\s*(SELECT|WITH)\b", masked, re.IGNORECASE) and not _LIMIT.search(masked):
+            masked = f"{masked} LIMIT {int(Config.DEFAULT_LIMIT)}"
+            fixes.append(f"LIMIT {int(Config.DEFAULT_LIMIT)} added")
+        return self._unmask_literals(masked, literals), fixes
+
+    def check(self, sql: str) -> Optional[str]:
+        """
+        Reject writes and compile the query with EXPLAIN
+
+        Args:
+            sql: Query to check
+
+        Returns:
+            Error message with a hint for fixing the query, or None if it compiles
+        """
+        masked, _ = self._mask_literals(sql)
+        if ';' in masked.strip().rstrip(';'):
+            return "Only one statement can be run at a time; send a single SELECT query."
+        write = WRITE_STATEMENTS.search(masked)
+        if write or not re.match(r"\s*(SELECT|WITH)\b", masked, re.IGNORECASE):
+            statement = write.group(1).upper() if write else "This statement"
+            return f"{statement} is not allowed: the database is read-only, only SELECT queries can be run."
+
+        try:
+            with self.db._engine.connect() as conn:
+                conn.execute(text(f"EXPLAIN {sql}")).fetchall()
+        except SQLAlchemyError as e:
+            return self._hint(str(getattr(e, 'orig', None) or e))
+        return None
+
+    def _hint(self, error: str) -> str:
+        """Turn a SQLite compile error into a message naming the valid tables or columns"""
+        match = re.search(r"no such column: (?:\w+\.)?(\w+)", error)
+        if match:
+            all_columns = sorted({c for columns in self.tables.values() for c in columns})
+            close = difflib.get_close_matches(match.group(1), all_columns, n=3)
+            suggestion = f" Did you mean {', '.join(close)}?" if close else ""
+            return (f"{error}.{suggestion} Columns of {TABLE_NAME}: "
+                    f"{', '.join(self.tables.get(TABLE_NAME, []))}.")
+        match = re.search(r"no such table: (?:\w+\.)?(\w+)", error)
+        if match:
+            close = difflib.get_close_matches(match.group(1), list(self.tables), n=1)
+            suggestion = f" Did you mean {close[0]}?" if close else ""
+            return f"{error}.{suggestion} Tables: {', '.join(self.tables)}."
+        return f"{error}. Rewrite the query and try again."
+
+    def validate(self, sql: str) -> Dict:
+        """
+        Repair and check a query
+
+        Args:
+            sql: Query written by the agent
+
+        Returns:
+            Dictionary with the repaired 'sql', the 'fixes' applied and the
+            'error' hint, which is None if the query can be run
+        """
+        repaired, fixes = self.repair(sql)
+        error = self.check(repaired)
+        if fixes:
+            logger.debug(f"Repaired query: {'; '.join(fixes)}")
+        return {'sql': repaired, 'fixes': fixes, 'error': error}
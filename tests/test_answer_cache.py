@@ -0,0 +1,54 @@
+"""
+Near-duplicate matching of the answer cache
+"""
+from types import SimpleNamespace
+
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from answer_cache import AnswerCache
+from fast_path import FastPathPlanner
+from indicator_search import IndicatorSearch
+
+
+CATALOG = {
+    'countries': [('usa', 'United States'), ('gbr', 'United Kingdom'), ('ind', 'India')],
+    'values': {},
+    'years': ['2019', '2020'],
+}
+
+
+@pytest.fixture
+def cache():
+    """Answer cache wired like QueryPipeline.from_components(), over an indicator-name vocabulary"""
+    names = ["GDP growth (annual %)", "Access to electricity"]
+    # Built from a vocabulary, as IndicatorSearch loads its index
+    vectorizer = TfidfVectorizer(vocabulary=TfidfVectorizer().fit(names).vocabulary_).fit(names)
+    search = SimpleNamespace(vectorizer=vectorizer)
+    planner = FastPathPlanner(CATALOG)
+    answer_cache = AnswerCache(
+        ':memory:', version_fn=lambda: 'v1',
+        vectorize=vectorizer.transform,
+        entities=lambda question: planner.entities(
+            question, lambda text: IndicatorSearch.unknown_terms(search, text)
+        ),
+        similarity_threshold=0.9
+    )
+    yield answer_cache
+    answer_cache.close()
+
+
+def test_country_code_is_kept_when_the_question_is_stored(cache):
+    cache.put("What was GDP growth in the USA in 2020?", 'NY.GDP', 'usa answer')
+    
+    hit = cache.get("GDP growth in the USA in 2020, what was it?", 'NY.GDP')
+    
+    assert hit is not None and hit['answer'] == 'usa answer'
+    assert hit['match'] == 'similar'
+
+
+def test_unrecognized_place_does_not_match_another_place(cache):
+    cache.put("What was GDP growth in the USA in 2020?", 'NY.GDP', 'usa answer')
+    cache.put("What was GDP growth in Britain in 2020?", 'NY.GDP', 'britain answer')
+    
+    assert cache.get("What was GDP growth in the UK in 2020?", 'NY.GDP') is None
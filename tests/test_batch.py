@@ -0,0 +1,24 @@
+"""
+Loading of batch query files
+"""
+import logging
+
+from batch import load_queries
+
+
+def test_bad_jsonl_lines_are_skipped(tmp_path, caplog):
+    path = tmp_path / 'queries.jsonl'
+    path.write_text(
+        '{"id": "a", "query": "GDP of France"}\n'
+        '{"id": "b", "question": "GDP of Spain"}\n'
+        '{"id": "c", "query": \n'
+        '\n'
+        'Population of India\n'
+    )
+    
+    with caplog.at_level(logging.WARNING, logger='batch'):
+        queries = load_queries(str(path))
+    
+    assert queries == [{'id': 'a', 'query': 'GDP of France'}, {'id': '5', 'query': 'Population of India'}]
+    assert f"{path}:2:" in caplog.text
+    assert f"{path}:3:" in caplog.text
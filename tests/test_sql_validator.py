@@ -0,0 +1,49 @@
+"""
+Numeric repairs of the SQL validator
+"""
+import sqlite3
+
+import pytest
+
+from database import CachedSQLDatabase
+from schema_catalog import TABLE_NAME
+from sql_validator import SQLValidator
+
+
+@pytest.fixture
+def validator(tmp_path):
+    """Validator over an Information table with TEXT year and value columns and no numeric copies"""
+    path = str(tmp_path / 'world_bank.db')
+    conn = sqlite3.connect(path)
+    conn.execute(f"CREATE TABLE {TABLE_NAME} (indicator_id TEXT, country_name TEXT, year TEXT, value TEXT)")
+    conn.executemany(
+        f"INSERT INTO {TABLE_NAME} VALUES (?, ?, ?, ?)",
+        [('NY.GDP', 'india', '999', '1.5'), ('NY.GDP', 'india', '2019', '12'), ('NY.GDP', 'india', '2020', '9')]
+    )
+    conn.commit()
+    conn.close()
+    db = CachedSQLDatabase.from_path(path)
+    # Wired like WorldBankAgent does, so fetch_table() repairs queries too
+    db.validator = SQLValidator(db, {'countries': [], 'values': {}})
+    return db.validator
+
+
+@pytest.mark.parametrize('condition', ["year > 2018", "year > '2018'"])
+def test_year_range_is_compared_as_a_number(validator, condition):
+    repaired, fixes = validator.repair(f"SELECT year FROM {TABLE_NAME} WHERE {condition}")
+    
+    assert "CAST(year AS INTEGER) > 2018" in repaired
+    assert fixes
+    assert validator.check(repaired) is None
+    rows = validator.db.fetch_table(f"SELECT year FROM {TABLE_NAME} WHERE {condition}")
+    assert sorted(row['year'] for row in rows) == ['2019', '2020']
+
+
+def test_order_by_value_is_left_alone_in_a_compound_select(validator):
+    sql = (f"SELECT country_name, value FROM {TABLE_NAME} WHERE year = 2019 "
+           f"UNION SELECT country_name, value FROM {TABLE_NAME} WHERE year = 2020 ORDER BY value DESC")
+    
+    repaired, _ = validator.repair(sql)
+    
+    assert "ORDER BY value DESC" in repaired
+    assert validator.check(repaired) is None
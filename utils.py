@@ -1,41 +1,103 @@
 """
-Utility functions for SSL, NLTK downloads, and database operations
+Utility functions for sentence splitting and file handling
 """
-import nltk
-import ssl
-import sqlite3
-import pandas as pd
+import logging
+import os
+import re
+import shutil
+from typing import List
+from config import Config
 
 
-def setup_nltk():
-    """Configure SSL and download required NLTK data"""
-    try:
-        _create_unverified_https_context = ssl._create_unverified_context
-    except AttributeError:
-        pass
-    else:
-        ssl._create_default_https_context = _create_unverified_https_context
+logger = logging.getLogger(__name__)
+
+# Words that end in a period without ending the sentence
+ABBREVIATIONS = frozenset({
+    'e.g', 'i.e', 'etc', 'vs', 'approx', 'incl', 'excl', 'est', 'avg', 'no',
+    'mr', 'mrs', 'ms', 'dr', 'st', 'u.s', 'u.k', 'u.n', 'u.a.e',
+})
+
+# Sentence-ending punctuation, optionally followed by closing quotes or brackets
+_SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s+")
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split text into sentences without any model or data download
+    
+    A sentence ends at '.', '!' or '?' followed by whitespace, unless the
+    next sentence would start in lowercase or the period closes an
+    abbreviation or a single-letter initial.
     
-    # Download required NLTK data
-    nltk.download('punkt', quiet=True)
-    nltk.download('punkt_tab', quiet=True)
+    Args:
+        text: Text to split
+    
+    Returns:
+        List of stripped, non-empty sentences
+    """
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        end = match.end()
+        if end < len(text) and text[end].islower():
+            continue
+        if text[match.start()] == '.':
+            words = text[start:match.start()].split()
+            word = words[-1].lstrip('("\'[').lower() if words else ''
+            if word in ABBREVIATIONS or (len(word) == 1 and word.isalpha()):
+                continue
+        sentence = text[start:end].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = end
+    
+    rest = text[start:].strip()
+    if rest:
+        sentences.append(rest)
+    return sentences
 
 
-def load_indicator_data(db_path: str, table_name: str = 'Indicator') -> pd.DataFrame:
+def replace_directory(src_dir: str, dst_dir: str):
     """
-    Load indicator data from SQLite database
+    Move a freshly written directory into place, replacing any previous version
     
     Args:
-        db_path: Path to SQLite database
-        table_name: Name of the table to query
-        
+        src_dir: Fully written temporary directory
+        dst_dir: Final directory path
+    """
+    old_dir = f"{dst_dir}.old-{os.getpid()}"
+    if os.path.exists(dst_dir):
+        os.replace(dst_dir, old_dir)
+    os.replace(src_dir, dst_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def file_fingerprint(path: str):
+    """
+    Cheap fingerprint of a file used to detect changes
+    
+    Args:
+        path: Path to the file
+    
     Returns:
-        DataFrame containing indicator data
+        Tuple of (mtime in ns, size), or None if the file does not exist
     """
-    conn = sqlite3.connect(db_path)
     try:
-        query = f"SELECT * FROM {table_name};"
-        df = pd.read_sql(query, conn)
-        return df
-    finally:
-        conn.close()
\ No newline at end of file
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def data_files_fingerprint() -> tuple:
+    """
+    Fingerprint of the data files answers are derived from
+    
+    Returns:
+        Tuple of fingerprints for the database, its WAL and the few-shot file
+    """
+    return (
+        file_fingerprint(Config.DATABASE_PATH),
+        file_fingerprint(Config.DATABASE_PATH + '-wal'),
+        file_fingerprint(Config.FEW_SHOTS_JSON_PATH),
+    )
@@ -0,0 +1,314 @@
+"""
+Pre-fork worker processes sharing the read-only retrieval indexes
+"""
+import gc
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, Optional
+from config import Config
+from llm_scheduler import scheduler
+from pipeline import QueryPipeline
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+    from agent import WorldBankAgent
+    from few_shot_selector import FewShotSelector
+    from indicator_search import IndicatorSearch
+
+
+logger = logging.getLogger(__name__)
+
+# Memory fields of /proc/<pid>/smaps_rollup, in kB
+SMAPS_FIELDS = ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty', 'Shared_Clean', 'Shared_Dirty')
+
+# Components built by the parent before forking and inherited by every worker
+_shared = {}
+
+
+def process_memory(pid: int = None) -> Optional[Dict[str, int]]:
+    """
+    Memory of a process in bytes
+    
+    RSS counts a shared page in full in every process mapping it; PSS
+    splits it between them and USS counts private pages only, so the sum of
+    the workers' PSS is the memory the pool really uses.
+    
+    Args:
+        pid: Process id, defaults to the current process
+    
+    Returns:
+        Dictionary with 'rss', 'pss', 'uss' and 'shared' bytes, or None
+        where /proc/<pid>/smaps_rollup is not available
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/smaps_rollup", 'r') as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    
+    fields = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].rstrip(':') in SMAPS_FIELDS:
+            fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+        'shared': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+    }
+
+
+def _own_embeddings(embeddings: "Embeddings") -> "Embeddings":
+    """A new OpenAI embeddings client for a worker; other embedders hold no connections and are kept"""
+    from langchain_openai import OpenAIEmbeddings
+    
+    if isinstance(embeddings, OpenAIEmbeddings):
+        return OpenAIEmbeddings(api_key=Config.OPENAI_API_KEY, model=embeddings.model, max_retries=0)
+    return embeddings
+
+
+def _build_worker_pipeline() -> QueryPipeline:
+    """
+    Build a worker's pipeline around the indexes inherited from the parent
+    
+    The worker drops the parent's pooled database connections and gets its
+    own agent (database connections and LLM client), embeddings client and
+    answer cache connection; the indexes are used as inherited. Its LLM
+    scheduler gets an equal share of the configured rate limits.
+    """
+    from database import dispose_engines
+    
+    dispose_engines()
+    scheduler.set_share(1 / _shared['workers'])
+    indicator_search = _shared['indicator_search'] or _shared['indicator_search_factory']()
+    few_shot_selector = _shared['few_shot_selector'] or _shared['few_shot_selector_factory']()
+    embeddings_factory = _shared['embeddings_factory']
+    few_shot_selector.use_embeddings(
+        embeddings_factory() if embeddings_factory else _own_embeddings(few_shot_selector.embeddings)
+    )
+    agent = _shared['agent_factory']()
+    return QueryPipeline.from_components(indicator_search, few_shot_selector, agent)
+
+
+def _worker_main(tasks, results, threads: int):
+    """Entry point of a worker process: answer items from the task queue until a stop marker arrives"""
+    pid = os.getpid()
+    try:
+        pipeline = _build_worker_pipeline()
+    except Exception as e:
+        logger.exception("Worker start-up failed")
+        results.put({'worker': pid, 'startup_error': str(e)})
+        return
+    results.put({'worker': pid, 'ready': True})
+    
+    handler = _shared['handler']
+    
+    def serve():
+        while True:
+            item = tasks.get()
+            if item is None:
+                return
+            try:
+                result = handler(pipeline, item)
+            except Exception as e:
+                result = {'error': str(e)}
+            results.put({'worker': pid, 'result': result})
+    
+    servers = [threading.Thread(target=serve, name=f"worker-{pid}-{i}") for i in range(threads)]
+    for server in servers:
+        server.start()
+    for server in servers:
+        server.join()
+
+
+def run_details(pipeline: QueryPipeline, query: str) -> Dict:
+    """Default handler: the pipeline's detailed answer to a query"""
+    return pipeline.run_with_details(query)
+
+
+class WorkerPool:
+    """
+    Pre-fork pool of worker processes answering queries with shared indexes
+    
+    The parent loads the indicator index and the few-shot index once and
+    freezes its heap before forking, so the workers share those pages
+    copy-on-write (the TF-IDF arrays are memory-mapped from their npy
+    files and are shared through the page cache as well). Each worker
+    then builds only what must not be shared: its database connections,
+    LLM and embedding clients and answer cache connection.
+    """
+    
+    def __init__(self, workers: int = None, threads: int = None,
+                 handler: Callable[[QueryPipeline, Any], Dict] = None,
+                 agent_factory: Callable[[], "WorldBankAgent"] = None,
+                 embeddings_factory: Callable[[], "Embeddings"] = None,
+                 indicator_search_factory: Callable[[], "IndicatorSearch"] = None,
+                 few_shot_selector_factory: Callable[[], "FewShotSelector"] = None,
+                 preload: bool = True):
+        """
+        Configure the pool; workers are started by start() or the with statement
+        
+        Args:
+            workers: Number of worker processes, defaults to Config.WORKER_PROCESSES
+            threads: Items each worker answers at once, defaults to Config.WORKER_THREADS
+            handler: Called in a worker as handler(pipeline, item) for every
+                item, returning a picklable result; defaults to run_details()
+            agent_factory: Creates a worker's agent, defaults to the agent from Config
+            embeddings_factory: Creates a worker's embeddings client for the
+                few-shot index, defaults to a new client of the parent's model
+            indicator_search_factory: Loads the indicator search, defaults to the one from Config
+            few_shot_selector_factory: Loads the few-shot selector, defaults to the one from Config
+            preload: Load the indexes in the parent and share them; if False
+                every worker loads its own, as independent processes would
+        """
+        self.workers = workers or Config.WORKER_PROCESSES
+        self.threads = threads or Config.WORKER_THREADS
+        self.handler = handler or run_details
+        self.agent_factory = agent_factory or QueryPipeline._build_agent
+        self.embeddings_factory = embeddings_factory
+        self.indicator_search_factory = indicator_search_factory or QueryPipeline._build_indicator_search
+        self.few_shot_selector_factory = few_shot_selector_factory or QueryPipeline._build_few_shot_selector
+        self.preload = preload
+        self.completed = Counter()
+        self._processes = []
+        self._tasks = None
+        self._results = None
+    
+    def start(self):
+        """
+        Load the shared indexes and fork the workers
+        
+        Raises:
+            RuntimeError: If a worker fails to start
+        """
+        # Imported once here rather than in every worker
+        from agent import WorldBankAgent  # noqa: F401
+        
+        _shared.update({
+            'indicator_search': self.indicator_search_factory() if self.preload else None,
+            'few_shot_selector': self.few_shot_selector_factory() if self.preload else None,
+            'indicator_search_factory': self.indicator_search_factory,
+            'few_shot_selector_factory': self.few_shot_selector_factory,
+            'agent_factory': self.agent_factory,
+            'embeddings_factory': self.embeddings_factory,
+            'handler': self.handler,
+            'workers': self.workers,
+        })
+        
+        # Move everything allocated so far out of the collector's reach, so
+        # garbage collection in the workers does not copy the shared pages
+        gc.collect()
+        gc.freeze()
+        
+        context = multiprocessing.get_context('fork')
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(target=_worker_main, args=(self._tasks, self._results, self.threads),
+                            name=f"query-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for process in self._processes:
+            process.start()
+        
+        errors = []
+        for _ in self._processes:
+            message = self._next_message()
+            if 'startup_error' in message:
+                errors.append(message['startup_error'])
+        if errors:
+            self.close()
+            raise RuntimeError(f"{len(errors)} worker(s) failed to start: {errors[0]}")
+        logger.info(f"Started {self.workers} workers with {self.threads} thread(s) each "
+                    f"({'shared' if self.preload else 'separate'} indexes)")
+    
+    def _next_message(self) -> Dict:
+        """Wait for the next worker message, failing if a worker died"""
+        while True:
+            try:
+                return self._results.get(timeout=1)
+            except queue.Empty:
+                dead = [p for p in self._processes if not p.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Worker {dead[0].pid} exited with code {dead[0].exitcode}")
+    
+    def map(self, items: Iterable) -> Iterator[Dict]:
+        """
+        Answer items in the workers
+        
+        Args:
+            items: Items passed to the handler, e.g. queries
+        
+        Yields:
+            Handler results in completion order, each with the 'worker' pid added
+        """
+        count = 0
+        for item in items:
+            self._tasks.put(item)
+            count += 1
+        for _ in range(count):
+            message = self._next_message()
+            self.completed[message['worker']] += 1
+            yield {**message['result'], 'worker': message['worker']}
+    
+    def memory(self) -> Dict[int, Optional[Dict[str, int]]]:
+        """
+        Current memory of every worker
+        
+        Returns:
+            Dictionary of worker pid to process_memory() of that worker
+        """
+        return {process.pid: process_memory(process.pid) for process in self._processes}
+    
+    def report(self, elapsed: float) -> Dict[int, Dict]:
+        """
+        Throughput and memory of every worker
+        
+        Args:
+            elapsed: Seconds the measured map() calls took
+        
+        Returns:
+            Dictionary of worker pid to its 'queries', 'queries_per_s' and
+            memory (see process_memory())
+        """
+        return {
+            pid: {
+                'queries': self.completed[pid],
+                'queries_per_s': self.completed[pid] / elapsed if elapsed else 0.0,
+                **(memory or {}),
+            }
+            for pid, memory in self.memory().items()
+        }
+    
+    def close(self, timeout: float = 10):
+        """
+        Stop the workers once they finished their current items
+        
+        Args:
+            timeout: Seconds to wait for each worker before terminating it
+        """
+        if self._tasks is not None:
+            for _ in range(self.workers * self.threads):
+                self._tasks.put(None)
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._processes = []
+        _shared.clear()
+        gc.unfreeze()
+    
+    def __enter__(self) -> "WorkerPool":
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()